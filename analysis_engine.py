@@ -0,0 +1,319 @@
+import time
+from instrumentation import count, instruments, stage
+
+
+class PacketRecord:
+    """
+    Backend-neutral view of a single captured packet.
+
+    Only the fields used by the metric collectors are extracted, so every
+    packet is dissected once and each collector reads plain Python values
+    instead of walking pyshark layers again.
+    """
+
+    __slots__ = (
+        "timestamp", "length", "protocol", "layers", "src", "dst", "sport", "dport",
+        "tcp_seq", "tcp_ack", "tcp_flags", "tcp_window", "tcp_len",
+        "tcp_retransmission", "tcp_ack_rtt", "tcp_out_of_order", "tcp_zero_window",
+        "tcp_bytes_in_flight",
+        "icmp_type", "icmp_id", "icmp_seq",
+    )
+
+    def __init__(self, timestamp, length, protocol=None, layers=(), src=None, dst=None,
+                 sport=None, dport=None, tcp_seq=None, tcp_ack=None, tcp_flags=0,
+                 tcp_window=None, tcp_len=0, tcp_retransmission=False, tcp_ack_rtt=None,
+                 tcp_out_of_order=False, tcp_zero_window=False, tcp_bytes_in_flight=None,
+                 icmp_type=None, icmp_id=None, icmp_seq=None):
+        self.timestamp = timestamp              # Epoch seconds (float)
+        self.length = length                    # Frame length in bytes
+        self.protocol = protocol                # Transport layer ("TCP", "UDP") or None
+        self.layers = layers                    # Lower-case layer names, e.g. ("ip", "tcp")
+        self.src = src
+        self.dst = dst
+        self.sport = sport
+        self.dport = dport
+        self.tcp_seq = tcp_seq                  # Raw (absolute) sequence number
+        self.tcp_ack = tcp_ack                  # Raw (absolute) acknowledgment number
+        self.tcp_flags = tcp_flags
+        self.tcp_window = tcp_window
+        self.tcp_len = tcp_len                  # TCP payload length
+        self.tcp_retransmission = tcp_retransmission
+        self.tcp_ack_rtt = tcp_ack_rtt          # Seconds, or None when not an RTT sample
+        self.tcp_out_of_order = tcp_out_of_order
+        self.tcp_zero_window = tcp_zero_window
+        self.tcp_bytes_in_flight = tcp_bytes_in_flight  # Unacknowledged bytes after a data segment
+        self.icmp_type = icmp_type
+        self.icmp_id = icmp_id
+        self.icmp_seq = icmp_seq
+
+
+def _int_field(layer, name):
+    value = getattr(layer, name, None)
+    return int(value) if value is not None else None
+
+
+def record_from_pyshark(packet):
+    """
+    Convert a pyshark packet into a PacketRecord.
+
+    Args:
+        packet (pyshark.packet.packet.Packet): Packet yielded by pyshark.FileCapture.
+
+    Returns:
+        PacketRecord: The extracted packet fields.
+    """
+    layers = tuple(layer.layer_name for layer in packet.layers)
+    record = PacketRecord(
+        timestamp=float(packet.sniff_timestamp),
+        length=int(packet.length),
+        protocol=packet.transport_layer,
+        layers=layers,
+    )
+
+    if "ip" in layers:
+        record.src = packet.ip.src
+        record.dst = packet.ip.dst
+
+    transport = packet[record.protocol] if record.protocol else None
+    if transport is not None:
+        record.sport = _int_field(transport, "srcport")
+        record.dport = _int_field(transport, "dstport")
+
+    if "tcp" in layers:
+        tcp_layer = packet.tcp
+        record.tcp_seq = _int_field(tcp_layer, "seq_raw")
+        record.tcp_ack = _int_field(tcp_layer, "ack_raw")
+        record.tcp_flags = int(tcp_layer.flags, 16)
+        record.tcp_window = _int_field(tcp_layer, "window_size_value")
+        record.tcp_len = _int_field(tcp_layer, "len") or 0
+        record.tcp_retransmission = hasattr(tcp_layer, "analysis_retransmission")
+        if hasattr(tcp_layer, "analysis_ack_rtt"):
+            record.tcp_ack_rtt = float(tcp_layer.analysis_ack_rtt)
+        record.tcp_out_of_order = hasattr(tcp_layer, "analysis_out_of_order")
+        record.tcp_zero_window = hasattr(tcp_layer, "analysis_zero_window")
+        record.tcp_bytes_in_flight = _int_field(tcp_layer, "analysis_bytes_in_flight")
+
+    if "icmp" in layers:
+        icmp_layer = packet.icmp
+        record.icmp_type = _int_field(icmp_layer, "type")
+        record.icmp_id = _int_field(icmp_layer, "ident")
+        record.icmp_seq = _int_field(icmp_layer, "seq")
+
+    return record
+
+
+class MetricCollector:
+    """
+    Base class for metric collectors fed by run_analysis.
+
+    Subclasses set `protocols` to the lower-case layer names they need
+    (None means every packet) and implement process() and result().
+    Collectors that implement merge() can also run over capture shards in
+    parallel (see parallel_analysis).
+    """
+
+    protocols = None
+
+    def wants(self, record):
+        """
+        Check whether this collector should see the given packet.
+
+        Args:
+            record (PacketRecord): The packet to check.
+
+        Returns:
+            bool: True if the packet carries one of the collector's protocols.
+        """
+        if self.protocols is None:
+            return True
+        return any(p in record.layers for p in self.protocols)
+
+    def process(self, record):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+    def begin_shard(self):
+        """
+        Called before the collector is fed a shard that follows another one.
+
+        Collectors whose state crosses shard boundaries (e.g. ICMP
+        request/reply pairs) can hold back what depends on the previous
+        shard until merge(). Does nothing by default.
+        """
+
+    def merge(self, other):
+        """
+        Fold the partial state of a collector that saw the following shard.
+
+        Args:
+            other (MetricCollector): Collector of the same type fed with later packets.
+        """
+        raise NotImplementedError(f"{type(self).__name__} cannot be merged across shards")
+
+
+class ProtocolCountCollector(MetricCollector):
+    """
+    Count packets per protocol ("TCP", "UDP", "ICMP" or "Other").
+    """
+
+    def __init__(self):
+        self.counts = {}
+
+    def process(self, record):
+        if record.protocol:
+            name = record.protocol
+        elif "icmp" in record.layers:
+            name = "ICMP"
+        else:
+            name = "Other"
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def result(self):
+        return dict(self.counts)
+
+    def merge(self, other):
+        for name, n in other.counts.items():
+            self.counts[name] = self.counts.get(name, 0) + n
+
+
+def build_display_filter(collectors):
+    """
+    Build the tshark display filter covering every collector's protocols.
+
+    Args:
+        collectors (iterable): MetricCollector instances.
+
+    Returns:
+        str or None: The combined filter, or None if any collector needs all packets.
+    """
+    protocols = []
+    for collector in collectors:
+        if collector.protocols is None:
+            return None
+        for protocol in collector.protocols:
+            if protocol not in protocols:
+                protocols.append(protocol)
+    return " or ".join(protocols) if protocols else None
+
+
+def iter_pyshark_records(pcap_file, display_filter=None):
+    """
+    Dissect a capture with pyshark/tshark and yield PacketRecords.
+
+    Args:
+        pcap_file (str): Path to the input .pcapng file.
+        display_filter (str, optional): tshark display filter.
+
+    Yields:
+        PacketRecord: One record per dissected packet.
+    """
+    import pyshark  # Imported here: pyshark pulls in asyncio and lxml, which the native backend never needs
+
+    cap = pyshark.FileCapture(pcap_file, display_filter=display_filter, keep_packets=False)
+    try:
+        for packet in cap:
+            try:
+                yield record_from_pyshark(packet)
+            except AttributeError:
+                continue
+    finally:
+        cap.close()
+
+
+def iter_records(pcap_file, display_filter=None, backend="pyshark"):
+    """
+    Yield PacketRecords from a capture using the selected reader backend.
+
+    Args:
+        pcap_file (str): Path to the input .pcapng file.
+        display_filter (str, optional): tshark display filter (pyshark backend only).
+        backend (str): "pyshark" to dissect with tshark, or "native" to decode
+            pcap/pcapng headers in-process with pcap_io.
+
+    Yields:
+        PacketRecord: One record per packet.
+    """
+    if backend == "pyshark":
+        return iter_pyshark_records(pcap_file, display_filter)
+    if backend == "native":
+        from pcap_io import read_records
+        return read_records(pcap_file)
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def _feed_timed(records, active, backend):
+    # Instrumented copy of run_analysis' loop: splits decoding from collector time
+    decode_seconds = collect_seconds = 0.0
+    decoded = 0
+    clock = time.perf_counter
+    records = iter(records)
+    while True:
+        started = clock()
+        record = next(records, None)
+        decoded_at = clock()
+        decode_seconds += decoded_at - started
+        if record is None:
+            break
+        decoded += 1
+        for collector in active:
+            if collector.wants(record):
+                collector.process(record)
+        collect_seconds += clock() - decoded_at
+
+    stages = instruments.stages
+    for name, seconds in ((f"decode_{backend}", decode_seconds), ("collectors", collect_seconds)):
+        calls, total = stages.get(name, (0, 0.0))
+        stages[name] = (calls + 1, total + seconds)
+    count("packets_decoded", decoded)
+
+
+def run_analysis(pcap_file, collectors, backend="pyshark", workers=1, cache=None):
+    """
+    Read a capture once and feed every packet to the given metric collectors.
+
+    Args:
+        pcap_file (str): Path to the input .pcapng file.
+        collectors (dict): Mapping of result name to MetricCollector.
+        backend (str): Reader backend, "pyshark" or "native".
+        workers (int): Number of worker processes; values above 1 split the
+            capture into shards (native backend only).
+        cache (ResultCache, optional): Reuse results of an earlier identical
+            analysis, and only read the new packets of a grown capture
+            (see result_cache). Cached runs are serial.
+
+    Returns:
+        dict: Mapping of result name to each collector's result, or {} on error.
+    """
+    try:
+        if cache is not None:
+            with stage("result_cache"):
+                return cache.run_analysis(pcap_file, collectors, backend)
+
+        if workers > 1:
+            if backend != "native":
+                raise ValueError("parallel analysis requires the native backend")
+            from parallel_analysis import run_parallel_analysis
+            with stage("parallel_analysis"):
+                return run_parallel_analysis(pcap_file, collectors, workers)
+
+        records = iter_records(pcap_file, build_display_filter(collectors.values()), backend)
+
+        active = list(collectors.values())
+        if instruments.enabled:
+            _feed_timed(records, active, backend)
+        else:
+            for record in records:
+                for collector in active:
+                    if collector.wants(record):
+                        collector.process(record)
+
+        with stage("collector_results"):
+            return {name: collector.result() for name, collector in collectors.items()}
+    except FileNotFoundError:
+        print(f"Error: File {pcap_file} not found.")
+        return {}
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return {}
@@ -0,0 +1,353 @@
+import numpy as np
+
+DEFAULT_THRESHOLD = 3.5  # Score above which a packet is recorded as anomalous
+DEFAULT_ALPHA = 0.01     # EWMA weight of each new sample
+DEFAULT_WARMUP = 50      # Samples a key needs before it is scored
+DEFAULT_WINDOW = 4096    # Recent samples per protocol for the median/MAD baseline
+CHUNK_SIZE = 1024        # Packets scored against the same baseline snapshot
+DEFAULT_VOTES = 2        # Baselines that must exceed the threshold to flag a packet
+
+MAD_SCALE = 0.6745      # Makes the MAD score comparable to a z-score for normal data
+MEAN_AD_SCALE = 0.7979  # Same for the mean absolute deviation, used when the MAD is 0
+MIN_SPREAD = 0.05       # Spread floor as a fraction of the baseline, for (nearly) constant traffic
+TINY_SPREAD = 1e-9      # Spread floor for a baseline of 0
+
+# Baselines that can flag a packet, as stored in anomalies.dimension
+DIMENSIONS = ("protocol", "source", "destination", "protocol_mad")
+
+CREATE_ANOMALY_TABLE = """
+    CREATE TABLE IF NOT EXISTS anomalies (
+        id INTEGER PRIMARY KEY,
+        time REAL NOT NULL,               -- Epoch seconds of the packet
+        protocol INTEGER NOT NULL,
+        length INTEGER NOT NULL,
+        source INTEGER NOT NULL,
+        destination INTEGER NOT NULL,
+        dimension TEXT NOT NULL,          -- Baseline with the highest score (see DIMENSIONS)
+        expected REAL NOT NULL,           -- Baseline length (mean or median)
+        score REAL NOT NULL               -- Signed z-score or MAD score
+    )
+"""
+
+CREATE_ANOMALY_INDEX = "CREATE INDEX IF NOT EXISTS idx_anomalies_time ON anomalies (time)"
+
+INSERT_ANOMALY = """
+    INSERT INTO anomalies (time, protocol, length, source, destination, dimension, expected, score)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def create_anomaly_table(cursor):
+    """
+    Create the anomalies table if it does not exist.
+
+    Args:
+        cursor (sqlite3.Cursor or sqlite3.Connection): Target database.
+    """
+    cursor.execute(CREATE_ANOMALY_TABLE)
+    cursor.execute(CREATE_ANOMALY_INDEX)
+
+
+def spread_floor(expected):
+    """
+    Smallest spread a baseline is scored with.
+
+    Constant traffic (e.g. 42-byte pings) has zero spread; scoring against
+    a small fraction of the baseline instead still flags any real departure
+    from it rather than scoring every packet 0.
+
+    Args:
+        expected (float or numpy.ndarray): Baseline value(s).
+    """
+    return np.maximum(MIN_SPREAD * np.abs(expected), TINY_SPREAD)
+
+
+def robust_spread(values, median):
+    """
+    Standard-deviation estimate of values around their median.
+
+    The scaled MAD, or the scaled mean absolute deviation when more than
+    half the values equal the median, never below spread_floor(median).
+    """
+    deviation = np.abs(values - median)
+    mad = np.median(deviation)
+    spread = mad / MAD_SCALE if mad > 0 else deviation.mean() / MEAN_AD_SCALE
+    return max(spread, spread_floor(median))
+
+
+def robust_scores(values):
+    """
+    Median/MAD (modified z) scores of a batch of values.
+
+    Args:
+        values (array-like): Packet sizes, latencies or any other samples.
+
+    Returns:
+        tuple: (scores array, median); see robust_spread() for the scale.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return values, 0.0
+    median = np.median(values)
+    return (values - median) / robust_spread(values, median), median
+
+
+class KeyedBaseline:
+    """
+    Online mean and variance of a value per key (protocol, source, ...).
+
+    Every key keeps both a Welford running mean/variance over all of its
+    samples and an exponentially weighted mean/variance that follows
+    drift; method selects which one scores. State lives in NumPy arrays
+    indexed by a dense slot per key, so a batch is scored and folded in
+    with a handful of vectorized operations (Chan's parallel update for
+    Welford, a batch-weighted step for the EWMA).
+    """
+
+    def __init__(self, method="ewma", alpha=DEFAULT_ALPHA, warmup=DEFAULT_WARMUP):
+        """
+        Args:
+            method (str): "ewma" (adapts to drift) or "welford" (whole history).
+            alpha (float): EWMA weight of each new sample.
+            warmup (int): Samples a key needs before it is scored.
+        """
+        if method not in ("ewma", "welford"):
+            raise ValueError(f"Unknown baseline method: {method}")
+        self.method = method
+        self.alpha = alpha
+        self.warmup = warmup
+        self.slots = {}
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.ewma = np.zeros(0)
+        self.ewvar = np.zeros(0)
+
+    def lookup(self, keys):
+        """
+        Map keys to state slots, allocating slots for new keys.
+
+        Args:
+            keys (numpy.ndarray): Key of every value.
+
+        Returns:
+            tuple: (slot per value, unique slots, index of each value into the unique slots).
+        """
+        unique, inverse = np.unique(keys, return_inverse=True)
+        slots = self.slots
+        unique_slots = np.fromiter((slots.setdefault(key, len(slots)) for key in unique.tolist()),
+                                   dtype=np.int64, count=len(unique))
+        if len(slots) > len(self.count):
+            grow = max(len(slots), 2 * len(self.count)) - len(self.count)
+            self.count = np.concatenate([self.count, np.zeros(grow, dtype=np.int64)])
+            for name in ("mean", "m2", "ewma", "ewvar"):
+                setattr(self, name, np.concatenate([getattr(self, name), np.zeros(grow)]))
+        inverse = inverse.ravel()
+        return unique_slots[inverse], unique_slots, inverse
+
+    def score(self, slots, values):
+        """
+        z-scores of values against their keys' baselines.
+
+        Args:
+            slots (numpy.ndarray): Slot per value, from lookup().
+            values (numpy.ndarray): Values to score.
+
+        Returns:
+            tuple: (scores, expected values); keys still warming up score 0,
+            and the standard deviation is never below spread_floor().
+        """
+        if self.method == "ewma":
+            expected = self.ewma[slots]
+            variance = self.ewvar[slots]
+        else:
+            expected = self.mean[slots]
+            variance = self.m2[slots] / np.maximum(self.count[slots], 1)
+        scores = np.zeros(len(values))
+        valid = self.count[slots] >= self.warmup
+        spread = np.maximum(np.sqrt(variance[valid]), spread_floor(expected[valid]))
+        scores[valid] = (values[valid] - expected[valid]) / spread
+        return scores, expected
+
+    def update(self, unique_slots, inverse, values):
+        """
+        Fold a batch of values into the baselines.
+
+        Args:
+            unique_slots (numpy.ndarray): Unique slots, from lookup().
+            inverse (numpy.ndarray): Index of each value into unique_slots.
+            values (numpy.ndarray): Values of the batch.
+        """
+        n = np.bincount(inverse, minlength=len(unique_slots))
+        batch_mean = np.bincount(inverse, weights=values, minlength=len(unique_slots)) / n
+        batch_m2 = np.bincount(inverse, weights=(values - batch_mean[inverse]) ** 2, minlength=len(unique_slots))
+
+        seen = self.count[unique_slots]
+        total = seen + n
+        delta = batch_mean - self.mean[unique_slots]
+        self.mean[unique_slots] += delta * n / total
+        self.m2[unique_slots] += batch_m2 + delta ** 2 * seen * n / total
+        self.count[unique_slots] = total
+
+        # A batch of n samples moves the EWMA as far as n single steps would
+        weight = np.where(seen > 0, 1 - (1 - self.alpha) ** n, 1.0)
+        drift = batch_mean - self.ewma[unique_slots]
+        self.ewma[unique_slots] += weight * drift
+        self.ewvar[unique_slots] = (1 - weight) * (self.ewvar[unique_slots] + weight * drift ** 2) + weight * batch_m2 / n
+
+
+class RobustBaseline:
+    """
+    Median/MAD baseline per key over a ring of its most recent values.
+
+    Meant for low-cardinality keys such as the protocol: a burst of
+    outliers cannot drag the median and MAD the way it drags a mean and
+    standard deviation.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, warmup=DEFAULT_WARMUP):
+        """
+        Args:
+            window (int): Recent values kept per key.
+            warmup (int): Values a key needs before it is scored.
+        """
+        self.window = window
+        self.warmup = warmup
+        self.rings = {}  # key -> [values, filled, next position]
+
+    def score(self, keys, values):
+        """
+        MAD scores of values against their keys' recent values.
+
+        Returns:
+            tuple: (scores, medians); keys still warming up score 0 (see
+            robust_spread() for the scale).
+        """
+        scores = np.zeros(len(values))
+        expected = np.zeros(len(values))
+        for key in np.unique(keys).tolist():
+            ring = self.rings.get(key)
+            if ring is None or ring[1] < self.warmup:
+                continue
+            recent = ring[0][:ring[1]]
+            median = np.median(recent)
+            mask = keys == key
+            expected[mask] = median
+            scores[mask] = (values[mask] - median) / robust_spread(recent, median)
+        return scores, expected
+
+    def update(self, keys, values):
+        """
+        Push a batch of values into their keys' rings.
+        """
+        for key in np.unique(keys).tolist():
+            ring = self.rings.get(key)
+            if ring is None:
+                ring = self.rings[key] = [np.zeros(self.window), 0, 0]
+            latest = values[keys == key][-self.window:]
+            positions = (ring[2] + np.arange(len(latest))) % self.window
+            ring[0][positions] = latest
+            ring[1] = min(self.window, ring[1] + len(latest))
+            ring[2] = (ring[2] + len(latest)) % self.window
+
+
+class AnomalyDetector:
+    """
+    Streaming packet-length anomaly detector over traffic_records rows.
+
+    Each packet's length is scored against online baselines of its
+    protocol, source and destination (KeyedBaseline) and a median/MAD
+    baseline of its protocol (RobustBaseline). Packets are scored in
+    chunks of chunk_size against the baselines as they stood before the
+    chunk, then the chunk is folded in, so a whole ingest batch costs a few
+    NumPy passes instead of a Python loop per packet.
+
+    A packet whose absolute score exceeds threshold on at least votes
+    baselines becomes one anomalies row naming the baseline that scored
+    highest. Requiring agreement keeps multi-modal traffic (e.g. TCP data
+    segments mixed with bare ACKs) from flooding the table on a single
+    baseline's say.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, method="ewma", alpha=DEFAULT_ALPHA, warmup=DEFAULT_WARMUP,
+                 window=DEFAULT_WINDOW, chunk_size=CHUNK_SIZE, votes=DEFAULT_VOTES):
+        """
+        Args:
+            threshold (float): Absolute score above which a packet is anomalous.
+            method (str): Keyed baseline method, "ewma" or "welford".
+            alpha (float): EWMA weight of each new sample.
+            warmup (int): Samples a key needs before it is scored.
+            window (int): Recent samples per protocol for the median/MAD baseline.
+            chunk_size (int): Packets scored against the same baseline snapshot.
+            votes (int): Baselines that must exceed the threshold to flag a packet.
+        """
+        self.threshold = threshold
+        self.votes = votes
+        self.chunk_size = chunk_size
+        self.keyed = {name: KeyedBaseline(method, alpha, warmup) for name in DIMENSIONS[:3]}
+        self.robust = RobustBaseline(window, warmup)
+        self.packets = 0
+        self.anomalies = 0
+
+    def process(self, rows):
+        """
+        Score a batch of rows and fold it into the baselines.
+
+        Args:
+            rows (list): (time, protocol, length, source, destination) tuples in the numeric schema.
+
+        Returns:
+            list: anomalies rows ready for INSERT_ANOMALY.
+        """
+        data = np.asarray(rows, dtype=np.float64).reshape(-1, 5)
+        found = []
+        for start in range(0, len(data), self.chunk_size):
+            found += self._process_chunk(data[start:start + self.chunk_size])
+        self.packets += len(data)
+        self.anomalies += len(found)
+        return found
+
+    def _process_chunk(self, data):
+        length = data[:, 2]
+        columns = {"protocol": data[:, 1], "source": data[:, 3], "destination": data[:, 4]}
+        scores = np.empty((len(data), len(DIMENSIONS)))
+        expected = np.empty_like(scores)
+
+        lookups = {}
+        for index, name in enumerate(DIMENSIONS[:3]):
+            baseline = self.keyed[name]
+            lookups[name] = baseline.lookup(columns[name].astype(np.int64))
+            scores[:, index], expected[:, index] = baseline.score(lookups[name][0], length)
+        scores[:, 3], expected[:, 3] = self.robust.score(columns["protocol"], length)
+
+        magnitude = np.abs(scores)
+        best = magnitude.argmax(axis=1)
+        top = scores[np.arange(len(data)), best]
+        flagged = np.flatnonzero((magnitude > self.threshold).sum(axis=1) >= self.votes)
+        found = [
+            (float(data[i, 0]), int(data[i, 1]), int(length[i]), int(data[i, 3]), int(data[i, 4]),
+             DIMENSIONS[best[i]], float(expected[i, best[i]]), float(top[i]))
+            for i in flagged.tolist()
+        ]
+
+        for name in DIMENSIONS[:3]:
+            _, unique_slots, inverse = lookups[name]
+            self.keyed[name].update(unique_slots, inverse, length)
+        self.robust.update(columns["protocol"], length)
+        return found
+
+
+if __name__ == "__main__":
+    # Zero-spread baselines: constant 42-byte traffic must still flag a departure from it
+    pings = np.full(100, 42.0)
+    checks = {
+        "robust_scores, constant batch": not np.abs(robust_scores(pings)[0]).any(),
+        "robust_scores, one outlier": (np.abs(robust_scores(np.append(pings, 1500))[0]) > DEFAULT_THRESHOLD).sum() == 1,
+    }
+    rows = [(i * 0.01, 1, 42, 7, 9) for i in range(3000)] + [(30.0 + i, 1, 1500, 7, 9) for i in range(5)]
+    for method in ("ewma", "welford"):
+        found = AnomalyDetector(method=method).process(rows)
+        checks[f"AnomalyDetector ({method}), constant stream"] = [row[2] for row in found] == [1500] * 5
+    for name, passed in checks.items():
+        print(f"{'ok  ' if passed else 'FAIL'} {name}")
+    raise SystemExit(0 if all(checks.values()) else 1)
@@ -0,0 +1,352 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from evaluate_network import calculate_general_metrics
+from icmp_metrics import analyze_icmp_metrics
+from packet_table import PacketTable
+from pcap_io import read_records
+from query_databse import query_database
+from setup_database import setup_database
+from tcp_metrics import analyze_tcp_metrics
+from traffic_analysis import extract_traffic, store_in_database
+
+DEFAULT_MIX = {"UDP": 0.7, "TCP": 0.2, "ICMP": 0.1}
+
+_ETHERNET = struct.Struct("!6s6sH")
+_IPV4 = struct.Struct("!BBHHHBBH4s4s")
+_UDP = struct.Struct("!HHHH")
+_TCP = struct.Struct("!HHIIBBHHH")
+_ICMP_ECHO = struct.Struct("!BBHHH")
+_EPB = struct.Struct("<IIIIIII")
+
+
+def _checksum(header):
+    total = sum(struct.unpack(f"!{len(header) // 2}H", header))
+    total = (total >> 16) + (total & 0xFFFF)
+    return ~(total + (total >> 16)) & 0xFFFF
+
+
+def _frame(src, dst, proto, transport, payload_len):
+    ip_len = 20 + len(transport) + payload_len
+    header = _IPV4.pack(0x45, 0, ip_len, 0, 0x4000, 64, proto, 0, src, dst)
+    header = header[:10] + struct.pack("!H", _checksum(header)) + header[12:]
+    ethernet = _ETHERNET.pack(b"\x02\x00\x00\x00\x00\x02", b"\x02\x00\x00\x00\x00\x01", 0x0800)
+    return ethernet + header + transport + bytes(payload_len)
+
+
+def synthesize_capture(path, packets=100000, mix=DEFAULT_MIX, flows=64, rate=10000, loss=0.001, seed=0):
+    """
+    Write a synthetic pcapng capture without touching a network interface.
+
+    UDP packets get random payload sizes; TCP flows alternate a data segment
+    with its ACK (occasionally retransmitting a segment); ICMP flows alternate
+    echo requests and replies, so every analysis stage has work to do.
+
+    Args:
+        path (str): Output .pcapng path.
+        packets (int): Number of packets to write.
+        mix (dict): Protocol to share of packets ("UDP", "TCP", "ICMP").
+        flows (int): Concurrent flows per protocol.
+        rate (float): Packets per second of capture time.
+        loss (float): Probability that a TCP segment is sent twice.
+        seed (int): Random seed; the same arguments always produce the same file.
+
+    Returns:
+        dict: Packets written per protocol.
+    """
+    rng = random.Random(seed)
+    protocols, weights = zip(*mix.items())
+    client = [socket.inet_aton(f"10.1.{i // 250}.{i % 250 + 1}") for i in range(flows)]
+    server = [socket.inet_aton(f"10.2.{i // 250}.{i % 250 + 1}") for i in range(flows)]
+    tcp_state = [[rng.getrandbits(32), rng.getrandbits(32), None] for _ in range(flows)]  # seq, ack, unacked segment
+    icmp_waiting = [None] * flows
+    counts = dict.fromkeys(protocols, 0)
+
+    timestamp = int(time.time()) * 1_000_000
+    step = 1_000_000 / rate
+    with open(path, "wb") as f:
+        # Section header and one Ethernet interface with microsecond timestamps
+        f.write(struct.pack("<IIIHHqI", 0x0A0D0D0A, 28, 0x1A2B3C4D, 1, 0, -1, 28))
+        f.write(struct.pack("<IIHHII", 0x00000001, 20, 1, 0, 65535, 20))
+        for index in range(packets):
+            protocol = rng.choices(protocols, weights)[0]
+            flow = rng.randrange(flows)
+            if protocol == "UDP":
+                size = rng.randint(18, 1400)
+                frame = _frame(client[flow], server[flow], 17,
+                               _UDP.pack(20000 + flow, 9000, 8 + size, 0), size)
+            elif protocol == "TCP":
+                state = tcp_state[flow]
+                if state[2] is not None:
+                    state[1] = state[2]
+                    state[2] = None
+                    frame = _frame(server[flow], client[flow], 6,
+                                   _TCP.pack(443, 30000 + flow, 1, state[1], 0x50, 0x10, 65535, 0, 0), 0)
+                else:
+                    size = rng.randint(1, 1400)
+                    if rng.random() < loss:
+                        state[0] = (state[0] - size) & 0xFFFFFFFF
+                    frame = _frame(client[flow], server[flow], 6,
+                                   _TCP.pack(30000 + flow, 443, state[0], state[1], 0x50, 0x18, 65535, 0, 0), size)
+                    state[0] = (state[0] + size) & 0xFFFFFFFF
+                    state[2] = state[0]
+            else:
+                seq = icmp_waiting[flow]
+                if seq is None:
+                    seq = index & 0xFFFF
+                    icmp_waiting[flow] = seq
+                    frame = _frame(client[flow], server[flow], 1, _ICMP_ECHO.pack(8, 0, 0, flow, seq), 56)
+                else:
+                    icmp_waiting[flow] = None
+                    frame = _frame(server[flow], client[flow], 1, _ICMP_ECHO.pack(0, 0, 0, flow, seq), 56)
+            counts[protocol] += 1
+
+            ts = int(timestamp + index * step)
+            padded = len(frame) + (-len(frame) % 4)
+            f.write(_EPB.pack(0x00000006, 32 + padded, 0, ts >> 32, ts & 0xFFFFFFFF, len(frame), len(frame)))
+            f.write(frame + bytes(padded - len(frame)) + struct.pack("<I", 32 + padded))
+    return counts
+
+
+class StageFailed(RuntimeError):
+    """
+    A benchmark stage reported failure (the pipeline functions print errors and return nothing).
+    """
+
+
+def reset_peak_rss():
+    """
+    Reset the kernel's peak RSS counter of this process (Linux 4.0+).
+
+    Returns:
+        bool: Whether peak_rss_mb() now measures from this point on.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process, in megabytes (None if unavailable).
+
+    This is the peak since the last successful reset_peak_rss(), or over the
+    process lifetime otherwise.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def time_stage(results, name, items, func, *args, valid=bool, **kwargs):
+    """
+    Run one stage quietly and record its timing.
+
+    The pipeline functions catch their own errors, print them and return
+    None or an empty result, so a stage whose return value fails `valid`
+    raises StageFailed instead of being recorded as a (fast) timing.
+
+    Args:
+        results (dict): Stage results, updated in place.
+        name (str): Stage name.
+        items (int): Packets or rows the stage handles, for the per-second rate.
+        func (callable): Stage function, called with args and kwargs.
+        valid (callable): Check of the return value; empty or falsy fails by default.
+
+    Returns:
+        The stage function's return value.
+
+    Raises:
+        StageFailed: If the stage's return value fails `valid`.
+    """
+    per_stage = reset_peak_rss()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        started = time.perf_counter()
+        value = func(*args, **kwargs)
+        seconds = time.perf_counter() - started
+    if not valid(value):
+        raise StageFailed(f"Stage {name} failed: {output.getvalue().strip() or 'no result'}")
+    results[name] = {
+        "seconds": round(seconds, 4),
+        "items": items,
+        "items_per_sec": round(items / seconds, 1) if seconds > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_cumulative": not per_stage,  # Process-lifetime peak where it cannot be reset
+    }
+    return value
+
+
+def first_output_seconds(command):
+    """
+    Seconds from launching a command to its first line of output.
+
+    Args:
+        command (list): Command and arguments.
+
+    Returns:
+        float: Time to the first stdout line (or to exit, if it prints nothing).
+
+    Raises:
+        StageFailed: If the command exits with a non-zero status.
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    process.stdout.readline()
+    seconds = time.perf_counter() - started
+    _, errors = process.communicate()
+    if process.returncode != 0:
+        raise StageFailed(f"{' '.join(command)} exited with status {process.returncode}: {errors.strip()}")
+    return seconds
+
+
+def _version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmark(packets=100000, mix=DEFAULT_MIX, backend="native", workers=1, seed=0, workdir=None):
+    """
+    Synthesize a capture and time every analysis and ingestion stage on it.
+
+    Args:
+        packets (int): Packets in the synthetic capture.
+        mix (dict): Protocol to share of packets.
+        backend (str): Reader backend for the analysis stages, "native" or "pyshark".
+        workers (int): Worker processes for sharded analysis (native backend).
+        seed (int): Random seed for the synthetic capture.
+        workdir (str, optional): Directory for the capture, report and databases; a temporary one by default.
+
+    Returns:
+        dict: Environment, configuration and per-stage seconds, items/sec and peak RSS.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = workdir or tmp
+        pcap_file = os.path.join(workdir, "benchmark.pcapng")
+        text_file = os.path.join(workdir, "benchmark_details.txt")
+        binary_file = os.path.join(workdir, "benchmark_details.npy")
+        extract_db = os.path.join(workdir, "benchmark_extract.db")
+        store_db = os.path.join(workdir, "benchmark_store.db")
+        for db_name in (extract_db, store_db):
+            if os.path.exists(db_name):
+                os.remove(db_name)
+            with contextlib.redirect_stdout(io.StringIO()):
+                setup_database(db_name)
+
+        stages = {}
+        counts = time_stage(stages, "synthesize", packets, synthesize_capture, pcap_file, packets, mix, seed=seed)
+        time_stage(stages, "extract_traffic", packets, extract_traffic, pcap_file, text_file, None, None,
+                   backend=backend, workers=workers, db_name=extract_db, binary_file=binary_file)
+        table = PacketTable.from_records(read_records(pcap_file))
+        time_stage(stages, "store_in_database", len(table), store_in_database, table, store_db)
+        time_stage(stages, "query_database", len(table), lambda: [
+            query_database(protocol="UDP", db_name=store_db),
+            query_database(protocol="TCP", min_length=100, db_name=store_db),
+            query_database(min_length=60, max_length=600, mode="rows", db_name=store_db),
+        ], valid=all)
+        cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+        startup = first_output_seconds([sys.executable, cli, "query", "--db", store_db, "--count", "--protocol", "UDP"])
+        stages["cli_query_first_output"] = {"seconds": round(startup, 4), "items": 1,
+                                            "items_per_sec": round(1 / startup, 1), "peak_rss_mb": None,
+                                            "peak_rss_cumulative": False}
+        time_stage(stages, "analyze_tcp_metrics", packets, analyze_tcp_metrics, pcap_file, backend, workers)
+        time_stage(stages, "analyze_icmp_metrics", packets, analyze_icmp_metrics, pcap_file, backend, workers)
+        time_stage(stages, "calculate_general_metrics", counts.get("UDP", 0), calculate_general_metrics,
+                   text_file, counts.get("UDP", 0))
+        time_stage(stages, "calculate_general_metrics_binary", counts.get("UDP", 0), calculate_general_metrics,
+                   binary_file, counts.get("UDP", 0))
+
+    return {
+        "version": _version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "config": {"packets": packets, "mix": mix, "backend": backend, "workers": workers, "seed": seed},
+        "capture_packets": counts,
+        "stages": stages,
+        "total_seconds": round(sum(stage["seconds"] for stage in stages.values()), 4),
+    }
+
+
+def compare_results(baseline, current, tolerance=0.2):
+    """
+    Flag stages that got slower than a baseline run.
+
+    Args:
+        baseline (dict): Earlier run_benchmark result.
+        current (dict): New run_benchmark result.
+        tolerance (float): Allowed relative slowdown (0.2 = 20%).
+
+    Returns:
+        list: (stage, baseline seconds, current seconds) for every regression.
+    """
+    regressions = []
+    for name, stage in current["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if before and stage["seconds"] > before["seconds"] * (1 + tolerance):
+            regressions.append((name, before["seconds"], stage["seconds"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the capture analysis and ingestion pipeline.")
+    parser.add_argument("--packets", type=int, default=100000)
+    parser.add_argument("--mix", default="UDP=0.7,TCP=0.2,ICMP=0.1", help="Protocol shares, e.g. UDP=0.7,TCP=0.3")
+    parser.add_argument("--backend", default="native", choices=("native", "pyshark"))
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results JSON to check for regressions")
+    args = parser.parse_args()
+
+    mix = {name: float(share) for name, share in (item.split("=") for item in args.mix.split(","))}
+    try:
+        results = run_benchmark(args.packets, mix, args.backend, args.workers, args.seed)
+    except StageFailed as e:
+        print(f"Benchmark aborted, no results written: {e}")
+        sys.exit(1)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for name, stage in results["stages"].items():
+        scope = " (process peak so far)" if stage["peak_rss_cumulative"] else ""
+        print(f"{name:28s} {stage['seconds']:9.3f}s {stage['items_per_sec'] or 0:12.0f}/s  "
+              f"peak RSS {stage['peak_rss_mb']} MB{scope}")
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_results(json.load(f), results)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.3f}s -> {after:.3f}s")
+        sys.exit(1 if regressions else 0)
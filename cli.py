@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import sys
+
+DEFAULT_DB = "network_data.db"
+
+# Subcommands import what they need when they run, so `query` never loads
+# NumPy, pyshark, matplotlib, NetworkX or scapy.
+
+
+def run_ingest(args):
+    """
+    Load a capture into traffic_records (creating or migrating the schema first).
+    """
+    from setup_database import setup_database
+    from traffic_analysis import ingest_capture
+
+    setup_database(args.db)
+    stats = ingest_capture(args.pcap_file, args.protocols.split(","), args.backend, args.db,
+                           batch_size=args.batch_size, anomalies=not args.no_anomalies)
+    return 0 if stats else 1
+
+
+def run_query(args):
+    """
+    Count or print traffic_records rows matching the filters.
+    """
+    from query_databse import explain_query, query_database
+
+    filters = {"start_time": args.start, "end_time": args.end, "source": args.source,
+               "destination": args.destination}
+    if args.explain:
+        for detail in explain_query(args.protocol, args.min_length, args.max_length, args.db, **filters):
+            print(detail)
+        return 0
+    if args.count:
+        query_database(args.protocol, args.min_length, args.max_length, "count", args.db, **filters)
+        return 0
+    for number, row in enumerate(query_database(args.protocol, args.min_length, args.max_length, "stream",
+                                                args.db, **filters)):
+        if args.limit is not None and number >= args.limit:
+            break
+        print("\t".join(str(value) for value in row))
+    return 0
+
+
+def run_serve(args):
+    """
+    Serve concurrent traffic queries over localhost HTTP until interrupted.
+    """
+    from query_service import serve
+
+    serve(args.db, args.host, args.port, args.pool_size, args.cache_entries)
+    return 0
+
+
+def run_metrics(args):
+    """
+    Compute TCP, ICMP and (optionally) UDP metrics of a capture, and plot them on request.
+    """
+    from analysis_engine import run_analysis
+    from evaluate_network import (ICMPLatencyCollector, UDPThroughputCollector, figure_path, plot_general_metrics,
+                                  plot_icmp_metrics, plot_tcp_metrics)
+    from icmp_metrics import ICMPMetricsCollector
+    from result_cache import ResultCache
+    from tcp_metrics import TCPMetricsCollector
+
+    collectors = {"tcp": TCPMetricsCollector(), "icmp": ICMPMetricsCollector(), "latency": ICMPLatencyCollector()}
+    if args.sent_packets is not None:
+        collectors["udp"] = UDPThroughputCollector(args.sent_packets)
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+    results = run_analysis(args.pcap_file, collectors, args.backend, args.workers, cache)
+
+    for name in ("udp", "tcp", "icmp"):
+        if name in results:
+            print(f"{name.upper()} metrics:")
+            for key, value in results[name].items():
+                print(f"  {key}: {value}")
+
+    if args.plot or args.output_dir:
+        if args.output_dir:
+            from rendering import headless
+
+            headless()
+            os.makedirs(args.output_dir, exist_ok=True)
+        if "udp" in results:
+            plot_general_metrics(results["udp"], figure_path(args.output_dir, "general_metrics", args.format))
+        plot_tcp_metrics(results.get("tcp", {}), figure_path(args.output_dir, "tcp_metrics", args.format))
+        plot_icmp_metrics(results.get("icmp", {}), figure_path(args.output_dir, "icmp_metrics", args.format))
+    return 0
+
+
+def run_simulate(args):
+    """
+    Build the fabric, rank single failures and optionally replay traffic or render figures.
+    """
+    from network_simulation import FinancialDataCenterNetwork
+
+    if args.output_dir:
+        from rendering import headless
+
+        headless()
+        os.makedirs(args.output_dir, exist_ok=True)
+    network = FinancialDataCenterNetwork()
+    network.build(args.cores, args.departments, args.floors, args.hosts, args.redundancy)
+    print(f"{network.topology.num_nodes} nodes, {network.topology.num_edges} links")
+
+    if args.top:
+        for impact in network.sweep_single_failures(args.workers)[:args.top]:
+            failed = impact["failed_nodes"] or impact["failed_edges"]
+            print(f"{failed}: lost flow {impact['lost_flow']:.2f} ({impact['lost_flow_fraction']:.0%}), "
+                  f"{len(impact['disconnected_hosts'])} hosts disconnected")
+    for node in args.fail or ():
+        with network.paths.scenario(nodes=[node]):
+            print(f"{node}: {network.paths.unreachable_pairs()} host pairs unreachable")
+    if args.traffic_db:
+        report = network.simulate_traffic(args.traffic_db, tick=args.tick)
+        print(f"Replayed {report['ticks']} ticks: {report['delivered_fraction']:.1%} of offered bytes delivered")
+    if args.output_dir:
+        network.visualize(os.path.join(args.output_dir, f"topology.{args.format}"))
+        if args.fail:
+            paths = network.render_failures([([node], []) for node in args.fail],
+                                            os.path.join(args.output_dir, "failures"), args.format, args.workers)
+            print(f"Rendered {len(paths)} failure scenarios")
+    return 0
+
+
+def run_generate(args):
+    """
+    Send synthetic UDP/TCP/ICMP traffic on an interface.
+    """
+    from traffic_generation import generate_traffic
+
+    generate_traffic(args.src_ip, args.dst_ip, args.iface, args.count, args.rate)
+    return 0
+
+
+def build_parser():
+    """
+    Argument parser with one subcommand per task.
+    """
+    parser = argparse.ArgumentParser(description="Network capture analysis and simulation tools.")
+    parser.add_argument("--timings", action="store_true", help="Time the pipeline stages and print a report to stderr")
+    parser.add_argument("--profile", action="store_true", help="Also record the run with cProfile (implies --timings)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also track peak Python memory per stage (implies --timings)")
+    parser.add_argument("--prometheus", metavar="PATH", help="Write the stage timings and counters in Prometheus text "
+                                                             "format to PATH when the command finishes")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="Load a capture into the traffic database")
+    ingest.add_argument("pcap_file")
+    ingest.add_argument("--db", default=DEFAULT_DB)
+    ingest.add_argument("--backend", choices=("native", "pyshark"), default="native")
+    ingest.add_argument("--protocols", default="UDP,TCP,ICMP")
+    ingest.add_argument("--batch-size", type=int, default=10000)
+    ingest.add_argument("--no-anomalies", action="store_true", help="Skip anomaly detection while ingesting")
+    ingest.set_defaults(handler=run_ingest)
+
+    query = commands.add_parser("query", help="Count or list traffic records")
+    query.add_argument("--db", default=DEFAULT_DB)
+    query.add_argument("--protocol")
+    query.add_argument("--min-length", type=int)
+    query.add_argument("--max-length", type=int)
+    query.add_argument("--start", type=float, help="Epoch seconds")
+    query.add_argument("--end", type=float, help="Epoch seconds")
+    query.add_argument("--source")
+    query.add_argument("--destination")
+    query.add_argument("--count", action="store_true", help="Only count the matching records")
+    query.add_argument("--limit", type=int, help="Print at most this many rows")
+    query.add_argument("--explain", action="store_true", help="Show the SQLite query plan")
+    query.set_defaults(handler=run_query)
+
+    service = commands.add_parser("serve", help="Serve traffic queries as JSON over localhost HTTP")
+    service.add_argument("--db", default=DEFAULT_DB)
+    service.add_argument("--host", default="127.0.0.1")
+    service.add_argument("--port", type=int, default=8765)
+    service.add_argument("--pool-size", type=int, default=8, help="Read-only connections")
+    service.add_argument("--cache-entries", type=int, default=1024, help="Query results kept in the cache")
+    service.set_defaults(handler=run_serve)
+
+    metrics = commands.add_parser("metrics", help="Compute TCP/ICMP/UDP metrics of a capture")
+    metrics.add_argument("pcap_file")
+    metrics.add_argument("--backend", choices=("native", "pyshark"), default="native")
+    metrics.add_argument("--workers", type=int, default=1, help="Worker processes (with --no-cache)")
+    metrics.add_argument("--cache-dir", default=".analysis_cache", help="Reuse capture analysis results kept here")
+    metrics.add_argument("--no-cache", action="store_true", help="Analyze the capture from scratch")
+    metrics.add_argument("--sent-packets", type=int, help="Packets sent, to report UDP throughput and loss")
+    metrics.add_argument("--plot", action="store_true", help="Show the plots")
+    metrics.add_argument("--output-dir", help="Write the plots here (headless) instead of showing them")
+    metrics.add_argument("--format", choices=("png", "svg"), default="png")
+    metrics.set_defaults(handler=run_metrics)
+
+    simulate = commands.add_parser("simulate", help="Build the fabric and analyze failures")
+    simulate.add_argument("--cores", type=int, default=2)
+    simulate.add_argument("--departments", type=int, default=3)
+    simulate.add_argument("--floors", type=int, default=5)
+    simulate.add_argument("--hosts", type=int, default=3)
+    simulate.add_argument("--redundancy", type=int, default=1)
+    simulate.add_argument("--top", type=int, default=5, help="Worst single failures to list (0 skips the sweep and its NetworkX conversion)")
+    simulate.add_argument("--fail", action="append", help="Node to fail (repeatable)")
+    simulate.add_argument("--workers", type=int)
+    simulate.add_argument("--traffic-db", help="Replay traffic_records from this database onto the fabric")
+    simulate.add_argument("--tick", type=float, default=1.0)
+    simulate.add_argument("--output-dir", help="Write the drawings here (headless)")
+    simulate.add_argument("--format", choices=("png", "svg"), default="png")
+    simulate.set_defaults(handler=run_simulate)
+
+    generate = commands.add_parser("generate", help="Send synthetic traffic on an interface")
+    generate.add_argument("src_ip")
+    generate.add_argument("dst_ip")
+    generate.add_argument("iface")
+    generate.add_argument("--count", type=int, default=5000)
+    generate.add_argument("--rate", type=float, help="Packets per second (default: as fast as possible)")
+    generate.set_defaults(handler=run_generate)
+    return parser
+
+
+def main(argv=None):
+    """
+    Parse arguments and run the chosen subcommand.
+
+    Returns:
+        int: Process exit status.
+    """
+    args = build_parser().parse_args(argv)
+    if not (args.timings or args.profile or args.trace_memory or args.prometheus):
+        return args.handler(args)
+
+    from instrumentation import instruments
+
+    instruments.enable(profile=args.profile, trace_memory=args.trace_memory)
+    try:
+        return args.handler(args)
+    finally:
+        instruments.disable()
+        if args.prometheus:
+            instruments.write_prometheus(args.prometheus)
+        if args.timings or args.profile or args.trace_memory:
+            report = instruments.report()
+            profile = report.pop("profile", None)
+            print(json.dumps(report, indent=2), file=sys.stderr)
+            if profile:
+                print(profile, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
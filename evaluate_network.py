@@ -1,16 +1,28 @@
+import argparse
 import datetime
-import matplotlib.pyplot as plt
-import pyshark
-from tcp_metrics import analyze_tcp_metrics
-from icmp_metrics import analyze_icmp_metrics
-
-def plot_tcp_metrics(metrics):
+import os
+import numpy as np
+from analysis_engine import MetricCollector, ProtocolCountCollector, run_analysis
+from instrumentation import timed
+from packet_table import PROTO_UDP, PacketTable
+from tcp_metrics import LiveTCPMetricsCollector, TCPMetricsCollector
+from icmp_metrics import DEFAULT_TIMEOUT, ICMPMatcher, ICMPMetricsCollector, LiveICMPMetricsCollector
+from live_metrics import DEFAULT_WINDOWS, WindowedCollector, monitor_capture
+from rendering import finish, headless
+from result_cache import DEFAULT_CACHE_DIR, ResultCache
+from sketches import DDSketch
+
+@timed("matplotlib")
+def plot_tcp_metrics(metrics, output=None):
     """
     Visualize TCP metrics such as retransmissions and RTT.
 
     Args:
         metrics (dict): TCP metrics including retransmissions and RTT.
+        output (str, optional): PNG/SVG path to write instead of showing the figure.
     """
+    import matplotlib.pyplot as plt
+
     labels = ["Retransmissions", "Average RTT (ms)"]
     values = [metrics["retransmissions"], metrics["average_rtt"]]
 
@@ -32,15 +44,19 @@ def plot_tcp_metrics(metrics):
 
     # Adjust layout
     plt.tight_layout()
-    plt.show()
+    return finish(fig, output)
     
-def plot_icmp_metrics(metrics):
+@timed("matplotlib")
+def plot_icmp_metrics(metrics, output=None):
     """
     Visualize ICMP metrics such as latency count and loss rate.
 
     Args:
         metrics (dict): ICMP metrics including average latency and loss rate.
+        output (str, optional): PNG/SVG path to write instead of showing the figure.
     """
+    import matplotlib.pyplot as plt
+
     labels = ["Latency Count (ms)", "Loss Rate (%)"]
     values = [metrics.get("latency_count", 0), metrics.get("loss_rate", 0)]
 
@@ -62,20 +78,31 @@ def plot_icmp_metrics(metrics):
 
     # Adjust layout
     plt.tight_layout()
-    plt.show()
+    return finish(fig, output)
 
 
+@timed("calculate_general_metrics")
 def calculate_general_metrics(file_name, sent_packets):
     """
     Calculate throughput, packet loss, duration, and average packet size from a filtered UDP traffic file.
 
     Args:
-        file_name (str): Path to the filtered UDP traffic file.
+        file_name (str): Path to the filtered UDP traffic file: the text report,
+            or a binary .npy packet table, which is memory-mapped and filtered
+            without parsing (see extract_traffic's binary_file).
         sent_packets (int): Number of packets sent.
 
     Returns:
         dict: Calculated metrics (throughput, packet loss, duration, average packet size).
     """
+    if file_name.endswith(".npy"):
+        table = PacketTable.load(file_name)
+        udp = table.protocol == PROTO_UDP
+        timestamps = table.timestamp[udp]
+        duration = float(timestamps[-1] - timestamps[0]) if len(timestamps) > 1 else 0
+        return summarize_udp_metrics(int(udp.sum()), int(table.length[udp].sum(dtype=np.int64)),
+                                     duration, sent_packets)
+
     captured_packets = 0
     total_bytes = 0
     timestamps = []
@@ -96,6 +123,21 @@ def calculate_general_metrics(file_name, sent_packets):
                     print(f"Invalid timestamp format: {time_str}")
 
     duration = (timestamps[-1] - timestamps[0]).total_seconds() if len(timestamps) > 1 else 0
+    return summarize_udp_metrics(captured_packets, total_bytes, duration, sent_packets)
+
+def summarize_udp_metrics(captured_packets, total_bytes, duration, sent_packets):
+    """
+    Turn raw UDP counters into the general metrics dictionary.
+
+    Args:
+        captured_packets (int): Number of UDP packets captured.
+        total_bytes (int): Total UDP bytes captured.
+        duration (float): Seconds between the first and last UDP packet.
+        sent_packets (int): Number of packets sent.
+
+    Returns:
+        dict: Calculated metrics (throughput, packet loss, duration, average packet size).
+    """
     throughput = (total_bytes * 8) / (duration * 10**6) if duration > 0 else 0
     packet_loss = max(0, ((sent_packets - captured_packets) / sent_packets) * 100)
     avg_packet_size = total_bytes / captured_packets if captured_packets > 0 else 0
@@ -107,56 +149,160 @@ def calculate_general_metrics(file_name, sent_packets):
         "Avg Packet Size (bytes)": round(avg_packet_size, 2),
     }
 
-def calculate_icmp_latency(pcap_file):
+class UDPThroughputCollector(MetricCollector):
+    """
+    Collect UDP throughput, loss and packet size straight from a capture.
+    """
+
+    protocols = ("udp",)
+
+    def __init__(self, sent_packets):
+        self.sent_packets = sent_packets
+        self.captured_packets = 0
+        self.total_bytes = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def process(self, record):
+        if record.protocol != "UDP":
+            return
+        self.captured_packets += 1
+        self.total_bytes += record.length
+        if self.first_timestamp is None:
+            self.first_timestamp = record.timestamp
+        self.last_timestamp = record.timestamp
+
+    def result(self):
+        duration = 0
+        if self.captured_packets > 1:
+            duration = self.last_timestamp - self.first_timestamp
+        return summarize_udp_metrics(self.captured_packets, self.total_bytes, duration, self.sent_packets)
+
+    def merge(self, other):
+        self.captured_packets += other.captured_packets
+        self.total_bytes += other.total_bytes
+        if self.first_timestamp is None:
+            self.first_timestamp = other.first_timestamp
+        if other.last_timestamp is not None:
+            self.last_timestamp = other.last_timestamp
+
+class LiveThroughputCollector(WindowedCollector):
+    """
+    Throughput and packet size over sliding windows, for live monitoring.
+    """
+
+    fields = ("packets", "bytes")
+
+    def __init__(self, windows=DEFAULT_WINDOWS, protocols=None):
+        super().__init__(windows)
+        self.protocols = tuple(p.lower() for p in protocols) if protocols else None
+
+    def process(self, record):
+        self.add(record.timestamp, 1, record.length)
+
+    def summarize(self, totals, span):
+        packets = totals["packets"]
+        return {
+            "Throughput (Mbps)": round(totals["bytes"] * 8 / (span * 10**6), 4),
+            "Packets": packets,
+            "Avg Packet Size (bytes)": round(totals["bytes"] / packets, 2) if packets > 0 else 0,
+        }
+
+class ICMPLatencyCollector(MetricCollector):
+    """
+    Collect ICMP latencies by pairing Echo Requests with Echo Replies.
+
+    Pairing is done by icmp_metrics.ICMPMatcher, which evicts requests left
+    unanswered for `timeout` seconds so memory stays bounded on lossy captures.
+    Every latency also goes into a DDSketch; with keep_samples=False only the
+    sketch is kept, bounding memory, and result() returns the sketch.
+    """
+
+    protocols = ("icmp",)
+
+    def __init__(self, keep_samples=True, timeout=DEFAULT_TIMEOUT):
+        self.matcher = ICMPMatcher(timeout)
+        self.keep_samples = keep_samples
+        self.latencies = []
+        self.sketch = DDSketch()
+
+    def _add_latency(self, latency):
+        self.sketch.add(latency)
+        if self.keep_samples:
+            self.latencies.append(latency)
+
+    def process(self, record):
+        latency = self.matcher.process(record)
+        if latency is not None:
+            self._add_latency(latency)
+
+    def result(self):
+        return self.latencies if self.keep_samples else self.sketch
+
+    def begin_shard(self):
+        self.matcher.follow()
+
+    def merge(self, other):
+        for latency in self.matcher.merge(other.matcher):
+            self._add_latency(latency)
+        self.latencies.extend(other.latencies)
+        self.sketch.merge(other.sketch)
+
+@timed("calculate_icmp_latency")
+def calculate_icmp_latency(pcap_file, backend="pyshark", workers=1, keep_samples=True, timeout=DEFAULT_TIMEOUT, cache=None):
     """
     Calculate ICMP latency by analyzing Echo Request and Echo Reply times.
 
     Args:
         pcap_file (str): Path to the input .pcapng file.
+        backend (str): Reader backend, "pyshark" or "native".
+        workers (int): Worker processes for sharded analysis (native backend).
+        keep_samples (bool): Return every latency; False returns a bounded-memory
+            DDSketch instead (see sketches.DDSketch for its error bounds).
+        timeout (float): Seconds before an unanswered request counts as lost.
+        cache (ResultCache, optional): Result cache (see result_cache).
 
     Returns:
-        list: List of latencies (in milliseconds).
-    """
-    latencies = []
-
-    try:
-        cap = pyshark.FileCapture(pcap_file, display_filter="icmp")
-
-        request_times = {}
-        for packet in cap:
-            try:
-                if hasattr(packet.icmp, "type"):
-                    # Echo Request
-                    if packet.icmp.type == "8":
-                        request_id = packet.icmp.id
-                        request_seq = packet.icmp.seq
-                        request_times[(request_id, request_seq)] = float(packet.sniff_timestamp)
-
-                    # Echo Reply
-                    elif packet.icmp.type == "0":
-                        reply_id = packet.icmp.id
-                        reply_seq = packet.icmp.seq
-                        if (reply_id, reply_seq) in request_times:
-                            latency = (float(packet.sniff_timestamp) - request_times[(reply_id, reply_seq)]) * 1000
-                            latencies.append(latency)
-            except AttributeError:
-                continue
-
-        cap.close()
-    except FileNotFoundError:
-        print(f"Error: File {pcap_file} not found.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
-
-    return latencies
-
-def plot_general_metrics(metrics):
+        list or DDSketch: List of latencies (in milliseconds), or their sketch.
+    """
+    default = [] if keep_samples else DDSketch()
+    collectors = {"latency": ICMPLatencyCollector(keep_samples, timeout)}
+    return run_analysis(pcap_file, collectors, backend, workers, cache).get("latency", default)
+
+def monitor_network(pcap_file, windows=DEFAULT_WINDOWS, interval=1.0, thresholds=None, follow=True, idle_timeout=None):
+    """
+    Continuously report throughput, TCP and ICMP metrics for a live or growing capture.
+
+    Args:
+        pcap_file (str): Path to the capture being written.
+        windows (tuple): Sliding window spans in seconds.
+        interval (float): Seconds of packet time between updates.
+        thresholds (dict, optional): {(name, window, metric): limit} alerts, where
+            name is "throughput", "tcp" or "icmp" (see live_metrics.check_thresholds).
+        follow (bool): Keep reading as the file grows.
+        idle_timeout (float, optional): Stop following after this many idle seconds.
+
+    Returns:
+        dict: The final snapshot.
+    """
+    collectors = {
+        "throughput": LiveThroughputCollector(windows),
+        "tcp": LiveTCPMetricsCollector(windows),
+        "icmp": LiveICMPMetricsCollector(windows),
+    }
+    return monitor_capture(pcap_file, collectors, interval, thresholds, follow=follow, idle_timeout=idle_timeout)
+
+@timed("matplotlib")
+def plot_general_metrics(metrics, output=None):
     """
     Visualize UDP network performance metrics using subplots with fixed y-limits for specific metrics.
 
     Args:
         metrics (dict): Dictionary containing throughput, packet loss, duration, and average packet size.
+        output (str, optional): PNG/SVG path to write instead of showing the figure.
     """
+    import matplotlib.pyplot as plt
+
     metric_names = list(metrics.keys())
     metric_values = list(metrics.values())
 
@@ -180,66 +326,113 @@ def plot_general_metrics(metrics):
         axes[i].text(0, value * 1.05, f"{value}", ha="center", va="bottom", fontsize=10, color="black")
 
     plt.tight_layout()
-    plt.show()
+    return finish(fig, output)
 
-def visualize_packet_distribution(metrics):
+@timed("matplotlib")
+def visualize_packet_distribution(metrics, output=None):
     """
     Visualize packet type distributions.
+
+    Args:
+        metrics (dict): Packet count per protocol.
+        output (str, optional): PNG/SVG path to write instead of showing the figure.
     """
+    import matplotlib.pyplot as plt
+
     labels = list(metrics.keys())
     values = list(metrics.values())
 
-    plt.figure(figsize=(8, 6))
+    fig = plt.figure(figsize=(8, 6))
     plt.bar(labels, values, color='skyblue')
     plt.title("Packet Type Distribution")
     plt.xlabel("Protocol")
     plt.ylabel("Count")
-    plt.show()
+    return finish(fig, output)
 
-def visualize_latency_histogram(latencies):
+@timed("matplotlib")
+def visualize_latency_histogram(latencies, output=None):
     """
     Visualize latency histogram.
+
+    Args:
+        latencies (list or DDSketch): Latency samples (ms) or their sketch.
+        output (str, optional): PNG/SVG path to write instead of showing the figure.
     """
-    plt.figure(figsize=(8, 6))
-    plt.hist(latencies, bins=20, color='lightgreen', edgecolor='black')
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(8, 6))
+    if isinstance(latencies, DDSketch):
+        values, counts = latencies.histogram()
+        plt.hist(values, bins=20, weights=counts, color='lightgreen', edgecolor='black')
+    else:
+        plt.hist(latencies, bins=20, color='lightgreen', edgecolor='black')
     plt.title("Latency Histogram")
     plt.xlabel("Latency (ms)")
     plt.ylabel("Frequency")
-    plt.show()
+    return finish(fig, output)
+
+def figure_path(output_dir, name, fmt):
+    """
+    Path of a named figure in output_dir, or None to show it instead.
+    """
+    return os.path.join(output_dir, f"{name}.{fmt}") if output_dir else None
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute and plot UDP, TCP and ICMP metrics of the generated traffic.")
+    parser.add_argument("--output-dir", help="Write the plots here (headless, Agg backend) instead of showing them")
+    parser.add_argument("--format", choices=("png", "svg"), default="png")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Reuse capture analysis results kept here")
+    parser.add_argument("--no-cache", action="store_true", help="Analyze the capture from scratch")
+    args = parser.parse_args()
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+    if args.output_dir:
+        headless()
+        os.makedirs(args.output_dir, exist_ok=True)
+
     # Updated parameters to align with simplified traffic setup
-    file_name = "financial_traffic_details.txt"
+    pcap_file = "financial_traffics.pcapng"
     sent_packets = 5000  # Number of packets sent in traffic generation
 
-    # Calculate metrics
-    general_metrics = calculate_general_metrics(file_name, sent_packets)
-    
-    # Calculate latencies
-    latencies = calculate_icmp_latency("financial_traffics.pcapng")
-    
+    # Read the capture once for every UDP/TCP/ICMP analysis
+    results = run_analysis(pcap_file, {
+        "udp": UDPThroughputCollector(sent_packets),
+        "protocols": ProtocolCountCollector(),
+        "tcp": TCPMetricsCollector(),
+        "icmp": ICMPMetricsCollector(),
+        "latency": ICMPLatencyCollector(),
+    }, cache=cache)
+    latencies = results.get("latency", [])
+
+    # General (UDP) metrics
+    general_metrics = results.get("udp", summarize_udp_metrics(0, 0, 0, sent_packets))
     print("Calculated General Metrics:")
     for k, v in general_metrics.items():
         print(f"{k}: {v}")
 
     # Plot the metrics
-    plot_general_metrics(general_metrics)
-    
+    plot_general_metrics(general_metrics, figure_path(args.output_dir, "general_metrics", args.format))
+
+    # Packet counts per protocol
+    protocol_counts = results.get("protocols", {})
+    print("Packets per Protocol:")
+    for k, v in protocol_counts.items():
+        print(f"{k}: {v}")
+    visualize_packet_distribution(protocol_counts, figure_path(args.output_dir, "packet_distribution", args.format))
+
     # Analyze TCP metrics
-    tcp_metrics = analyze_tcp_metrics("financial_traffics.pcapng")
+    tcp_metrics = results.get("tcp", {})
     print("Calculated TCP Metrics:")
     for k, v in tcp_metrics.items():
         print(f"{k}: {v}")
 
     # Visualize TCP metrics
-    plot_tcp_metrics(tcp_metrics)
+    plot_tcp_metrics(tcp_metrics, figure_path(args.output_dir, "tcp_metrics", args.format))
 
     # Analyze ICMP metrics
-    icmp_metrics = analyze_icmp_metrics("financial_traffics.pcapng")
+    icmp_metrics = results.get("icmp", {})
     print("Calculated ICMP Metrics:")
     for k, v in icmp_metrics.items():
         print(f"{k}: {v}")
 
     # Visualize ICMP metrics
-    plot_icmp_metrics(icmp_metrics)
-
+    plot_icmp_metrics(icmp_metrics, figure_path(args.output_dir, "icmp_metrics", args.format))
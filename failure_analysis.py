@@ -0,0 +1,179 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+import networkx as nx
+
+SOURCE = "__core__"      # Super source feeding every core node
+ALL_HOSTS = "__hosts__"  # Super sink fed by every host
+
+CHUNKS_PER_WORKER = 4  # Scenario chunks per worker in a sweep, to even out slow scenarios
+
+
+class FailureAnalyzer:
+    """
+    Non-destructive failure-impact analysis of a data center topology.
+
+    The topology is copied once, with a super source above the core nodes
+    and super sinks below all hosts and below each department's hosts.
+    A failure scenario is then evaluated on a restricted view that hides
+    the failed nodes and edges, so the graph is never modified and any
+    number of scenarios can be explored from the same analyzer.
+
+    Each scenario reports the hosts no longer reachable from the core,
+    the core-to-host max-flow over the edges' capacity attributes (in
+    total and per department) against the intact baseline, and the
+    departments that lost hosts or capacity.
+    """
+
+    def __init__(self, network, capacity="capacity", core_layer="Core", host_layer="Host", department="department"):
+        """
+        Args:
+            network (FinancialDataCenterNetwork or nx.DiGraph): Built topology.
+            capacity (str): Edge attribute holding link capacity; edges without it are unbounded.
+            core_layer (str): layer attribute of the core nodes.
+            host_layer (str): layer attribute of the hosts.
+            department (str): Node attribute naming a host's department.
+        """
+        topology = getattr(network, "network", network)
+        self.capacity = capacity
+        self.graph = nx.DiGraph(topology)
+        self.hosts = []
+        self.departments = {}
+        for node, data in topology.nodes(data=True):
+            if data.get("layer") == core_layer:
+                self.graph.add_edge(SOURCE, node)
+            elif data.get("layer") == host_layer:
+                dept = data.get(department)
+                self.hosts.append(node)
+                self.departments.setdefault(dept, []).append(node)
+                self.graph.add_edge(node, ALL_HOSTS)
+                self.graph.add_edge(node, (ALL_HOSTS, dept))
+        self.baseline = self._measure(self.graph)
+
+    def _measure(self, view):
+        reachable = nx.descendants(view, SOURCE)
+        return {
+            "reachable": reachable,
+            "max_flow": nx.maximum_flow_value(view, SOURCE, ALL_HOSTS, capacity=self.capacity),
+            "department_flow": {
+                dept: nx.maximum_flow_value(view, SOURCE, (ALL_HOSTS, dept), capacity=self.capacity)
+                for dept in self.departments
+            },
+        }
+
+    def analyze(self, nodes=(), edges=()):
+        """
+        Evaluate one failure scenario without modifying the topology.
+
+        Args:
+            nodes (iterable): Nodes that fail.
+            edges (iterable): (u, v) edges that fail.
+
+        Returns:
+            dict: failed_nodes, failed_edges, disconnected_hosts (failed
+            hosts included), max_flow, lost_flow, lost_flow_fraction,
+            department_flow, lost_department_flow and affected_departments.
+        """
+        nodes, edges = list(nodes), [tuple(edge) for edge in edges]
+        view = nx.restricted_view(self.graph, nodes, edges)
+        measured = self._measure(view)
+        baseline = self.baseline
+
+        disconnected = [host for host in self.hosts if host not in measured["reachable"]]
+        lost_flow = baseline["max_flow"] - measured["max_flow"]
+        lost_department_flow = {dept: baseline["department_flow"][dept] - flow
+                                for dept, flow in measured["department_flow"].items()}
+        cut = set(disconnected)
+        affected = [dept for dept, hosts in self.departments.items()
+                    if lost_department_flow[dept] > 1e-9 or cut.intersection(hosts)]
+        return {
+            "failed_nodes": nodes,
+            "failed_edges": edges,
+            "disconnected_hosts": disconnected,
+            "max_flow": measured["max_flow"],
+            "lost_flow": lost_flow,
+            "lost_flow_fraction": lost_flow / baseline["max_flow"] if baseline["max_flow"] else 0,
+            "department_flow": measured["department_flow"],
+            "lost_department_flow": lost_department_flow,
+            "affected_departments": affected,
+        }
+
+    def elements(self, include_nodes=True, include_edges=True, layers=None):
+        """
+        Failable elements of the topology.
+
+        Args:
+            include_nodes (bool): Include nodes.
+            include_edges (bool): Include edges.
+            layers (iterable, optional): Only nodes in these layers (and edges leaving them).
+
+        Returns:
+            list: ("node", name) and ("edge", (u, v)) tuples.
+        """
+        layers = set(layers) if layers is not None else None
+        topology = self.graph.subgraph(node for node in self.graph if node != SOURCE and not _is_sink(node))
+        selected = [node for node, layer in topology.nodes(data="layer") if layers is None or layer in layers]
+        elements = []
+        if include_nodes:
+            elements += [("node", node) for node in selected]
+        if include_edges:
+            selected = set(selected)
+            elements += [("edge", edge) for edge in topology.edges() if edge[0] in selected]
+        return elements
+
+    def scenarios(self, k=1, include_nodes=True, include_edges=True, layers=None):
+        """
+        Every combination of k simultaneous failures (N-k scenarios).
+
+        The number of scenarios grows as C(N, k); restrict layers for k > 1
+        on large topologies.
+
+        Args:
+            k (int): Elements failing together.
+            include_nodes, include_edges, layers: See elements().
+
+        Yields:
+            tuple: (nodes, edges) lists for analyze().
+        """
+        for combination in itertools.combinations(self.elements(include_nodes, include_edges, layers), k):
+            yield ([name for kind, name in combination if kind == "node"],
+                   [name for kind, name in combination if kind == "edge"])
+
+
+def _is_sink(node):
+    return node == ALL_HOSTS or (isinstance(node, tuple) and len(node) == 2 and node[0] == ALL_HOSTS)
+
+
+def analyze_chunk(analyzer, scenarios):
+    """
+    Evaluate a list of (nodes, edges) scenarios in a worker process.
+    """
+    return [analyzer.analyze(nodes, edges) for nodes, edges in scenarios]
+
+
+def sweep_failures(network, scenarios=None, workers=None, analyzer=None):
+    """
+    Evaluate many failure scenarios in parallel over a process pool.
+
+    Args:
+        network (FinancialDataCenterNetwork or nx.DiGraph): Built topology.
+        scenarios (iterable, optional): (nodes, edges) scenarios. Defaults to
+            every single node and edge failure.
+        workers (int, optional): Worker processes. Defaults to os.cpu_count();
+            1 runs in this process.
+        analyzer (FailureAnalyzer, optional): Analyzer to reuse instead of building one.
+
+    Returns:
+        list: analyze() results in scenario order, e.g. to rank by lost_flow.
+    """
+    analyzer = analyzer or FailureAnalyzer(network)
+    scenarios = list(analyzer.scenarios() if scenarios is None else scenarios)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(scenarios)))
+    if workers == 1:
+        return analyze_chunk(analyzer, scenarios)
+
+    size = -(-len(scenarios) // (workers * CHUNKS_PER_WORKER))
+    chunks = [scenarios[start:start + size] for start in range(0, len(scenarios), size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(analyze_chunk, analyzer, chunk) for chunk in chunks]
+        return [impact for future in futures for impact in future.result()]
@@ -1,66 +1,340 @@
-import pyshark
+import argparse
+import heapq
+from collections import deque
+from analysis_engine import MetricCollector, run_analysis
+from instrumentation import timed
+from live_metrics import DEFAULT_WINDOWS, WindowedCollector
+from sketches import DDSketch
 
-def analyze_icmp_metrics(pcap_file):
+
+DEFAULT_TIMEOUT = 5.0  # Seconds before an unanswered echo request counts as lost
+
+
+class ICMPMatcher:
+    """
+    Pair ICMP Echo Requests with their Echo Replies in bounded memory.
+
+    Requests are keyed on (src, dst, id, seq) and replies are looked up with
+    source and destination swapped. Each key holds a FIFO of send times, so
+    pings that reuse the same id/seq (as many tools do) still pair with the
+    oldest unanswered request instead of overwriting it. Requests left
+    unanswered for `timeout` seconds of packet time, or pushed out by the
+    max_outstanding cap, are evicted and counted in `lost`; memory is bounded
+    by the request rate times the timeout.
+
+    A matcher for a shard that follows another (see follow()) cannot pair
+    the keys it sees within `timeout` of its first packet on its own: the
+    previous shard may still hold requests for them, and with reused
+    id/seq every later pair of the key depends on which request each early
+    reply took. Such keys are deferred: their events are only logged, until
+    a key goes `timeout` without requests (so its queue is empty however the
+    boundary is resolved), and merge() replays the log in order against the
+    previous shard's outstanding requests. Sharded results then equal a
+    serial run's.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_outstanding=65536):
+        """
+        Args:
+            timeout (float): Seconds to wait for a reply before counting a request as lost.
+            max_outstanding (int): Cap on tracked requests; the oldest are evicted first.
+        """
+        self.timeout = timeout
+        self.max_outstanding = max_outstanding
+        self.pending = {}
+        self.order = deque()
+        self.follows = False
+        self.deferring = {}  # Deferred key -> time of its last request
+        self.deferred = []   # (key, icmp_type, timestamp, clock) events for merge() to replay
+        self.first = None
+        self.latest = None
+        self.requests = 0
+        self.replies = 0
+        self.matched = 0
+        self.lost = 0
+        self.unmatched_replies = 0
+
+    def follow(self):
+        """
+        Mark this matcher as fed with a shard that continues an earlier one.
+        """
+        self.follows = True
+
+    def _defer(self, key, icmp_type, timestamp):
+        # Log an event of a key that may continue a pairing from the previous shard
+        if key not in self.deferring:
+            if timestamp - self.first > self.timeout:
+                return False
+            self.deferring[key] = None
+        elif timestamp - self.first > self.timeout:
+            last_request = self.deferring[key]
+            if last_request is None or last_request < self.latest - self.timeout:
+                # Nothing of the key is still outstanding either way; pair it live from here
+                del self.deferring[key]
+                return False
+        if icmp_type == 8:
+            self.deferring[key] = timestamp
+        self.deferred.append((key, icmp_type, timestamp, self.latest))
+        return True
+
+    def expire(self, now):
+        """
+        Evict requests sent more than `timeout` seconds before now.
+
+        Args:
+            now (float): Current packet time in epoch seconds.
+
+        Returns:
+            int: Number of requests newly counted as lost.
+        """
+        lost = self.lost
+        cutoff = now - self.timeout
+        order = self.order
+        while order and (order[0][0] < cutoff or len(order) > self.max_outstanding):
+            self._evict(order.popleft())
+        return self.lost - lost
+
+    def _evict(self, entry):
+        queue = self.pending.get(entry[1])
+        if queue and queue[0] is entry:
+            queue.popleft()
+            if not queue:
+                del self.pending[entry[1]]
+            self.lost += 1
+
+    def _pair(self, key, timestamp):
+        queue = self.pending.get(key)
+        if not queue:
+            return None
+        sent, _ = queue.popleft()
+        if not queue:
+            del self.pending[key]
+        self.matched += 1
+        return (timestamp - sent) * 1000
+
+    def process(self, record):
+        """
+        Track one ICMP packet.
+
+        Args:
+            record (PacketRecord): ICMP packet.
+
+        Returns:
+            float or None: Latency in milliseconds when record is a matched reply.
+        """
+        timestamp = record.timestamp
+        if self.first is None:
+            self.first = timestamp
+        if self.latest is None or timestamp > self.latest:
+            self.latest = timestamp
+            self.expire(timestamp)
+
+        # Echo Request
+        if record.icmp_type == 8:
+            key = (record.src, record.dst, record.icmp_id, record.icmp_seq)
+            self.requests += 1
+            if self.follows and self._defer(key, 8, timestamp):
+                return None
+            entry = (timestamp, key)
+            self.pending.setdefault(key, deque()).append(entry)
+            self.order.append(entry)
+            if len(self.order) > self.max_outstanding:
+                self._evict(self.order.popleft())
+
+        # Echo Reply
+        elif record.icmp_type == 0:
+            self.replies += 1
+            key = (record.dst, record.src, record.icmp_id, record.icmp_seq)
+            if self.follows and self._defer(key, 0, timestamp):
+                return None
+            latency = self._pair(key, timestamp)
+            if latency is None:
+                self.unmatched_replies += 1
+            return latency
+        return None
+
+    @property
+    def outstanding(self):
+        return sum(len(queue) for queue in self.pending.values())
+
+    def loss_rate(self, final=True):
+        """
+        Percentage of requests that went unanswered.
+
+        Args:
+            final (bool): Also count requests still outstanding (end of capture).
+
+        Returns:
+            float: Loss rate in percent.
+        """
+        if self.requests == 0:
+            return 0
+        lost = self.lost + (self.outstanding if final else 0)
+        return lost / self.requests * 100
+
+    def merge(self, other):
+        """
+        Fold in the matcher of the following shard.
+
+        The deferred events of `other` are replayed in order against this
+        matcher's outstanding requests, then the outstanding requests of
+        both are combined and expired against the later shard's clock.
+
+        Args:
+            other (ICMPMatcher): Matcher for the packets after this one's.
+
+        Returns:
+            list: Latencies (ms) of the replayed pairs, which other did not report.
+        """
+        stitched = []
+        latest = self.latest
+        for key, icmp_type, timestamp, clock in other.deferred:
+            if latest is None or clock > latest:
+                latest = clock
+                self.expire(clock)
+            if icmp_type == 8:
+                entry = (timestamp, key)
+                self.pending.setdefault(key, deque()).append(entry)
+                self.order.append(entry)
+            else:
+                latency = self._pair(key, timestamp)
+                if latency is None:
+                    self.unmatched_replies += 1
+                else:
+                    stitched.append(latency)
+
+        for key, queue in other.pending.items():
+            self.pending.setdefault(key, deque()).extend(queue)
+        self.order = deque(heapq.merge(self.order, other.order, key=lambda entry: entry[0]))
+        self.requests += other.requests
+        self.replies += other.replies
+        self.matched += other.matched
+        self.lost += other.lost
+        self.unmatched_replies += other.unmatched_replies
+        if self.first is None:
+            self.first = other.first
+        if other.latest is not None:
+            self.latest = other.latest if self.latest is None else max(self.latest, other.latest)
+            self.expire(self.latest)
+        return stitched
+
+
+class ICMPMetricsCollector(MetricCollector):
+    """
+    Collect ICMP echo latency and loss rate.
+
+    Requests and replies are paired by ICMPMatcher; latency percentiles
+    (latency_p50 ... latency_p99.9, ms) come from a DDSketch.
+    """
+
+    protocols = ("icmp",)
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.matcher = ICMPMatcher(timeout)
+        self.latency_sum = 0
+        self.sketch = DDSketch()
+
+    def _add_latency(self, latency):
+        self.latency_sum += latency
+        self.sketch.add(latency)
+
+    def process(self, record):
+        latency = self.matcher.process(record)
+        if latency is not None:
+            self._add_latency(latency)
+
+    def result(self):
+        matcher = self.matcher
+        metrics = {
+            "latency_sum": self.latency_sum,
+            "latency_count": matcher.matched,
+            "average_latency": self.latency_sum / matcher.matched if matcher.matched > 0 else 0,
+            "loss_rate": matcher.loss_rate(),
+            "requests": matcher.requests,
+            "replies": matcher.replies,
+            "lost": matcher.lost + matcher.outstanding,
+        }
+        metrics.update(self.sketch.summary("latency_"))
+        return metrics
+
+    def begin_shard(self):
+        self.matcher.follow()
+
+    def merge(self, other):
+        for latency in self.matcher.merge(other.matcher):
+            self._add_latency(latency)
+        self.latency_sum += other.latency_sum
+        self.sketch.merge(other.sketch)
+
+
+class LiveICMPMetricsCollector(WindowedCollector):
+    """
+    ICMP echo latency and loss over sliding windows, for live monitoring.
+
+    Requests are paired by ICMPMatcher; a request is counted as lost in
+    the window in which its timeout expires.
+    """
+
+    protocols = ("icmp",)
+    fields = ("requests", "replies", "latency_sum", "latency_count", "lost")
+    sketch_prefix = "latency_"
+
+    def __init__(self, windows=DEFAULT_WINDOWS, timeout=DEFAULT_TIMEOUT, max_outstanding=65536):
+        super().__init__(windows)
+        self.matcher = ICMPMatcher(timeout, max_outstanding)
+
+    def process(self, record):
+        lost = self.matcher.lost
+        latency = self.matcher.process(record)
+        lost = self.matcher.lost - lost
+        if record.icmp_type == 8:
+            self.add(record.timestamp, 1, 0, 0, 0, lost)
+        elif latency is not None:
+            self.add(record.timestamp, 0, 1, latency, 1, lost)
+            self.add_sample(record.timestamp, latency)
+        else:
+            self.add(record.timestamp, 0, 1 if record.icmp_type == 0 else 0, 0, 0, lost)
+
+    def summarize(self, totals, span):
+        requests = totals["requests"]
+        return {
+            "latency_count": totals["latency_count"],
+            "average_latency": totals["latency_sum"] / totals["latency_count"] if totals["latency_count"] > 0 else 0,
+            "loss_rate": min(100, totals["lost"] / requests * 100) if requests > 0 else 0,
+        }
+
+
+@timed("analyze_icmp_metrics")
+def analyze_icmp_metrics(pcap_file, backend="pyshark", workers=1, timeout=DEFAULT_TIMEOUT, cache=None):
     """
     Analyze ICMP ping latency and loss rate.
 
     Args:
         pcap_file (str): Path to the input .pcapng file.
+        backend (str): Reader backend, "pyshark" or "native".
+        workers (int): Worker processes for sharded analysis (native backend).
+        timeout (float): Seconds before an unanswered request counts as lost.
+        cache (ResultCache, optional): Result cache (see result_cache).
 
     Returns:
         dict: Calculated ICMP metrics.
     """
-    metrics = {
-        "latency_sum": 0,
-        "latency_count": 0,
-        "average_latency": 0,
-        "loss_rate": 0
-    }
-
-    try:
-        cap = pyshark.FileCapture(pcap_file, display_filter="icmp")
-
-        request_count = 0
-        reply_count = 0
-        latencies = []
-
-        for packet in cap:
-            try:
-                # Check if the packet has an ICMP layer
-                if "ICMP" in packet:
-                    icmp_layer = packet.icmp
-
-                    # Echo Request
-                    if icmp_layer.type == "8":
-                        request_count += 1
-
-                    # Echo Reply
-                    elif icmp_layer.type == "0":
-                        reply_count += 1
-                        if hasattr(packet, "sniff_timestamp"):
-                            latencies.append(float(packet.sniff_timestamp))
-            except AttributeError:
-                continue
-
-        cap.close()
-
-        # Calculate metrics
-        metrics["latency_count"] = len(latencies)
-        metrics["loss_rate"] = ((request_count - reply_count) / request_count) * 100 if request_count > 0 else 0
-
-        if metrics["latency_count"] > 0:
-            metrics["average_latency"] = sum(latencies) / metrics["latency_count"]
-
-        return metrics
-    except FileNotFoundError:
-        print(f"Error: File {pcap_file} not found.")
-        return {}
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return {}
+    return run_analysis(pcap_file, {"icmp": ICMPMetricsCollector(timeout)}, backend, workers, cache).get("icmp", {})
 
 
 if __name__ == "__main__":
-    pcap_file = "financial_traffics.pcapng"  # Example file
-    icmp_metrics = analyze_icmp_metrics(pcap_file)
+    parser = argparse.ArgumentParser(description="Analyze ICMP latency and loss of a capture.")
+    parser.add_argument("pcap_file", nargs="?", default="financial_traffics.pcapng")
+    parser.add_argument("--check-shards", type=int, metavar="N",
+                        help="Instead check that sharded runs at 1..N shards equal the serial run")
+    args = parser.parse_args()
+
+    if args.check_shards:
+        from parallel_analysis import compare_shards
+
+        mismatches = compare_shards(args.pcap_file, lambda: {"icmp": ICMPMetricsCollector()},
+                                    range(1, args.check_shards + 1))
+        print(f"{args.check_shards - len(mismatches)} of {args.check_shards} shard counts match the serial run")
+        raise SystemExit(1 if mismatches else 0)
+    icmp_metrics = analyze_icmp_metrics(args.pcap_file)
     print("ICMP Metrics:", icmp_metrics)
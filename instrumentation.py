@@ -0,0 +1,202 @@
+import functools
+import io
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+METRIC_PREFIX = "network_project"
+
+_DISABLED = nullcontext()
+
+
+class Instrumentation:
+    """
+    Per-stage timers and counters for the analysis pipeline.
+
+    Instrumentation is off by default: stage() then returns a shared no-op
+    context and count() returns after one flag check, so the hooks left in
+    the pipeline cost next to nothing. Counters are incremented per batch
+    or per run, never per packet inside the hot loops.
+
+    When enabled with profile=True the whole run is recorded by cProfile;
+    with trace_memory=True tracemalloc records the peak traced memory of
+    every stage.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.profiler = None
+        self.trace_memory = False
+        self.reset()
+
+    def reset(self):
+        """
+        Clear every timer, counter and memory peak.
+        """
+        self.stages = {}
+        self.counters = {}
+        self.memory = {}
+        self._peaks = []  # Peak carried by each open stage while nested stages reset the tracer
+
+    def enable(self, profile=False, trace_memory=False):
+        """
+        Start collecting.
+
+        Args:
+            profile (bool): Record the run with cProfile.
+            trace_memory (bool): Track peak Python memory per stage with tracemalloc.
+        """
+        self.enabled = True
+        if profile:
+            import cProfile  # Profiling is opt-in; keep it out of every script's startup
+
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if trace_memory:
+            self.trace_memory = True
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def disable(self):
+        """
+        Stop collecting; the data gathered so far stays available to report().
+        """
+        self.enabled = False
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.trace_memory:
+            tracemalloc.stop()
+            self.trace_memory = False
+
+    def count(self, name, amount=1):
+        """
+        Add to a counter, e.g. "packets_decoded", "rows_inserted" or "bytes_written".
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def stage(self, name):
+        """
+        Context manager timing one stage; a no-op while disabled.
+
+        Args:
+            name (str): Stage name, e.g. "sqlite_insert".
+        """
+        if not self.enabled:
+            return _DISABLED
+        return self._timed_stage(name)
+
+    @contextmanager
+    def _timed_stage(self, name):
+        tracing = self.trace_memory
+        if tracing:
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            self._peaks.append(0)
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            calls, seconds = self.stages.get(name, (0, 0.0))
+            self.stages[name] = (calls + 1, seconds + elapsed)
+            if tracing and self.trace_memory:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                self.memory[name] = max(self.memory.get(name, 0), peak)
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+
+    def timed(self, name):
+        """
+        Decorator timing every call of a function as stage `name`.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self._timed_stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def profile_text(self, limit=25):
+        """
+        Top functions by cumulative time from the cProfile run.
+
+        Returns:
+            str or None: pstats listing, or None when profiling was not enabled.
+        """
+        if self.profiler is None:
+            return None
+        import pstats
+
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def report(self, profile_limit=25):
+        """
+        Structured report of everything collected.
+
+        Returns:
+            dict: stages ({name: {"calls", "seconds"}}), counters, memory
+            (peak bytes per stage, when traced) and profile (text, when enabled).
+        """
+        report = {
+            "stages": {name: {"calls": calls, "seconds": round(seconds, 6)}
+                       for name, (calls, seconds) in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+        if self.memory:
+            report["memory"] = dict(self.memory)
+        if self.profiler is not None:
+            report["profile"] = self.profile_text(profile_limit)
+        return report
+
+    def prometheus_text(self):
+        """
+        Render timers, counters and memory peaks in the Prometheus text exposition format.
+        """
+        lines = [
+            f"# HELP {METRIC_PREFIX}_stage_seconds_total Wall-clock seconds spent in each stage.",
+            f"# TYPE {METRIC_PREFIX}_stage_seconds_total counter",
+        ]
+        lines += [f'{METRIC_PREFIX}_stage_seconds_total{{stage="{name}"}} {seconds}'
+                  for name, (_, seconds) in self.stages.items()]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_stage_calls_total Number of times each stage ran.",
+            f"# TYPE {METRIC_PREFIX}_stage_calls_total counter",
+        ]
+        lines += [f'{METRIC_PREFIX}_stage_calls_total{{stage="{name}"}} {calls}'
+                  for name, (calls, _) in self.stages.items()]
+        for name, value in self.counters.items():
+            lines += [f"# TYPE {METRIC_PREFIX}_{name}_total counter", f"{METRIC_PREFIX}_{name}_total {value}"]
+        if self.memory:
+            lines.append(f"# TYPE {METRIC_PREFIX}_stage_peak_memory_bytes gauge")
+            lines += [f'{METRIC_PREFIX}_stage_peak_memory_bytes{{stage="{name}"}} {peak}'
+                      for name, peak in self.memory.items()]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Write prometheus_text() to a file, e.g. for node_exporter's textfile collector.
+
+        The file is replaced atomically so a scraper never reads a partial file.
+
+        Args:
+            path (str): Output path (conventionally ending in .prom).
+        """
+        temp = f"{path}.tmp"
+        with open(temp, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(temp, path)
+
+
+# Process-wide instance used by the pipeline modules
+instruments = Instrumentation()
+stage = instruments.stage
+count = instruments.count
+timed = instruments.timed
@@ -0,0 +1,313 @@
+import time
+from analysis_engine import MetricCollector
+from pcap_io import read_records, tail_records
+from sketches import DDSketch
+
+DEFAULT_WINDOWS = (1, 10, 60)  # Sliding window spans in seconds
+SLOTS_PER_WINDOW = 10
+
+
+class SlidingWindow:
+    """
+    Fixed-memory sliding-window counters over packet time.
+
+    The window span is divided into a ring of slots; each slot holds the
+    sums of every field for its slice of time and running totals are kept
+    alongside, so adding a sample and reading the totals are both O(1)
+    (expired slots are cleared at most once per pass of the ring).
+    """
+
+    def __init__(self, span, fields, slots=SLOTS_PER_WINDOW):
+        """
+        Args:
+            span (float): Window length in seconds.
+            fields (tuple): Names of the summed fields.
+            slots (int): Ring size; the window advances in span / slots steps.
+        """
+        self.span = span
+        self.fields = fields
+        self.slots = slots
+        self.resolution = span / slots
+        self.values = [[0] * slots for _ in fields]
+        self.totals = [0] * len(fields)
+        self.head = None
+
+    def advance(self, timestamp):
+        """
+        Move the window forward to timestamp, expiring slots that fell out of it.
+
+        Args:
+            timestamp (float): Current time in epoch seconds.
+
+        Returns:
+            int: Absolute slot index of timestamp.
+        """
+        index = int(timestamp // self.resolution)
+        if self.head is None:
+            self.head = index
+        elif index > self.head:
+            for step in range(1, min(index - self.head, self.slots) + 1):
+                position = (self.head + step) % self.slots
+                for field, ring in enumerate(self.values):
+                    self.totals[field] -= ring[position]
+                    ring[position] = 0
+            self.head = index
+        return index
+
+    def add(self, timestamp, *amounts):
+        """
+        Add one sample to every field.
+
+        Args:
+            timestamp (float): Sample time in epoch seconds.
+            *amounts: One amount per field, in field order.
+        """
+        index = self.advance(timestamp)
+        if index <= self.head - self.slots:
+            return  # Older than the window
+        position = index % self.slots
+        for field, amount in enumerate(amounts):
+            if amount:
+                self.values[field][position] += amount
+                self.totals[field] += amount
+
+    def snapshot(self, now=None):
+        """
+        Current totals of the window.
+
+        Args:
+            now (float, optional): Advance the window to this time first.
+
+        Returns:
+            dict: Mapping of field name to its total over the window.
+        """
+        if now is not None:
+            self.advance(now)
+        return dict(zip(self.fields, self.totals))
+
+
+class SlidingSketch:
+    """
+    Sliding-window quantile sketch: a ring of DDSketches, one per slot.
+
+    Adding a sample is O(1); a snapshot merges the ring's slots (a fixed
+    number of sketches), so memory and query cost do not grow with traffic.
+    """
+
+    def __init__(self, span, slots=SLOTS_PER_WINDOW, relative_accuracy=0.01):
+        """
+        Args:
+            span (float): Window length in seconds.
+            slots (int): Ring size; the window advances in span / slots steps.
+            relative_accuracy (float): DDSketch relative error bound.
+        """
+        self.span = span
+        self.slots = slots
+        self.resolution = span / slots
+        self.relative_accuracy = relative_accuracy
+        self.ring = [None] * slots
+        self.head = None
+
+    def advance(self, timestamp):
+        index = int(timestamp // self.resolution)
+        if self.head is None:
+            self.head = index
+        elif index > self.head:
+            for step in range(1, min(index - self.head, self.slots) + 1):
+                self.ring[(self.head + step) % self.slots] = None
+            self.head = index
+        return index
+
+    def add(self, timestamp, value):
+        """
+        Add one sample.
+
+        Args:
+            timestamp (float): Sample time in epoch seconds.
+            value (float): Non-negative sample value.
+        """
+        index = self.advance(timestamp)
+        if index <= self.head - self.slots:
+            return
+        position = index % self.slots
+        if self.ring[position] is None:
+            self.ring[position] = DDSketch(self.relative_accuracy)
+        self.ring[position].add(value)
+
+    def snapshot(self, now=None):
+        """
+        Merge the live slots into one sketch.
+
+        Args:
+            now (float, optional): Advance the window to this time first.
+
+        Returns:
+            DDSketch: Sketch of the samples inside the window.
+        """
+        if now is not None:
+            self.advance(now)
+        merged = DDSketch(self.relative_accuracy)
+        for sketch in self.ring:
+            if sketch is not None:
+                merged.merge(sketch)
+        return merged
+
+
+class WindowedCollector(MetricCollector):
+    """
+    Base class for live collectors that keep one SlidingWindow per span.
+
+    Subclasses define `fields`, call self.add(timestamp, ...) from process()
+    and turn a window's totals into metrics in summarize(). Setting
+    `sketch_prefix` also keeps a SlidingSketch per span, fed through
+    add_sample(), whose quantiles are reported under that prefix.
+    """
+
+    fields = ()
+    sketch_prefix = None
+
+    def __init__(self, windows=DEFAULT_WINDOWS):
+        self.windows = {f"{span}s": SlidingWindow(span, self.fields) for span in windows}
+        self.sketches = {f"{span}s": SlidingSketch(span) for span in windows} if self.sketch_prefix else {}
+        self.latest = None
+
+    def add(self, timestamp, *amounts):
+        if self.latest is None or timestamp > self.latest:
+            self.latest = timestamp
+        for window in self.windows.values():
+            window.add(timestamp, *amounts)
+
+    def add_sample(self, timestamp, value):
+        for sketch in self.sketches.values():
+            sketch.add(timestamp, value)
+
+    def summarize(self, totals, span):
+        raise NotImplementedError
+
+    def result(self, now=None):
+        now = self.latest if now is None else now
+        results = {}
+        for name, window in self.windows.items():
+            metrics = self.summarize(window.snapshot(now), window.span)
+            if name in self.sketches:
+                metrics.update(self.sketches[name].snapshot(now).summary(self.sketch_prefix))
+            results[name] = metrics
+        return results
+
+
+def check_thresholds(snapshot, thresholds):
+    """
+    Compare a monitor snapshot against alert thresholds.
+
+    Args:
+        snapshot (dict): {collector name: {window name: {metric: value}}}.
+        thresholds (dict): {(collector name, window name, metric): limit}; a
+            positive limit alerts when the value exceeds it, a negative limit
+            alerts when the value drops below its absolute value.
+
+    Returns:
+        list: Alert messages.
+    """
+    alerts = []
+    for (name, window, metric), limit in thresholds.items():
+        value = snapshot.get(name, {}).get(window, {}).get(metric)
+        if value is None:
+            continue
+        if (limit >= 0 and value > limit) or (limit < 0 and value < -limit):
+            alerts.append(f"{name} {window} {metric}={value} breached {abs(limit)}")
+    return alerts
+
+
+def print_update(timestamp, snapshot, alerts):
+    """
+    Default monitor callback: print the snapshot and any alerts.
+    """
+    print(f"[{timestamp:.3f}]")
+    for name, windows in snapshot.items():
+        for window, metrics in windows.items():
+            print(f"  {name} {window}: {metrics}")
+    for alert in alerts:
+        print(f"  ALERT: {alert}")
+
+
+def replay_records(pcap_file, speed=1.0):
+    """
+    Replay a saved capture in real time, as a local stand-in for a live source.
+
+    Args:
+        pcap_file (str): Path to the input .pcap/.pcapng file.
+        speed (float): Playback speed multiplier.
+
+    Yields:
+        PacketRecord: Records released at their original inter-packet spacing.
+    """
+    start_wall = None
+    for record in read_records(pcap_file):
+        if start_wall is None:
+            start_wall, start_ts = time.monotonic(), record.timestamp
+        delay = (record.timestamp - start_ts) / speed - (time.monotonic() - start_wall)
+        if delay > 0:
+            time.sleep(delay)
+        yield record
+
+
+def monitor_records(records, collectors, interval=1.0, thresholds=None, on_update=print_update):
+    """
+    Feed a packet stream to live collectors and report every interval of packet time.
+
+    Args:
+        records (iterable): PacketRecords, e.g. from tail_records or replay_records.
+        collectors (dict): Mapping of name to WindowedCollector.
+        interval (float): Seconds of packet time between updates.
+        thresholds (dict, optional): Alert thresholds (see check_thresholds).
+        on_update (callable): Called as on_update(timestamp, snapshot, alerts).
+
+    Returns:
+        dict: The final snapshot.
+    """
+    thresholds = thresholds or {}
+    active = list(collectors.values())
+    next_update = None
+    now = None
+
+    for record in records:
+        now = record.timestamp
+        for collector in active:
+            if collector.wants(record):
+                collector.process(record)
+
+        if next_update is None:
+            next_update = now + interval
+        elif now >= next_update:
+            snapshot = {name: collector.result(now) for name, collector in collectors.items()}
+            on_update(now, snapshot, check_thresholds(snapshot, thresholds))
+            next_update = now + interval
+
+    return {name: collector.result(now) for name, collector in collectors.items()}
+
+
+def monitor_capture(pcap_file, collectors, interval=1.0, thresholds=None, on_update=print_update,
+                    follow=True, idle_timeout=None):
+    """
+    Monitor a capture file, following it as it grows.
+
+    Args:
+        pcap_file (str): Path to the capture being written.
+        collectors (dict): Mapping of name to WindowedCollector.
+        interval (float): Seconds of packet time between updates.
+        thresholds (dict, optional): Alert thresholds (see check_thresholds).
+        on_update (callable): Called as on_update(timestamp, snapshot, alerts).
+        follow (bool): Keep reading as the file grows; False reads it once.
+        idle_timeout (float, optional): Stop following after this many idle seconds.
+
+    Returns:
+        dict: The final snapshot, or {} on error.
+    """
+    try:
+        records = tail_records(pcap_file, idle_timeout=idle_timeout) if follow else read_records(pcap_file)
+        return monitor_records(records, collectors, interval, thresholds, on_update)
+    except FileNotFoundError:
+        print(f"Error: File {pcap_file} not found.")
+        return {}
+    except KeyboardInterrupt:
+        return {name: collector.result() for name, collector in collectors.items()}
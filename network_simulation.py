@@ -1,99 +1,206 @@
+import argparse
+import os
 import networkx as nx
-import matplotlib.pyplot as plt
+from failure_analysis import FailureAnalyzer, sweep_failures
+from path_index import PathIndex
+from rendering import TopologyRenderer, headless, render_scenarios
+from topology import build_fabric
+from traffic_simulation import simulate_traffic
 
 class FinancialDataCenterNetwork:
     def __init__(self):
-        self.network = nx.DiGraph()
-
-    def build(self):
-        # Adding a realistic financial data center network topology
-        # Core Layer
-        self.network.add_node("CoreSwitch-FDC1", layer="Core")
-        self.network.add_node("CoreSwitch-FDC2", layer="Core")
-
-        # Distribution Layer (Departments)
-        departments = ["Accounting", "IT", "HR"]
-        for dept in departments:
-            self.network.add_node(f"DistSwitch-{dept}", layer="Distribution")
-            self.network.add_edge("CoreSwitch-FDC1", f"DistSwitch-{dept}", capacity=10)
-            self.network.add_edge("CoreSwitch-FDC2", f"DistSwitch-{dept}", capacity=10)
-
-        # Access Layer (Floors)
-        for dept in departments:
-            for floor in range(1, 6):  # Five floors per department
-                self.network.add_node(f"AccessSwitch-{dept}-Floor{floor}", layer="Access")
-                self.network.add_edge(f"DistSwitch-{dept}", f"AccessSwitch-{dept}-Floor{floor}", capacity=1)
-
-        # Host Layer (Workstations)
-        for dept in departments:
-            for floor in range(1, 6):
-                for workstation_id in range(1, 4):  # Three workstations per floor
-                    host_name = f"Workstation-{dept}-Floor{floor}-{workstation_id}"
-                    self.network.add_node(host_name, layer="Host")
-                    self.network.add_edge(f"AccessSwitch-{dept}-Floor{floor}", host_name, capacity=0.1)
-
-    def visualize(self):
-        # Custom layout based on layers
-        pos = nx.multipartite_layout(self.network, subset_key="layer")
-        plt.figure(figsize=(18, 12))
-        nx.draw(
-            self.network,
-            pos,
-            with_labels=True,
-            node_size=30,
-            node_color="lightblue",
-            font_size=4,
-            font_weight='bold',
-            arrows=True,
-            arrowsize=5,
-            width=0.25,
-        )
-        plt.title("Financial Data Center Network Topology", fontsize=14)
-        plt.show()
-
-    def visualize_network(self):
+        self._network = None
+        self.topology = None
+        self.paths = None
+        self.failed_nodes = []
+        self.failed_edges = []
+        self._renderer = None
+
+    def build(self, cores=2, departments=3, floors=5, hosts=3, redundancy=1):
+        """
+        Build the core / distribution / access / host topology.
+
+        The defaults give the original 3 departments x 5 floors x 3
+        workstations network. Only the compact topology.Topology
+        (self.topology) and its path index are built here; the NetworkX
+        graph (self.network) is converted on first use by drawing, failure
+        simulation and max-flow analysis, so large fabrics that only need
+        path and traffic queries never pay for it.
+
+        Args:
+            cores (int): Core switches.
+            departments (int or list): Number of departments, or their names.
+            floors (int): Floors (access switches) per department.
+            hosts (int): Workstations per floor.
+            redundancy (int): Distribution switches per department.
+        """
+        self.topology = build_fabric(cores, departments, floors, hosts, redundancy)
+        self._network = None
+        self.paths = PathIndex(self.topology)
+        self.failed_nodes, self.failed_edges = [], []
+        self._renderer = None
+
+    @property
+    def network(self):
+        """
+        NetworkX view of the topology, converted from self.topology on first access.
+        """
+        if self._network is None:
+            self._network = self.topology.to_networkx() if self.topology is not None else nx.DiGraph()
+        return self._network
+
+    @network.setter
+    def network(self, graph):
+        self._network = graph
+
+    def renderer(self):
+        """
+        Topology renderer with the layered layout of the intact network, computed once per build().
+        """
+        if self._renderer is None:
+            self._renderer = TopologyRenderer(self.network)
+        return self._renderer
+
+    def visualize(self, output=None):
+        """
+        Draw the network topology.
+
+        Args:
+            output (str, optional): PNG/SVG path to write instead of showing the figure.
+        """
+        return self.renderer().render(output, "Financial Data Center Network Topology", show_failed=False,
+                                      failed_nodes=self.failed_nodes, failed_edges=self.failed_edges)
+
+    def visualize_network(self, output=None):
         """
         Visualize the updated network after simulating failures.
+
+        Nodes keep their positions from the intact layout; failed elements are drawn in red.
+
+        Args:
+            output (str, optional): PNG/SVG path to write instead of showing the figure.
         """
-        pos = nx.multipartite_layout(self.network, subset_key="layer")
-        plt.figure(figsize=(18, 12))
-        nx.draw(
-            self.network,
-            pos,
-            with_labels=True,
-            node_size=30,
-            node_color="lightblue",
-            font_size=4,
-            font_weight='bold',
-            arrows=True,
-            arrowsize=5,
-            width=0.25,
-        )
-        plt.title("Network Topology after Failure")
-        plt.show()
-
-    def simulate_failure(self, node=None, edgeA=None, edgeB=None):
+        return self.renderer().render(output, "Network Topology after Failure",
+                                      failed_nodes=self.failed_nodes, failed_edges=self.failed_edges)
+
+    def simulate_failure(self, node=None, edgeA=None, edgeB=None, output=None):
         """
         Simulate failures in the network topology.
 
+        This removes the elements from the graph for good; use
+        analyze_failure() to measure a failure's impact without changing it.
+        The path index (self.paths) is repaired incrementally to match.
+
         Args:
-            network (nx.Graph): The network graph.
             node (str, optional): Node to disable.
-            edge (tuple, optional): Edge to disable.
+            edgeA, edgeB (str, optional): Endpoints of the edge to disable.
+            output (str, optional): PNG/SVG path for the drawing instead of showing it.
         """
+        self.renderer()
         if node:
             self.network.remove_node(node)
+            self.failed_nodes.append(node)
+            if self.paths is not None:
+                self.paths.fail_node(node)
             print(f"Node {node} removed from the network.")
         if edgeA and edgeB:
             self.network.remove_edge(edgeA, edgeB)
+            self.failed_edges.append((edgeA, edgeB))
+            if self.paths is not None:
+                self.paths.fail_link(edgeA, edgeB)
             print(f"Edge {edgeA}-{edgeB} removed from the network.")
-        self.visualize_network()
+        self.visualize_network(output)
+
+    def render_failures(self, scenarios, directory, fmt="png", workers=None):
+        """
+        Render failure scenarios to image files in parallel, without modifying the network.
+
+        Args:
+            scenarios (iterable): (nodes, edges) scenarios, e.g. from
+                FailureAnalyzer.scenarios() or the failed_nodes/failed_edges of
+                sweep_single_failures() impacts.
+            directory (str): Output directory.
+            fmt (str): "png" or "svg".
+            workers (int, optional): Worker processes. Defaults to os.cpu_count().
+
+        Returns:
+            list: Written paths in scenario order.
+        """
+        return render_scenarios(self.renderer(), scenarios, directory, fmt, workers)
+
+    def analyze_failure(self, nodes=(), edges=()):
+        """
+        Measure the impact of node and edge failures without modifying the network.
+
+        Args:
+            nodes (iterable): Nodes that fail.
+            edges (iterable): (u, v) edges that fail.
+
+        Returns:
+            dict: Disconnected hosts, lost core-to-host max-flow and affected
+            departments (see FailureAnalyzer.analyze).
+        """
+        return FailureAnalyzer(self.network).analyze(nodes, edges)
+
+    def sweep_single_failures(self, workers=None):
+        """
+        Evaluate every single node and edge failure over a process pool.
+
+        Args:
+            workers (int, optional): Worker processes. Defaults to os.cpu_count().
+
+        Returns:
+            list: Failure impacts, worst lost max-flow first.
+        """
+        impacts = sweep_failures(self.network, workers=workers)
+        return sorted(impacts, key=lambda impact: (impact["lost_flow"], len(impact["disconnected_hosts"])), reverse=True)
+
+    def simulate_traffic(self, db_name="network_data.db", start=None, end=None, tick=1.0, ecmp="split"):
+        """
+        Replay observed per source/destination byte rates from traffic_records onto the links.
+
+        Args:
+            db_name (str): Path to the SQLite database.
+            start (float, optional): Range start in epoch seconds.
+            end (float, optional): Range end in epoch seconds.
+            tick (float): Seconds per allocation step.
+            ecmp (str): "split" over every equal-cost path, or "hash" onto one.
+
+        Returns:
+            dict: Link utilization, bottleneck links and max-min fair flow
+            throughput (see traffic_simulation.TrafficSimulator.replay).
+        """
+        return simulate_traffic(self, db_name, start, end, tick, ecmp)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the data center network and simulate failures.")
+    parser.add_argument("--output-dir", help="Write the drawings here (headless, Agg backend) instead of showing them")
+    parser.add_argument("--format", choices=("png", "svg"), default="png")
+    args = parser.parse_args()
+    if args.output_dir:
+        headless()
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    def figure(name):
+        return os.path.join(args.output_dir, f"{name}.{args.format}") if args.output_dir else None
+
     network = FinancialDataCenterNetwork()
     network.build()
-    network.visualize()
+    network.visualize(figure("topology"))
     
+    # Rank single failures by lost core-to-host capacity
+    impacts = network.sweep_single_failures()
+    for impact in impacts[:5]:
+        failed = impact["failed_nodes"] or impact["failed_edges"]
+        print(f"{failed}: lost flow {impact['lost_flow']:.2f} ({impact['lost_flow_fraction']:.0%}), "
+              f"{len(impact['disconnected_hosts'])} hosts disconnected, departments {impact['affected_departments']}")
+    if args.output_dir:
+        scenarios = [(impact["failed_nodes"], impact["failed_edges"]) for impact in impacts]
+        paths = network.render_failures(scenarios, os.path.join(args.output_dir, "failures"), args.format)
+        print(f"Rendered {len(paths)} failure scenarios to {os.path.join(args.output_dir, 'failures')}")
+
     # Example: Simulating failure
-    network.simulate_failure(node="DistSwitch-IT")
-    network.simulate_failure(edgeA="DistSwitch-Accounting", edgeB="AccessSwitch-Accounting-Floor1")
+    network.simulate_failure(node="DistSwitch-IT", output=figure("failure_node"))
+    print(f"{network.paths.unreachable_pairs()} host pairs unreachable after the failure")
+    network.simulate_failure(edgeA="DistSwitch-Accounting", edgeB="AccessSwitch-Accounting-Floor1",
+                             output=figure("failure_edge"))
@@ -0,0 +1,329 @@
+import array
+import datetime
+import numpy as np
+from analysis_engine import MetricCollector
+# The protocol and address helpers live in the lightweight protocols module; re-exported here
+from protocols import (NO_ADDRESS, PROTO_ICMP, PROTO_OTHER, PROTO_TCP, PROTO_UDP, PROTOCOL_CODES, PROTOCOL_NAMES,
+                       TRANSPORT_NAMES, int_to_ip, ip_to_int, protocol_code)
+
+__all__ = [
+    "PACKET_DTYPE", "PacketTable", "PacketTableBuilder", "PacketTableCollector",
+    # Re-exported from protocols
+    "NO_ADDRESS", "PROTO_ICMP", "PROTO_OTHER", "PROTO_TCP", "PROTO_UDP", "PROTOCOL_CODES", "PROTOCOL_NAMES",
+    "TRANSPORT_NAMES", "int_to_ip", "ip_to_int", "protocol_code",
+]
+
+# Fixed 19-byte record of the binary (.npy) packet table format
+PACKET_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("length", "<u2"),
+    ("protocol", "u1"),
+    ("src", "<u4"),
+    ("dst", "<u4"),
+])
+
+
+class PacketTable:
+    """
+    Columnar, NumPy-backed table of captured packets.
+
+    Columns:
+        timestamp (float64): Capture time in epoch seconds.
+        length (uint16): Frame length in bytes (saturated at 65535).
+        protocol (uint8): IP protocol code (see PROTOCOL_NAMES).
+        src, dst (uint32): IPv4 addresses, NO_ADDRESS when absent.
+    """
+
+    def __init__(self, timestamp, length, protocol, src, dst):
+        self.timestamp = np.asarray(timestamp, dtype=np.float64)
+        self.length = np.asarray(length, dtype=np.uint16)
+        self.protocol = np.asarray(protocol, dtype=np.uint8)
+        self.src = np.asarray(src, dtype=np.uint32)
+        self.dst = np.asarray(dst, dtype=np.uint32)
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build a table from an iterable of PacketRecords.
+
+        Args:
+            records (iterable): PacketRecords to store.
+
+        Returns:
+            PacketTable: The populated table.
+        """
+        builder = PacketTableBuilder()
+        for record in records:
+            builder.append(record)
+        return builder.build()
+
+    def select(self, mask):
+        """
+        Return the rows selected by a boolean mask or index array.
+
+        Args:
+            mask (numpy.ndarray): Boolean mask or integer indices.
+
+        Returns:
+            PacketTable: A new table holding the selected rows.
+        """
+        return PacketTable(self.timestamp[mask], self.length[mask], self.protocol[mask],
+                           self.src[mask], self.dst[mask])
+
+    def save(self, path):
+        """
+        Write the table as a fixed-record NumPy .npy file (see PACKET_DTYPE).
+
+        Args:
+            path (str): Output path, conventionally ending in .npy.
+
+        Returns:
+            int: Bytes written.
+        """
+        records = np.empty(len(self), dtype=PACKET_DTYPE)
+        for name in PACKET_DTYPE.names:
+            records[name] = getattr(self, name)
+        with open(path, "wb") as f:
+            np.save(f, records)
+            return f.tell()
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Open a table written by save().
+
+        With mmap=True the file is memory-mapped and every column is a view
+        into the mapping, so nothing is read until a column is used.
+
+        Args:
+            path (str): Path to the .npy file.
+            mmap (bool): Memory-map the file instead of reading it.
+
+        Returns:
+            PacketTable: Table whose columns view the file's records.
+        """
+        records = np.load(path, mmap_mode="r" if mmap else None)
+        if records.dtype != PACKET_DTYPE:
+            raise ValueError(f"{path} is not a packet table (dtype {records.dtype})")
+        return cls(*(records[name] for name in PACKET_DTYPE.names))
+
+    def with_protocol(self, name):
+        """
+        Return only the packets of one protocol.
+
+        Args:
+            name (str): "TCP", "UDP" or "ICMP".
+
+        Returns:
+            PacketTable: The matching rows.
+        """
+        return self.select(self.protocol == PROTOCOL_CODES[name])
+
+    def rows(self):
+        """
+        Iterate over rows in the traffic_records layout.
+
+        Yields:
+            tuple: (time, protocol, length, source, destination) with the same
+                string formatting as the text report.
+        """
+        addresses = {}
+        for ts, length, proto, src, dst in zip(self.timestamp.tolist(), self.length.tolist(),
+                                               self.protocol.tolist(), self.src.tolist(),
+                                               self.dst.tolist()):
+            if src not in addresses:
+                addresses[src] = int_to_ip(src)
+            if dst not in addresses:
+                addresses[dst] = int_to_ip(dst)
+            yield (str(datetime.datetime.fromtimestamp(ts)), TRANSPORT_NAMES.get(proto),
+                   length, addresses[src], addresses[dst])
+
+    def db_rows(self):
+        """
+        Iterate over rows in the numeric traffic_records schema.
+
+        Yields:
+            tuple: (time, protocol, length, source, destination) as epoch
+                seconds, protocol code, length and uint32 addresses.
+        """
+        return zip(self.timestamp.tolist(), self.protocol.tolist(), self.length.tolist(),
+                   self.src.tolist(), self.dst.tolist())
+
+    def write_text(self, output_file):
+        """
+        Write the table as the human-readable traffic details report.
+
+        Args:
+            output_file (str): Path to the output text file.
+
+        Returns:
+            int: Bytes written.
+        """
+        with open(output_file, "w") as f:
+            f.write("Filtered Traffic Details:\n")
+            f.write("=" * 40 + "\n")
+            for time, protocol, length, source, destination in self.rows():
+                f.write(
+                    f"Time: {time}, Protocol: {protocol}, "
+                    f"Length: {length}, Source: {source}, "
+                    f"Destination: {destination}\n"
+                )
+            return f.tell()
+
+    def protocol_counts(self):
+        """
+        Count packets per protocol.
+
+        Returns:
+            dict: Mapping of protocol name ("TCP", "UDP", "ICMP", "Other") to count.
+        """
+        counts = np.bincount(self.protocol, minlength=256)
+        result = {}
+        for code in np.flatnonzero(counts).tolist():
+            name = PROTOCOL_NAMES.get(code, "Other")
+            result[name] = result.get(name, 0) + int(counts[code])
+        return result
+
+    def summary(self):
+        """
+        Summarize packet count, byte total and duration of the table.
+
+        Returns:
+            tuple: (packets, total_bytes, duration_seconds).
+        """
+        packets = len(self)
+        if packets == 0:
+            return 0, 0, 0
+        total_bytes = int(self.length.sum(dtype=np.int64))
+        duration = float(self.timestamp[-1] - self.timestamp[0]) if packets > 1 else 0
+        return packets, total_bytes, duration
+
+    def throughput(self, interval=1.0):
+        """
+        Compute bytes per time bucket.
+
+        Args:
+            interval (float): Bucket width in seconds.
+
+        Returns:
+            tuple: (bucket start times, bytes per bucket) as NumPy arrays.
+        """
+        if len(self) == 0:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        start = self.timestamp.min()
+        buckets = ((self.timestamp - start) // interval).astype(np.int64)
+        totals = np.bincount(buckets, weights=self.length).astype(np.int64)
+        return start + np.arange(len(totals)) * interval, totals
+
+    def length_sketch(self, relative_accuracy=0.01):
+        """
+        Quantile sketch of frame lengths, built vectorized.
+
+        Args:
+            relative_accuracy (float): DDSketch relative error bound.
+
+        Returns:
+            DDSketch: Mergeable sketch of the length column.
+        """
+        from sketches import DDSketch
+        sketch = DDSketch(relative_accuracy)
+        sketch.add_many(self.length)
+        return sketch
+
+    def length_histogram(self, bins=20):
+        """
+        Histogram of frame lengths.
+
+        Args:
+            bins (int or sequence): Number of bins or bin edges.
+
+        Returns:
+            tuple: (counts, bin_edges) as returned by numpy.histogram.
+        """
+        return np.histogram(self.length, bins=bins)
+
+
+class PacketTableBuilder:
+    """
+    Append-only builder that keeps columns in compact typed arrays.
+    """
+
+    def __init__(self):
+        self.timestamp = array.array("d")
+        self.length = array.array("H")
+        self.protocol = array.array("B")
+        self.src = array.array("I")
+        self.dst = array.array("I")
+        self.addresses = {None: NO_ADDRESS}
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def extend(self, other):
+        """
+        Append every row of another builder.
+
+        Args:
+            other (PacketTableBuilder): Builder holding later packets.
+        """
+        self.timestamp.extend(other.timestamp)
+        self.length.extend(other.length)
+        self.protocol.extend(other.protocol)
+        self.src.extend(other.src)
+        self.dst.extend(other.dst)
+
+    def _address(self, address):
+        value = self.addresses.get(address)
+        if value is None:
+            value = self.addresses[address] = ip_to_int(address)
+        return value
+
+    def append(self, record):
+        """
+        Append one PacketRecord.
+
+        Args:
+            record (PacketRecord): The packet to store.
+        """
+        self.timestamp.append(record.timestamp)
+        self.length.append(min(record.length, 0xFFFF))
+        self.protocol.append(protocol_code(record))
+        self.src.append(self._address(record.src))
+        self.dst.append(self._address(record.dst))
+
+    def build(self):
+        """
+        Freeze the collected columns into a PacketTable.
+
+        Returns:
+            PacketTable: Table backed by NumPy arrays.
+        """
+        return PacketTable(
+            np.frombuffer(self.timestamp, dtype=np.float64).copy(),
+            np.frombuffer(self.length, dtype=np.uint16).copy(),
+            np.frombuffer(self.protocol, dtype=np.uint8).copy(),
+            np.frombuffer(self.src, dtype=np.uint32).copy(),
+            np.frombuffer(self.dst, dtype=np.uint32).copy(),
+        )
+
+
+class PacketTableCollector(MetricCollector):
+    """
+    Collect packets of the given protocols into a PacketTable.
+    """
+
+    def __init__(self, protocols=["UDP", "TCP", "ICMP"]):
+        self.protocols = tuple(p.lower() for p in protocols)
+        self.builder = PacketTableBuilder()
+
+    def process(self, record):
+        self.builder.append(record)
+
+    def result(self):
+        return self.builder.build()
+
+    def merge(self, other):
+        self.builder.extend(other.builder)
@@ -0,0 +1,160 @@
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from analysis_engine import run_analysis
+from pcap_io import read_records, split_capture
+
+DEFAULT_WARMUP_BYTES = 1 << 20  # Replayed before each shard to rebuild TCP state
+
+
+def analyze_shard(pcap_file, warmup_start, start, end, collectors, follows=False):
+    """
+    Feed the packets of one byte range of a capture to fresh collectors.
+
+    Args:
+        pcap_file (str): Path to the input .pcap/.pcapng file.
+        warmup_start (int): Offset from which TCP state is rebuilt without emitting packets.
+        start (int): Offset of the first block of the shard.
+        end (int): Offset at which the shard stops.
+        collectors (dict): Mapping of result name to an unused MetricCollector.
+        follows (bool): The shard continues an earlier one (see MetricCollector.begin_shard).
+
+    Returns:
+        dict: The same collectors holding this shard's partial state.
+    """
+    active = list(collectors.values())
+    if follows:
+        for collector in active:
+            collector.begin_shard()
+    for record in read_records(pcap_file, start, end, warmup_start):
+        for collector in active:
+            if collector.wants(record):
+                collector.process(record)
+    return collectors
+
+
+def run_parallel_analysis(pcap_file, collectors, workers=None, shards=None, warmup_bytes=DEFAULT_WARMUP_BYTES):
+    """
+    Analyze a capture in byte-range shards across a process pool.
+
+    Each worker decodes one shard with the native backend into its own copy
+    of the collectors; the partial collectors are then merged in file order,
+    which lets order-dependent state such as ICMP request/reply pairs that
+    straddle a shard boundary be stitched together.
+
+    Args:
+        pcap_file (str): Path to the input .pcap/.pcapng file.
+        collectors (dict): Mapping of result name to MetricCollector (must implement merge()).
+        workers (int, optional): Worker processes. Defaults to os.cpu_count().
+        shards (int, optional): Number of shards. Defaults to workers.
+        warmup_bytes (int): Bytes replayed before each shard to rebuild TCP state.
+
+    Returns:
+        dict: Mapping of result name to each merged collector's result.
+    """
+    workers = workers or os.cpu_count() or 1
+    ranges = split_capture(pcap_file, shards or workers, warmup_bytes)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(analyze_shard, pcap_file, warmup_start, start, end, collectors, number > 0)
+                   for number, (warmup_start, start, end) in enumerate(ranges)]
+        partials = [future.result() for future in futures]
+
+    if not partials:
+        return {name: collector.result() for name, collector in collectors.items()}
+
+    merged = partials[0]
+    for partial in partials[1:]:
+        for name, collector in merged.items():
+            collector.merge(partial[name])
+
+    return {name: collector.result() for name, collector in merged.items()}
+
+
+def same_result(serial, sharded, rel_tol=1e-9):
+    """
+    Whether a sharded result equals the serial one.
+
+    Floats may differ by rounding (sums are added in another order) and
+    lists are compared as multisets, since pairs stitched at a boundary are
+    reported when the shards are merged rather than in packet order.
+
+    Args:
+        serial: Result of the serial run.
+        sharded: Result of the sharded run.
+        rel_tol (float): Relative tolerance for floats.
+    """
+    if isinstance(serial, dict):
+        return (isinstance(sharded, dict) and serial.keys() == sharded.keys()
+                and all(same_result(serial[key], sharded[key], rel_tol) for key in serial))
+    if isinstance(serial, (list, tuple)):
+        return (isinstance(sharded, (list, tuple)) and len(serial) == len(sharded)
+                and all(same_result(a, b, rel_tol) for a, b in zip(sorted(serial), sorted(sharded))))
+    if isinstance(serial, np.ndarray):
+        return np.array_equal(serial, sharded)
+    if isinstance(serial, float) or isinstance(sharded, float):
+        return math.isclose(serial, sharded, rel_tol=rel_tol, abs_tol=rel_tol)
+    if hasattr(serial, "__dict__"):
+        return type(serial) is type(sharded) and same_result(vars(serial), vars(sharded), rel_tol)
+    return serial == sharded
+
+
+def compare_shards(pcap_file, make_collectors, shard_counts, workers=2):
+    """
+    Run collectors serially and at several shard counts, and report differences.
+
+    Args:
+        pcap_file (str): Path to the input .pcap/.pcapng file.
+        make_collectors (callable): Returns a fresh {name: MetricCollector} mapping.
+        shard_counts (iterable): Shard counts to check.
+        workers (int): Worker processes per sharded run.
+
+    Returns:
+        list: (shards, result name) for every result that differs from the serial run.
+    """
+    serial = run_analysis(pcap_file, make_collectors(), "native")
+    mismatches = []
+    for shards in shard_counts:
+        sharded = run_parallel_analysis(pcap_file, make_collectors(), workers, shards)
+        mismatches += [(shards, name) for name in serial if not same_result(serial[name], sharded.get(name))]
+    return mismatches
+
+
+def mergeable_collectors():
+    """
+    A fresh instance of every collector that implements merge().
+    """
+    from analysis_engine import ProtocolCountCollector
+    from evaluate_network import ICMPLatencyCollector, UDPThroughputCollector
+    from icmp_metrics import ICMPMetricsCollector
+    from packet_table import PacketTableCollector
+    from sketches import LengthSketchCollector
+    from tcp_metrics import TCPMetricsCollector
+
+    return {
+        "protocols": ProtocolCountCollector(),
+        "udp": UDPThroughputCollector(5000),
+        "tcp": TCPMetricsCollector(),
+        "icmp": ICMPMetricsCollector(),
+        "latency": ICMPLatencyCollector(),
+        "table": PacketTableCollector(),
+        "lengths": LengthSketchCollector(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that sharded analysis equals the serial run.")
+    parser.add_argument("pcap_file", nargs="?", default="financial_traffics.pcapng")
+    parser.add_argument("--shards", default="1,2,5,13,40", help="Comma-separated shard counts")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    shard_counts = [int(count) for count in args.shards.split(",")]
+    mismatches = compare_shards(args.pcap_file, mergeable_collectors, shard_counts, args.workers)
+    for shards, name in mismatches:
+        print(f"{name}: {shards} shards differ from the serial run")
+    checked = len(shard_counts) * len(mergeable_collectors())
+    print(f"{checked - len(mismatches)} of {checked} sharded results match the serial run")
+    raise SystemExit(1 if mismatches else 0)
@@ -0,0 +1,430 @@
+import argparse
+import random
+from contextlib import contextmanager
+import numpy as np
+from topology import ACCESS, HOST, build_fabric
+
+UNREACHABLE = 255  # Hop count stored for unreachable pairs
+BFS_COLUMNS = 256  # Destination columns searched together when (re)building
+
+
+class PathIndex:
+    """
+    All-pairs hop count, ECMP next-hop and reachability index of a Topology.
+
+    Links are treated as full duplex. Every host hangs off one access
+    switch, so the index keeps hop counts over the switch graph only: a
+    uint8 table of the distance from every switch to every access switch,
+    filled by a BFS that expands a block of destination columns at once
+    over the CSR edges. Host queries reduce to that table plus per-host
+    up flags, so a hop count or reachability lookup is O(1) and a host's
+    reachability set is its access switch's row of the table.
+
+    Failures and restorations repair the table incrementally. Failing a
+    link or switch only changes the destination columns in which some
+    switch loses its last shortest-path next hop through it, and only those
+    columns are searched again; host and host-link failures just flip a
+    flag. scenario() fails elements temporarily and puts the saved columns
+    back afterwards, so failure sweeps never rebuild the index.
+    """
+
+    def __init__(self, topology):
+        """
+        Args:
+            topology (Topology or FinancialDataCenterNetwork): Fabric built by build_fabric.
+        """
+        topology = getattr(topology, "topology", topology)
+        self.topology = topology
+        hosts = topology.nodes_in_layer(HOST)
+        self.switches = int(hosts[0]) if len(hosts) else topology.num_nodes
+        if not (hosts == np.arange(self.switches, topology.num_nodes)).all():
+            raise ValueError("PathIndex needs hosts numbered after the switches (see topology.build_fabric)")
+        self.access = topology.nodes_in_layer(ACCESS)
+        self.column = np.full(self.switches, -1, dtype=np.int64)
+        self.column[self.access] = np.arange(len(self.access))
+
+        sources, targets, _ = topology.edges()
+        host_links = targets >= self.switches
+        self.host_access = np.zeros(len(hosts), dtype=np.int64)
+        self.host_access[targets[host_links] - self.switches] = self.column[sources[host_links]]
+        self.host_link = np.zeros(len(hosts), dtype=np.int64)
+        self.host_link[targets[host_links] - self.switches] = np.flatnonzero(host_links)
+
+        # Switch-to-switch adjacency in both directions, with the topology edge of each entry
+        edge = np.flatnonzero(~host_links)
+        u = np.concatenate([sources[edge], targets[edge]]).astype(np.int64)
+        v = np.concatenate([targets[edge], sources[edge]]).astype(np.int64)
+        edge = np.concatenate([edge, edge])
+        order = np.argsort(u, kind="stable")
+        self.adj_u, self.adj_v, self.adj_edge = u[order], v[order], edge[order]
+        self.adj_ptr = np.concatenate([[0], np.cumsum(np.bincount(self.adj_u, minlength=self.switches))])
+        self.edge_of = dict(zip(zip(self.adj_u.tolist(), self.adj_v.tolist()), self.adj_edge.tolist()))
+
+        self.node_up = np.ones(topology.num_nodes, dtype=bool)
+        self.link_up = np.ones(topology.num_edges, dtype=bool)
+        self.hops_table = np.full((self.switches, len(self.access)), UNREACHABLE, dtype=np.uint8)
+        self._journal = None  # Undo log of (rows, columns, previous values) written inside scenario()
+        self.rebuild()
+
+    def _node(self, node):
+        return self.topology.index(node) if isinstance(node, str) else int(node)
+
+    def _bfs(self, columns):
+        # Hop counts from every switch to the access switches of `columns`
+        columns = np.asarray(columns, dtype=np.int64)
+        hops = np.full((self.switches, len(columns)), UNREACHABLE, dtype=np.uint8)
+        frontier = np.zeros((self.switches, len(columns)), dtype=bool)
+        roots = self.access[columns]
+        alive = self.node_up[roots]
+        hops[roots[alive], np.flatnonzero(alive)] = 0
+        frontier[roots[alive], np.flatnonzero(alive)] = True
+
+        usable = self.link_up[self.adj_edge] & self.node_up[self.adj_u] & self.node_up[self.adj_v]
+        u, v = self.adj_u[usable], self.adj_v[usable]
+        order = np.argsort(v, kind="stable")
+        u, v = u[order], v[order]
+        if not len(v):
+            return hops
+        starts = np.flatnonzero(np.concatenate([[True], v[1:] != v[:-1]]))
+        targets = v[starts]
+
+        depth = 0
+        while frontier.any():
+            depth += 1
+            # OR the frontier bits of each target's neighbours, eight columns per byte
+            packed = np.packbits(frontier, axis=1)
+            reached = np.unpackbits(np.bitwise_or.reduceat(packed[u], starts, axis=0), axis=1,
+                                    count=len(columns)).astype(bool)
+            current = hops[targets]
+            newly = reached & (current == UNREACHABLE)
+            current[newly] = depth
+            hops[targets] = current
+            frontier[:] = False
+            frontier[targets] = newly
+        return hops
+
+    def rebuild(self, columns=None):
+        """
+        Recompute the given destination columns (all by default) from scratch.
+
+        Args:
+            columns (array-like, optional): Access switch columns to search again.
+        """
+        columns = np.arange(len(self.access)) if columns is None else np.asarray(columns, dtype=np.int64)
+        self._save(slice(None), columns)
+        for start in range(0, len(columns), BFS_COLUMNS):
+            block = columns[start:start + BFS_COLUMNS]
+            self.hops_table[:, block] = self._bfs(block)
+
+    def _save(self, rows, columns):
+        # Log the values about to be overwritten while a scenario() is open
+        if self._journal is not None:
+            self._journal.append((rows, columns, self.hops_table[rows, columns].copy()))
+
+    def _neighbours(self, node):
+        start, end = self.adj_ptr[node], self.adj_ptr[node + 1]
+        neighbours, edges = self.adj_v[start:end], self.adj_edge[start:end]
+        usable = self.link_up[edges] & self.node_up[neighbours]
+        return neighbours[usable]
+
+    def _next_hop_counts(self, node):
+        # Per destination column, how many usable neighbours are one hop closer
+        row = self.hops_table[node].astype(np.int16)
+        neighbours = self._neighbours(node)
+        if not len(neighbours):
+            return np.zeros(len(row), dtype=np.int64)
+        return (self.hops_table[neighbours].astype(np.int16) == row - 1).sum(axis=0)
+
+    def _losing(self, node, via):
+        # Columns in which `node` has `via` as its only next hop
+        row = self.hops_table[node].astype(np.int16)
+        through = (self.hops_table[via].astype(np.int16) == row - 1) & (row != UNREACHABLE)
+        return through & (self._next_hop_counts(node) == 1)
+
+    def fail_link(self, u, v):
+        """
+        Take the link between two nodes down and repair the affected columns.
+
+        Args:
+            u, v (int or str): Endpoints (indices or names), in either order.
+
+        Returns:
+            numpy.ndarray: Destination columns that were searched again.
+        """
+        u, v = self._node(u), self._node(v)
+        if max(u, v) >= self.switches:
+            host = max(u, v) - self.switches
+            self.link_up[self.host_link[host]] = False
+            return np.zeros(0, dtype=np.int64)
+        edge = self.edge_of[(u, v)]
+        if not self.link_up[edge]:
+            return np.zeros(0, dtype=np.int64)
+        affected = np.flatnonzero(self._losing(u, v) | self._losing(v, u))
+        self.link_up[edge] = False
+        self.rebuild(affected)
+        return affected
+
+    def fail_node(self, node):
+        """
+        Take a node down and repair the affected columns.
+
+        Args:
+            node (int or str): Node index or name.
+
+        Returns:
+            numpy.ndarray: Destination columns that were searched again.
+        """
+        node = self._node(node)
+        if not self.node_up[node]:
+            return np.zeros(0, dtype=np.int64)
+        if node >= self.switches:
+            self.node_up[node] = False
+            return np.zeros(0, dtype=np.int64)
+        affected = np.zeros(len(self.access), dtype=bool)
+        for neighbour in self._neighbours(node).tolist():
+            affected |= self._losing(neighbour, node)
+        if self.column[node] >= 0:
+            affected[self.column[node]] = True
+        affected = np.flatnonzero(affected)
+        self.node_up[node] = False
+        self._save(node, slice(None))
+        self.hops_table[node] = UNREACHABLE
+        self.rebuild(affected)
+        return affected
+
+    def restore_link(self, u, v):
+        """
+        Bring a link back up and repair the columns it shortens.
+
+        Returns:
+            numpy.ndarray: Destination columns that were searched again.
+        """
+        u, v = self._node(u), self._node(v)
+        if max(u, v) >= self.switches:
+            self.link_up[self.host_link[max(u, v) - self.switches]] = True
+            return np.zeros(0, dtype=np.int64)
+        edge = self.edge_of[(u, v)]
+        if self.link_up[edge]:
+            return np.zeros(0, dtype=np.int64)
+        self.link_up[edge] = True
+        if not (self.node_up[u] and self.node_up[v]):
+            return np.zeros(0, dtype=np.int64)
+        gap = np.abs(self.hops_table[u].astype(np.int16) - self.hops_table[v].astype(np.int16))
+        affected = np.flatnonzero(gap > 1)
+        self.rebuild(affected)
+        return affected
+
+    def restore_node(self, node):
+        """
+        Bring a node back up and repair the columns it shortens.
+
+        Returns:
+            numpy.ndarray: Destination columns that were searched again.
+        """
+        node = self._node(node)
+        if self.node_up[node]:
+            return np.zeros(0, dtype=np.int64)
+        self.node_up[node] = True
+        if node >= self.switches:
+            return np.zeros(0, dtype=np.int64)
+        neighbours = self._neighbours(node)
+        if len(neighbours):
+            around = self.hops_table[neighbours].astype(np.int16)
+            self._save(node, slice(None))
+            self.hops_table[node] = np.minimum(around.min(axis=0) + 1, UNREACHABLE)
+            affected = around.max(axis=0) > self.hops_table[node].astype(np.int16) + 1
+        else:
+            affected = np.zeros(len(self.access), dtype=bool)
+        if self.column[node] >= 0:
+            affected[self.column[node]] = True
+        affected = np.flatnonzero(affected)
+        self.rebuild(affected)
+        return affected
+
+    @contextmanager
+    def scenario(self, nodes=(), links=()):
+        """
+        Fail nodes and links for the duration of a with block.
+
+        Every row and column overwritten on the way in is logged with its
+        previous values, and the log is undone in reverse order on the way
+        out, so the index returns to its exact previous state without any
+        search.
+
+        Args:
+            nodes (iterable): Nodes (indices or names) that fail.
+            links (iterable): (u, v) links that fail.
+        """
+        if self._journal is not None:
+            raise RuntimeError("PathIndex scenarios cannot be nested")
+        node_up, link_up = self.node_up.copy(), self.link_up.copy()
+        self._journal = []
+        try:
+            for node in nodes:
+                self.fail_node(node)
+            for u, v in links:
+                self.fail_link(u, v)
+            yield self
+        finally:
+            # Undo newest first, so each cell ends up with its value from before the scenario
+            journal, self._journal = self._journal, None
+            for rows, columns, values in reversed(journal):
+                self.hops_table[rows, columns] = values
+            self.node_up[:], self.link_up[:] = node_up, link_up
+
+    def verify(self):
+        """
+        Whether the incrementally repaired table matches a search from scratch.
+        """
+        return bool((self.hops_table == self._bfs_all()).all())
+
+    def _bfs_all(self):
+        columns = np.arange(len(self.access))
+        return np.concatenate([self._bfs(columns[start:start + BFS_COLUMNS])
+                               for start in range(0, len(columns), BFS_COLUMNS)] or [self.hops_table[:, :0]], axis=1)
+
+    def sweep(self, scenarios):
+        """
+        Unreachable host pairs under each failure scenario, without rebuilding the index.
+
+        Args:
+            scenarios (iterable): (nodes, links) pairs, as for scenario().
+
+        Returns:
+            list: unreachable_pairs() per scenario.
+        """
+        results = []
+        for nodes, links in scenarios:
+            with self.scenario(nodes, links):
+                results.append(self.unreachable_pairs())
+        return results
+
+    def hops(self, src, dst):
+        """
+        Hop count between two hosts (host indices 0..hosts-1), or None if unreachable.
+        """
+        if src == dst:
+            return 0 if self.node_up[self.switches + src] else None
+        if not (self._host_up(src) and self._host_up(dst)):
+            return None
+        hops = self.hops_table[self.access[self.host_access[src]], self.host_access[dst]]
+        return None if hops == UNREACHABLE else int(hops) + 2
+
+    def reachable(self, src, dst):
+        """
+        Whether two hosts (host indices) can reach each other.
+        """
+        return self.hops(src, dst) is not None
+
+    def _host_up(self, host):
+        return self.node_up[self.switches + host] and self.link_up[self.host_link[host]]
+
+    def hosts_up(self):
+        """
+        Per-host flag: host and its access link are up.
+        """
+        return self.node_up[self.switches:] & self.link_up[self.host_link]
+
+    def reachable_hosts(self, src):
+        """
+        Hosts reachable from a host.
+
+        Returns:
+            numpy.ndarray: Boolean flag per host.
+        """
+        if not self._host_up(src):
+            return np.zeros(len(self.host_access), dtype=bool)
+        row = self.hops_table[self.access[self.host_access[src]]]
+        return (row[self.host_access] != UNREACHABLE) & self.hosts_up()
+
+    def reachability_bitset(self, src):
+        """
+        reachable_hosts() packed into a bitset (numpy.packbits order).
+        """
+        return np.packbits(self.reachable_hosts(src))
+
+    def next_hops(self, switch, dst):
+        """
+        ECMP next hops from a switch towards a host.
+
+        Args:
+            switch (int or str): Switch index or name.
+            dst (int): Destination host index.
+
+        Returns:
+            list: Node indices of the usable neighbours one hop closer (the host
+            itself from its access switch); empty if unreachable.
+        """
+        switch = self._node(switch)
+        column = self.host_access[dst]
+        if not self._host_up(dst) or self.hops_table[switch, column] == UNREACHABLE:
+            return []
+        if self.hops_table[switch, column] == 0:
+            return [self.switches + dst]
+        neighbours = self._neighbours(switch)
+        closer = self.hops_table[neighbours, column] == self.hops_table[switch, column] - 1
+        return neighbours[closer].tolist()
+
+    def unreachable_pairs(self):
+        """
+        Number of ordered pairs of hosts that cannot reach each other (down hosts included).
+        """
+        up = self.hosts_up()
+        per_access = np.bincount(self.host_access[up], minlength=len(self.access)).astype(np.float64)
+        connected = (self.hops_table[self.access] != UNREACHABLE).astype(np.float64)
+        reachable = per_access @ connected @ per_access - per_access.sum()
+        total = len(up) * (len(up) - 1)
+        return int(round(total - reachable))
+
+
+def check_scenarios(index, trials=100, max_failures=4, seed=0):
+    """
+    Run random multi-failure scenarios and check the index after each one.
+
+    Inside every scenario the table must match a search from scratch, and
+    after it the table and up flags must be exactly as before.
+
+    Args:
+        index (PathIndex): Index to exercise.
+        trials (int): Scenarios to run.
+        max_failures (int): Most switches and links failed per scenario.
+        seed (int): Random seed.
+
+    Returns:
+        list: Descriptions of the scenarios that failed a check (empty if all passed).
+    """
+    rng = random.Random(seed)
+    sources, targets, _ = index.topology.edges()
+    links = [(u, v) for u, v in zip(sources.tolist(), targets.tolist()) if v < index.switches]
+    before = (index.hops_table.copy(), index.node_up.copy(), index.link_up.copy())
+    problems = []
+    for trial in range(trials):
+        nodes = rng.sample(range(index.switches), rng.randint(0, min(max_failures, index.switches)))
+        failed = rng.sample(links, rng.randint(0, min(max_failures, len(links))))
+        with index.scenario(nodes, failed):
+            if not index.verify():
+                problems.append(f"scenario {trial} (nodes {nodes}, links {failed}): table differs from a full search")
+        if not (np.array_equal(index.hops_table, before[0]) and np.array_equal(index.node_up, before[1])
+                and np.array_equal(index.link_up, before[2])):
+            problems.append(f"scenario {trial} (nodes {nodes}, links {failed}): index not restored")
+            index.hops_table[:], index.node_up[:], index.link_up[:] = before
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check PathIndex scenarios against full searches.")
+    parser.add_argument("--cores", type=int, default=2)
+    parser.add_argument("--departments", type=int, default=3)
+    parser.add_argument("--floors", type=int, default=5)
+    parser.add_argument("--hosts", type=int, default=3)
+    parser.add_argument("--redundancy", type=int, default=1)
+    parser.add_argument("--trials", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    index = PathIndex(build_fabric(args.cores, args.departments, args.floors, args.hosts, args.redundancy))
+    problems = check_scenarios(index, args.trials, seed=args.seed)
+    for problem in problems:
+        print(problem)
+    print(f"{args.trials - len(problems)} of {args.trials} scenarios passed")
+    raise SystemExit(1 if problems else 0)
@@ -0,0 +1,551 @@
+import mmap
+import os
+import socket
+import struct
+import time
+from analysis_engine import PacketRecord
+from tcp_flows import TCPFlowTable
+
+# pcap / pcapng constants
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_PB = 0x00000002
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+
+_ETHERTYPE = struct.Struct("!H")
+_IPV4 = struct.Struct("!BBHHHBBH4s4s")
+_PORTS = struct.Struct("!HH")
+_TCP = struct.Struct("!HHIIBBH")
+_ICMP_ECHO = struct.Struct("!BBHHH")
+
+
+def _decode_transport(record, proto, data, offset):
+    """
+    Decode the TCP/UDP/ICMP header that starts at offset into record.
+    """
+    if proto == 6 and len(data) >= offset + 20:
+        sport, dport, seq, ack, data_offset, flags, window = _TCP.unpack_from(data, offset)
+        record.protocol = "TCP"
+        record.layers += ("tcp",)
+        record.sport = sport
+        record.dport = dport
+        record.tcp_seq = seq
+        record.tcp_ack = ack
+        record.tcp_flags = flags
+        record.tcp_window = window
+        return offset + (data_offset >> 4) * 4
+    if proto == 17 and len(data) >= offset + 8:
+        record.protocol = "UDP"
+        record.layers += ("udp",)
+        record.sport, record.dport = _PORTS.unpack_from(data, offset)
+        return offset + 8
+    if proto == 1 and len(data) >= offset + 4:
+        record.layers += ("icmp",)
+        icmp_type = data[offset]
+        record.icmp_type = icmp_type
+        if icmp_type in (0, 8) and len(data) >= offset + 8:
+            _, _, _, record.icmp_id, record.icmp_seq = _ICMP_ECHO.unpack_from(data, offset)
+        return offset + 8
+    return offset
+
+
+def decode_frame(timestamp, linktype, orig_len, data):
+    """
+    Decode the Ethernet/IPv4/IPv6 and TCP/UDP/ICMP headers of one frame.
+
+    Args:
+        timestamp (float): Capture time in epoch seconds.
+        linktype (int): Link-layer header type of the interface.
+        orig_len (int): Original frame length on the wire.
+        data (bytes): Captured frame bytes.
+
+    Returns:
+        PacketRecord: The decoded packet fields.
+    """
+    record = PacketRecord(timestamp, orig_len)
+    offset = 0
+
+    if linktype == LINKTYPE_ETHERNET:
+        if len(data) < 14:
+            return record
+        record.layers = ("eth",)
+        ethertype = _ETHERTYPE.unpack_from(data, 12)[0]
+        offset = 14
+        while ethertype in (0x8100, 0x88A8) and len(data) >= offset + 4:
+            record.layers += ("vlan",)
+            ethertype = _ETHERTYPE.unpack_from(data, offset + 2)[0]
+            offset += 4
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if len(data) < 16:
+            return record
+        record.layers = ("sll",)
+        ethertype = _ETHERTYPE.unpack_from(data, 14)[0]
+        offset = 16
+    elif linktype == LINKTYPE_RAW:
+        if not data:
+            return record
+        ethertype = 0x0800 if data[0] >> 4 == 4 else 0x86DD
+    else:
+        return record
+
+    if ethertype == 0x0800 and len(data) >= offset + 20:
+        version_ihl, _, total_length, _, frag, _, proto, _, src, dst = _IPV4.unpack_from(data, offset)
+        record.layers += ("ip",)
+        record.src = socket.inet_ntoa(src)
+        record.dst = socket.inet_ntoa(dst)
+        header_len = (version_ihl & 0x0F) * 4
+        # Only the first fragment carries the transport header
+        if frag & 0x1FFF == 0:
+            end = _decode_transport(record, proto, data, offset + header_len)
+            if record.protocol == "TCP":
+                record.tcp_len = max(0, min(total_length, len(data) - offset) - (end - offset))
+    elif ethertype == 0x86DD and len(data) >= offset + 40:
+        record.layers += ("ipv6",)
+        next_header = data[offset + 6]
+        payload_length = _ETHERTYPE.unpack_from(data, offset + 4)[0]
+        end = _decode_transport(record, next_header, data, offset + 40)
+        if record.protocol == "TCP":
+            record.tcp_len = max(0, min(payload_length + 40, len(data) - offset) - (end - offset))
+
+    return record
+
+
+def _pcap_header(buf):
+    magic = struct.unpack_from("<I", buf, 0)[0]
+    if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+        endian = "<"
+    else:
+        endian = ">"
+        magic = struct.unpack_from(">I", buf, 0)[0]
+    scale = 1e-9 if magic == PCAP_MAGIC_NS else 1e-6
+    snaplen, linktype = struct.unpack_from(endian + "II", buf, 16)
+    return endian, scale, linktype & 0x0FFFFFFF, snaplen
+
+
+def _iter_pcap(buf, offset=24, end=None):
+    endian, scale, linktype, _ = _pcap_header(buf)
+    header = struct.Struct(endian + "IIII")
+
+    size = len(buf)
+    end = size if end is None else end
+    while offset + 16 <= size and offset < end:
+        ts_sec, ts_frac, incl_len, orig_len = header.unpack_from(buf, offset)
+        offset += 16
+        yield ts_sec + ts_frac * scale, linktype, orig_len, buf[offset:offset + incl_len]
+        offset += incl_len
+
+
+def _parse_idb(buf, offset, block_len, endian):
+    linktype = struct.unpack_from(endian + "H", buf, offset + 8)[0]
+    resolution = 1e-6
+    ts_offset = 0
+    option = offset + 16
+    end = offset + block_len - 4
+    while option + 4 <= end:
+        code, length = struct.unpack_from(endian + "HH", buf, option)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            tsresol = buf[option + 4]
+            resolution = 2.0 ** -(tsresol & 0x7F) if tsresol & 0x80 else 10.0 ** -tsresol
+        elif code == 14 and length >= 8:
+            ts_offset = struct.unpack_from(endian + "q", buf, option + 4)[0]
+        option += 4 + ((length + 3) & ~3)
+    return linktype, resolution, ts_offset
+
+
+def _pcapng_section(buf):
+    # Parse the section header and interface descriptions up to the first packet block
+    endian = "<"
+    interfaces = []
+    offset = 0
+    size = len(buf)
+    while offset + 12 <= size:
+        block_type = struct.unpack_from("<I", buf, offset)[0]
+        if block_type == PCAPNG_SHB:
+            bom = struct.unpack_from("<I", buf, offset + 8)[0]
+            endian = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+            interfaces = []
+        else:
+            block_type = struct.unpack_from(endian + "I", buf, offset)[0]
+        if block_type in (PCAPNG_EPB, PCAPNG_SPB, PCAPNG_PB):
+            break
+        block_len = struct.unpack_from(endian + "I", buf, offset + 4)[0]
+        if block_len < 12:
+            break
+        if block_type == PCAPNG_IDB:
+            interfaces.append(_parse_idb(buf, offset, block_len, endian))
+        offset += block_len
+    return endian, interfaces, offset
+
+
+def _iter_pcapng(buf, offset=0, end=None, endian="<", interfaces=None):
+    interfaces = [] if interfaces is None else list(interfaces)
+    size = len(buf)
+    end = size if end is None else end
+    while offset + 12 <= size and offset < end:
+        block_type = struct.unpack_from("<I", buf, offset)[0]
+        if block_type == PCAPNG_SHB:
+            bom = struct.unpack_from("<I", buf, offset + 8)[0]
+            endian = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+            interfaces = []
+        else:
+            block_type = struct.unpack_from(endian + "I", buf, offset)[0]
+        block_len = struct.unpack_from(endian + "I", buf, offset + 4)[0]
+        if block_len < 12 or offset + block_len > size:
+            break
+
+        if block_type == PCAPNG_IDB:
+            interfaces.append(_parse_idb(buf, offset, block_len, endian))
+        else:
+            frame = _pcapng_packet(buf, offset, block_type, block_len, endian, interfaces)
+            if frame is not None:
+                yield frame
+
+        offset += block_len
+
+
+def _pcapng_packet(buf, offset, block_type, block_len, endian, interfaces):
+    # Frame tuple for an EPB/SPB/PB block, None for any other block type
+    if block_type == PCAPNG_EPB:
+        iface, ts_high, ts_low, cap_len, orig_len = struct.unpack_from(endian + "IIIII", buf, offset + 8)
+        linktype, resolution, ts_offset = interfaces[iface]
+        timestamp = ((ts_high << 32) | ts_low) * resolution + ts_offset
+        return timestamp, linktype, orig_len, buf[offset + 28:offset + 28 + cap_len]
+    if block_type == PCAPNG_SPB and interfaces:
+        orig_len = struct.unpack_from(endian + "I", buf, offset + 8)[0]
+        cap_len = min(orig_len, block_len - 16)
+        return 0.0, interfaces[0][0], orig_len, buf[offset + 12:offset + 12 + cap_len]
+    if block_type == PCAPNG_PB:
+        iface, _, ts_high, ts_low, cap_len, orig_len = struct.unpack_from(endian + "HHIIII", buf, offset + 8)
+        linktype, resolution, ts_offset = interfaces[iface]
+        timestamp = ((ts_high << 32) | ts_low) * resolution + ts_offset
+        return timestamp, linktype, orig_len, buf[offset + 28:offset + 28 + cap_len]
+    return None
+
+
+class StreamDecoder:
+    """
+    Incremental pcap/pcapng parser for growing files and byte streams.
+
+    Bytes are fed as they arrive; every complete block is returned as a
+    frame and a trailing partial block is kept until the rest is fed.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.format = None
+        self.endian = "<"
+        self.interfaces = []
+        self.pcap_header = None
+        self.linktype = None
+        self.scale = 1e-6
+
+    def feed(self, data):
+        """
+        Parse newly arrived bytes.
+
+        Args:
+            data (bytes): The next chunk of the capture.
+
+        Returns:
+            list: (timestamp, linktype, orig_len, data) frames completed by this chunk.
+        """
+        self.buffer += data
+        frames = []
+        offset = self._read_header()
+        if self.format == "pcapng":
+            offset = self._drain_pcapng(offset, frames)
+        elif self.format == "pcap":
+            offset = self._drain_pcap(offset, frames)
+        del self.buffer[:offset]
+        return frames
+
+    def _read_header(self):
+        buf = self.buffer
+        if self.format is not None or len(buf) < 24:
+            return 0
+        magic = struct.unpack_from("<I", buf, 0)[0]
+        if magic == PCAPNG_SHB:
+            self.format = "pcapng"
+            return 0
+        if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS) or struct.unpack_from(">I", buf, 0)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            self.format = "pcap"
+            endian, self.scale, self.linktype, _ = _pcap_header(buf)
+            self.pcap_header = struct.Struct(endian + "IIII")
+            return 24
+        raise ValueError("stream is not a pcap or pcapng capture")
+
+    def _drain_pcap(self, offset, frames):
+        buf = self.buffer
+        size = len(buf)
+        while offset + 16 <= size:
+            ts_sec, ts_frac, incl_len, orig_len = self.pcap_header.unpack_from(buf, offset)
+            if offset + 16 + incl_len > size:
+                break
+            frames.append((ts_sec + ts_frac * self.scale, self.linktype, orig_len,
+                           bytes(buf[offset + 16:offset + 16 + incl_len])))
+            offset += 16 + incl_len
+        return offset
+
+    def _drain_pcapng(self, offset, frames):
+        buf = self.buffer
+        size = len(buf)
+        while offset + 12 <= size:
+            block_type = struct.unpack_from("<I", buf, offset)[0]
+            if block_type == PCAPNG_SHB:
+                bom = struct.unpack_from("<I", buf, offset + 8)[0]
+                self.endian = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+                self.interfaces = []
+            else:
+                block_type = struct.unpack_from(self.endian + "I", buf, offset)[0]
+            block_len = struct.unpack_from(self.endian + "I", buf, offset + 4)[0]
+            if block_len < 12 or offset + block_len > size:
+                break
+            block = bytes(buf[offset:offset + block_len])
+            if block_type == PCAPNG_IDB:
+                self.interfaces.append(_parse_idb(block, 0, block_len, self.endian))
+            else:
+                frame = _pcapng_packet(block, 0, block_type, block_len, self.endian, self.interfaces)
+                if frame is not None:
+                    frames.append(frame)
+            offset += block_len
+        return offset
+
+
+_PCAPNG_BLOCK_TYPES = {PCAPNG_SHB, PCAPNG_IDB, PCAPNG_PB, PCAPNG_SPB, 0x00000004, 0x00000005,
+                       PCAPNG_EPB, 0x0000000A, 0x00000BAD, 0x40000BAD}
+
+RESYNC_CHAIN = 4  # Consecutive valid blocks required to accept a resync point
+PCAP_MAX_SPAN = 366 * 86400  # Seconds after the first record a pcap timestamp may fall
+
+
+def _pcapng_block_len(buf, offset, endian):
+    # Length of a plausible pcapng block at offset (the trailing length must match), else 0
+    size = len(buf)
+    if offset + 12 > size:
+        return 0
+    block_type, block_len = struct.unpack_from(endian + "II", buf, offset)
+    if block_type not in _PCAPNG_BLOCK_TYPES or block_len < 12 or block_len % 4 or offset + block_len > size:
+        return 0
+    if struct.unpack_from(endian + "I", buf, offset + block_len - 4)[0] != block_len:
+        return 0
+    return block_len
+
+
+def _pcap_record_len(buf, offset, header, snaplen, max_frac, first_sec):
+    # Length of a plausible classic pcap record at offset, else 0
+    size = len(buf)
+    if offset + 16 > size:
+        return 0
+    ts_sec, ts_frac, incl_len, orig_len = header.unpack_from(buf, offset)
+    if ts_frac >= max_frac or not first_sec <= ts_sec < first_sec + PCAP_MAX_SPAN:
+        return 0
+    # Writers store min(orig_len, snaplen) bytes per frame
+    if incl_len != min(orig_len, snaplen or orig_len) or offset + 16 + incl_len > size:
+        return 0
+    return 16 + incl_len
+
+
+def _next_boundary(buf, offset, step, record_len):
+    # First offset >= offset that starts a chain of RESYNC_CHAIN valid records
+    size = len(buf)
+    while offset < size:
+        position = offset
+        for _ in range(RESYNC_CHAIN):
+            if position == size:
+                break
+            length = record_len(position)
+            if not length:
+                break
+            position += length
+        else:
+            return offset
+        if position == size:
+            return offset
+        offset += step
+    return size
+
+
+def split_capture(pcap_file, shards, warmup_bytes=0):
+    """
+    Split the packet data of a capture into byte ranges that start on block boundaries.
+
+    Boundaries are found by resynchronizing at evenly spaced offsets: a
+    candidate is accepted once several consecutive blocks (pcapng) or record
+    headers (pcap) validate, so no frame is split or read twice.
+
+    Args:
+        pcap_file (str): Path to the input .pcap/.pcapng file.
+        shards (int): Number of byte ranges to produce.
+        warmup_bytes (int): Bytes before each range to replay for protocol state only.
+
+    Returns:
+        list: (warmup_start, start, end) offset tuples, in file order.
+    """
+    with open(pcap_file, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            if struct.unpack_from("<I", mm, 0)[0] == PCAPNG_SHB:
+                endian, _, first = _pcapng_section(mm)
+                step = 4
+                record_len = lambda offset: _pcapng_block_len(mm, offset, endian)
+            else:
+                endian, scale, _, snaplen = _pcap_header(mm)
+                header = struct.Struct(endian + "IIII")
+                max_frac = 1000000000 if scale == 1e-9 else 1000000
+                first = 24
+                first_sec = header.unpack_from(mm, first)[0] if size >= first + 16 else 0
+                step = 1
+                record_len = lambda offset: _pcap_record_len(mm, offset, header, snaplen, max_frac, first_sec)
+
+            def boundary(offset):
+                if offset <= first:
+                    return first
+                if step == 4:
+                    offset = (offset + 3) & ~3
+                return _next_boundary(mm, offset, step, record_len)
+
+            span = size - first
+            starts = sorted({boundary(first + span * i // shards) for i in range(shards)})
+            ends = starts[1:] + [size]
+            return [(boundary(start - warmup_bytes) if warmup_bytes and start > first else start, start, end)
+                    for start, end in zip(starts, ends) if start < end]
+
+
+def iter_frames(pcap_file, start=None, end=None):
+    """
+    Iterate over the raw frames of a pcap or pcapng file without tshark.
+
+    Args:
+        pcap_file (str): Path to the input .pcap/.pcapng file.
+        start (int, optional): Byte offset of the first block to read (a
+            boundary returned by split_capture). Defaults to the first packet.
+        end (int, optional): Stop before blocks starting at or after this offset.
+
+    Yields:
+        tuple: (timestamp, linktype, orig_len, data) for each captured frame.
+    """
+    with open(pcap_file, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic = struct.unpack_from("<I", mm, 0)[0]
+            if magic == PCAPNG_SHB:
+                if start is None:
+                    yield from _iter_pcapng(mm, 0, end)
+                else:
+                    endian, interfaces, _ = _pcapng_section(mm)
+                    yield from _iter_pcapng(mm, start, end, endian, interfaces)
+            elif magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS) or struct.unpack_from(">I", mm, 0)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                yield from _iter_pcap(mm, 24 if start is None else start, end)
+            else:
+                raise ValueError(f"{pcap_file} is not a pcap or pcapng file")
+
+
+def complete_end(pcap_file, start=None):
+    """
+    Offset just past the last complete block (pcapng) or record (pcap).
+
+    A capture that is still being written may end in a partial block;
+    reading up to this offset never yields a truncated frame.
+
+    Args:
+        pcap_file (str): Path to the .pcap/.pcapng file.
+        start (int, optional): Block boundary to scan from. Defaults to the first packet.
+
+    Returns:
+        int: End offset of the complete packet data.
+    """
+    with open(pcap_file, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 24:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if struct.unpack_from("<I", mm, 0)[0] == PCAPNG_SHB:
+                endian, _, first = _pcapng_section(mm)
+                offset = first if start is None else start
+                while offset + 12 <= size:
+                    block_len = struct.unpack_from(endian + "I", mm, offset + 4)[0]
+                    if block_len < 12 or offset + block_len > size:
+                        break
+                    offset += block_len
+            else:
+                endian = _pcap_header(mm)[0]
+                offset = 24 if start is None else start
+                while offset + 16 <= size:
+                    incl_len = struct.unpack_from(endian + "I", mm, offset + 8)[0]
+                    if offset + 16 + incl_len > size:
+                        break
+                    offset += 16 + incl_len
+            return offset
+
+
+def read_records(pcap_file, start=None, end=None, warmup_start=None, tcp_flows=None):
+    """
+    Decode every packet of a capture into PacketRecords without tshark.
+
+    Args:
+        pcap_file (str): Path to the input .pcap/.pcapng file.
+        start (int, optional): Byte offset of the first block to decode.
+        end (int, optional): Stop before blocks starting at or after this offset.
+        warmup_start (int, optional): Earlier block offset from which TCP flow
+            state is rebuilt (without yielding records) so that retransmissions
+            and RTT samples near start are detected as in a serial pass.
+        tcp_flows (TCPFlowTable, optional): Flow table to continue from, e.g.
+            one saved after reading an earlier part of the same capture.
+
+    Yields:
+        PacketRecord: One decoded record per captured frame.
+    """
+    tcp_flows = TCPFlowTable() if tcp_flows is None else tcp_flows
+    if warmup_start is not None and start is not None and warmup_start < start:
+        for timestamp, linktype, orig_len, data in iter_frames(pcap_file, warmup_start, start):
+            record = decode_frame(timestamp, linktype, orig_len, data)
+            if record.protocol == "TCP":
+                tcp_flows.annotate(record)
+
+    for timestamp, linktype, orig_len, data in iter_frames(pcap_file, start, end):
+        record = decode_frame(timestamp, linktype, orig_len, data)
+        if record.protocol == "TCP":
+            tcp_flows.annotate(record)
+        yield record
+
+
+def tail_records(pcap_file, poll_interval=0.5, idle_timeout=None, chunk_size=1 << 20):
+    """
+    Follow a growing capture file and yield PacketRecords as packets are written.
+
+    Args:
+        pcap_file (str): Path to the capture being written (e.g. by tshark -w or tcpdump -w).
+        poll_interval (float): Seconds to wait when no new bytes are available.
+        idle_timeout (float, optional): Stop after this many seconds without new
+            data. None follows the file forever.
+        chunk_size (int): Maximum bytes read per poll.
+
+    Yields:
+        PacketRecord: One decoded record per newly completed frame.
+    """
+    decoder = StreamDecoder()
+    tcp_flows = TCPFlowTable()
+    last_data = time.monotonic()
+    with open(pcap_file, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                if idle_timeout is not None and time.monotonic() - last_data >= idle_timeout:
+                    return
+                time.sleep(poll_interval)
+                continue
+            last_data = time.monotonic()
+            for timestamp, linktype, orig_len, frame in decoder.feed(data):
+                record = decode_frame(timestamp, linktype, orig_len, frame)
+                if record.protocol == "TCP":
+                    tcp_flows.annotate(record)
+                yield record
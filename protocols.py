@@ -0,0 +1,67 @@
+import functools
+import socket
+import struct
+
+# IP protocol numbers used as compact per-packet protocol codes
+PROTO_OTHER = 0
+PROTO_ICMP = 1
+PROTO_TCP = 6
+PROTO_UDP = 17
+
+PROTOCOL_NAMES = {PROTO_ICMP: "ICMP", PROTO_TCP: "TCP", PROTO_UDP: "UDP"}
+PROTOCOL_CODES = {name: code for code, name in PROTOCOL_NAMES.items()}
+
+# Transport-layer names as reported by pyshark (ICMP has no transport layer)
+TRANSPORT_NAMES = {PROTO_TCP: "TCP", PROTO_UDP: "UDP"}
+
+NO_ADDRESS = 0  # Stored for packets without an IPv4 header ("N/A")
+
+
+@functools.lru_cache(maxsize=65536)
+def ip_to_int(address):
+    """
+    Convert a dotted IPv4 address to its uint32 value.
+
+    Args:
+        address (str): IPv4 address, or None.
+
+    Returns:
+        int: The address as an integer, or NO_ADDRESS for None.
+    """
+    if address is None:
+        return NO_ADDRESS
+    return struct.unpack("!I", socket.inet_aton(address))[0]
+
+
+def int_to_ip(value):
+    """
+    Convert a uint32 IPv4 value back to dotted notation.
+
+    Args:
+        value (int): Address as an integer.
+
+    Returns:
+        str: The dotted address, or "N/A" for NO_ADDRESS.
+    """
+    if value == NO_ADDRESS:
+        return "N/A"
+    return socket.inet_ntoa(struct.pack("!I", int(value)))
+
+
+def protocol_code(record):
+    """
+    Map a PacketRecord to its uint8 protocol code.
+
+    Args:
+        record (PacketRecord): The packet to classify.
+
+    Returns:
+        int: PROTO_TCP, PROTO_UDP, PROTO_ICMP or PROTO_OTHER.
+    """
+    if record.protocol == "TCP":
+        return PROTO_TCP
+    if record.protocol == "UDP":
+        return PROTO_UDP
+    if "icmp" in record.layers:
+        return PROTO_ICMP
+    return PROTO_OTHER
@@ -1,49 +1,177 @@
 import sqlite3
+from instrumentation import instruments
+from protocols import PROTOCOL_CODES, PROTOCOL_NAMES, int_to_ip, ip_to_int
 
-def query_database(protocol=None, min_length=None, max_length=None):
+def build_query(protocol=None, min_length=None, max_length=None, start_time=None, end_time=None,
+                source=None, destination=None, count_only=False):
     """
-    Query the database with different combinations of protocol and length.
+    Build the SQL and parameters for a traffic_records query.
+
+    The filters map onto the (protocol, length), time, source and destination
+    indexes so SQLite can answer them without a full table scan.
 
     Args:
         protocol (str, optional): The protocol to filter by (e.g., "UDP", "TCP", "ICMP").
         min_length (int, optional): The minimum packet length to filter by.
         max_length (int, optional): The maximum packet length to filter by.
+        start_time (float, optional): Earliest epoch timestamp to include.
+        end_time (float, optional): Latest epoch timestamp to include.
+        source (str, optional): Source IPv4 address to filter by.
+        destination (str, optional): Destination IPv4 address to filter by.
+        count_only (bool): Select COUNT(*) instead of the matching rows.
+
+    Returns:
+        tuple: (query, params).
+    """
+    if count_only:
+        query = "SELECT COUNT(*) FROM traffic_records WHERE 1=1"
+    else:
+        query = "SELECT time, protocol, length, source, destination FROM traffic_records WHERE 1=1"
+    params = []
+
+    if protocol:
+        query += " AND protocol = ?"
+        params.append(PROTOCOL_CODES.get(protocol.upper(), -1))
+
+    if min_length is not None:
+        query += " AND length >= ?"
+        params.append(min_length)
+
+    if max_length is not None:
+        query += " AND length <= ?"
+        params.append(max_length)
+
+    if start_time is not None:
+        query += " AND time >= ?"
+        params.append(start_time)
+
+    if end_time is not None:
+        query += " AND time <= ?"
+        params.append(end_time)
+
+    if source is not None:
+        query += " AND source = ?"
+        params.append(ip_to_int(source))
+
+    if destination is not None:
+        query += " AND destination = ?"
+        params.append(ip_to_int(destination))
+
+    return query, params
+
+def decode_row(row):
     """
+    Convert a numeric traffic_records row into readable values.
+
+    Args:
+        row (tuple): (time, protocol, length, source, destination) as stored.
+
+    Returns:
+        tuple: (time, protocol name, length, source, destination) with dotted addresses.
+    """
+    time, protocol, length, source, destination = row
+    return time, PROTOCOL_NAMES.get(protocol, "Other"), length, int_to_ip(source), int_to_ip(destination)
+
+def stream_query(query, params, batch_size=1000, db_name="network_data.db"):
+    """
+    Yield decoded rows for a query using fetchmany instead of fetchall.
+
+    Args:
+        query (str): SQL query built by build_query.
+        params (list): Query parameters.
+        batch_size (int): Rows fetched per round trip.
+        db_name (str): Path to the SQLite database.
+
+    Yields:
+        tuple: Decoded rows (see decode_row).
+    """
+    conn = sqlite3.connect(db_name)
     try:
-        conn = sqlite3.connect("network_data.db")  # Adjust to your database name
         cursor = conn.cursor()
+        cursor.execute(query, params)
+        while True:
+            with instruments.stage("sqlite_query"):
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            instruments.count("rows_fetched", len(rows))
+            for row in rows:
+                yield decode_row(row)
+    finally:
+        conn.close()
 
-        # Build the query dynamically based on provided parameters
-        query = "SELECT * FROM traffic_records WHERE 1=1"
-        params = []
+def explain_query(protocol=None, min_length=None, max_length=None, db_name="network_data.db", **filters):
+    """
+    Show SQLite's query plan for a set of filters.
+
+    Args:
+        protocol (str, optional): The protocol to filter by.
+        min_length (int, optional): The minimum packet length to filter by.
+        max_length (int, optional): The maximum packet length to filter by.
+        db_name (str): Path to the SQLite database.
+        **filters: Additional build_query filters (start_time, end_time, source, destination).
+
+    Returns:
+        list: Plan detail strings, e.g. "SEARCH traffic_records USING INDEX ...".
+    """
+    query, params = build_query(protocol, min_length, max_length, count_only=True, **filters)
+    conn = sqlite3.connect(db_name)
+    try:
+        return [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+    finally:
+        conn.close()
+
+def query_database(protocol=None, min_length=None, max_length=None, mode="count", db_name="network_data.db", **filters):
+    """
+    Query the database with different combinations of protocol and length.
 
-        if protocol:
-            query += " AND protocol = ?"
-            params.append(protocol)
+    Args:
+        protocol (str, optional): The protocol to filter by (e.g., "UDP", "TCP", "ICMP").
+        min_length (int, optional): The minimum packet length to filter by.
+        max_length (int, optional): The maximum packet length to filter by.
+        mode (str): "count" to only count matches, "stream" to return a row
+            generator backed by a cursor, or "rows" to fetch all rows.
+        db_name (str): Path to the SQLite database.
+        **filters: Additional build_query filters (start_time, end_time, source, destination).
 
-        if min_length is not None:
-            query += " AND length >= ?"
-            params.append(min_length)
+    Returns:
+        int, generator or list: Match count, row generator or row list depending on mode.
+    """
+    if mode == "stream":
+        query, params = build_query(protocol, min_length, max_length, **filters)
+        print("Executing query:", query)
+        return stream_query(query, params, db_name=db_name)
 
-        if max_length is not None:
-            query += " AND length <= ?"
-            params.append(max_length)
+    try:
+        conn = sqlite3.connect(db_name)  # Adjust to your database name
+        cursor = conn.cursor()
+
+        # Build the query dynamically based on provided parameters
+        query, params = build_query(protocol, min_length, max_length, count_only=(mode == "count"), **filters)
 
         print("Executing query:", query)
-        cursor.execute(query, params)
-        results = cursor.fetchall()
+        with instruments.stage("sqlite_query"):
+            cursor.execute(query, params)
+
+            if mode == "count":
+                count = cursor.fetchone()[0]
+                results = None
+            else:
+                results = [decode_row(row) for row in cursor.fetchall()]
+                count = len(results)
+                instruments.count("rows_fetched", count)
 
         # Display results
-        if results:
+        if count:
             print("\nQuery Results:")
-            #for row in results:
-                #print(f"Time: {row[0]}, Protocol: {row[1]}, Length: {row[2]}, Source: {row[3]}, Destination: {row[4]}")
-            print(f"\n{len(results)} records found for the given parameters.")
+            print(f"\n{count} records found for the given parameters.")
         else:
             print("\nNo records found for the given parameters.")
 
+        return count if results is None else results
     except sqlite3.Error as e:
         print(f"Database error: {e}")
+        return 0 if mode == "count" else []
     finally:
         conn.close()
 
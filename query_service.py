@@ -0,0 +1,391 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+from query_databse import build_query, decode_row
+
+DEFAULT_HOST = "127.0.0.1"   # Serve on loopback only
+DEFAULT_PORT = 8765
+DEFAULT_POOL_SIZE = 8        # Read-only connections, i.e. queries running at once
+DEFAULT_CACHE_ENTRIES = 1024  # Query results kept by the LRU cache
+DEFAULT_LIMIT = 10000        # Rows returned by /records unless a limit is given
+STATEMENT_CACHE = 256        # Prepared statements kept per connection
+BUSY_TIMEOUT = 5.0           # Seconds a connection waits on a locked database
+
+COLUMNS = ("time", "protocol", "length", "source", "destination")
+
+# Query string parameter -> (build_query filter, type)
+FILTERS = {
+    "protocol": ("protocol", str),
+    "min_length": ("min_length", int),
+    "max_length": ("max_length", int),
+    "start": ("start_time", float),
+    "end": ("end_time", float),
+    "source": ("source", str),
+    "destination": ("destination", str),
+}
+
+
+def _read_only_uri(db_name):
+    return f"file:{quote(os.path.abspath(db_name))}?mode=ro"
+
+
+class ConnectionPool:
+    """
+    Fixed pool of read-only SQLite connections shared by worker threads.
+
+    The database is switched to WAL journaling once, so any number of
+    pooled readers run alongside the single writer (the ingestor) without
+    blocking it or each other. Each connection keeps its own prepared
+    statement cache, so the parameterized queries from build_query are
+    compiled once per connection rather than once per request.
+    """
+
+    def __init__(self, db_name="network_data.db", size=DEFAULT_POOL_SIZE, wal=True):
+        """
+        Args:
+            db_name (str): Path to the SQLite database (must exist).
+            size (int): Number of connections.
+            wal (bool): Switch the database to WAL journal mode first.
+        """
+        if not os.path.exists(db_name):
+            raise FileNotFoundError(db_name)
+        if wal:
+            conn = sqlite3.connect(db_name, timeout=BUSY_TIMEOUT)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            finally:
+                conn.close()
+        self.size = size
+        self.idle = queue.Queue()
+        for _ in range(size):
+            conn = sqlite3.connect(_read_only_uri(db_name), uri=True, timeout=BUSY_TIMEOUT,
+                                   check_same_thread=False, cached_statements=STATEMENT_CACHE)
+            conn.execute("PRAGMA query_only=ON")
+            self.idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection, waiting while all of them are busy.
+        """
+        conn = self.idle.get()
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+    def close(self):
+        for _ in range(self.size):
+            self.idle.get().close()
+
+
+class QueryCache:
+    """
+    LRU cache of query results, cleared whenever the database changes.
+
+    A dedicated read-only connection polls PRAGMA data_version, which
+    changes whenever another connection commits, so any ingestion (from
+    this process or another) invalidates the cache on the next lookup.
+    Results computed against an older version are never stored.
+    """
+
+    def __init__(self, db_name="network_data.db", max_entries=DEFAULT_CACHE_ENTRIES):
+        """
+        Args:
+            db_name (str): Path to the SQLite database.
+            max_entries (int): Results kept before the least recently used is dropped.
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.watch = sqlite3.connect(_read_only_uri(db_name), uri=True, check_same_thread=False)
+        self.version = self._data_version()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _data_version(self):
+        return self.watch.execute("PRAGMA data_version").fetchone()[0]
+
+    def _refresh(self):
+        # Drop every entry if the database changed since the last lookup
+        version = self._data_version()
+        if version != self.version:
+            self.version = version
+            if self.entries:
+                self.entries.clear()
+                self.invalidations += 1
+
+    def get(self, key):
+        """
+        Look up a result.
+
+        Returns:
+            tuple: (result or None, version to pass to put()).
+        """
+        with self.lock:
+            self._refresh()
+            result = self.entries.get(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return result, self.version
+
+    def put(self, key, result, version):
+        """
+        Store a result computed at version, unless the database has changed since.
+        """
+        with self.lock:
+            self._refresh()
+            if version != self.version or self.max_entries <= 0:
+                return
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+
+    def close(self):
+        self.watch.close()
+
+
+class QueryService:
+    """
+    Concurrent traffic_records queries over a connection pool with a result cache.
+
+    count() and records() take the build_query filters and are safe to call
+    from many threads; serve() exposes them over localhost HTTP as JSON (or
+    Arrow IPC when pyarrow is installed).
+    """
+
+    def __init__(self, db_name="network_data.db", pool_size=DEFAULT_POOL_SIZE, cache_entries=DEFAULT_CACHE_ENTRIES,
+                 wal=True):
+        """
+        Args:
+            db_name (str): Path to the SQLite database.
+            pool_size (int): Read-only connections.
+            cache_entries (int): Query results kept in the cache (0 disables it).
+            wal (bool): Switch the database to WAL journal mode.
+        """
+        self.db_name = db_name
+        self.pool = ConnectionPool(db_name, pool_size, wal)
+        self.cache = QueryCache(db_name, cache_entries)
+
+    def _run(self, query, params, decode=False):
+        key = (query, tuple(params))
+        result, version = self.cache.get(key)
+        if result is not None:
+            return result
+        with self.pool.connection() as conn:
+            result = conn.execute(query, params).fetchall()
+        if decode:
+            result = [decode_row(row) for row in result]
+        self.cache.put(key, result, version)
+        return result
+
+    def count(self, protocol=None, min_length=None, max_length=None, **filters):
+        """
+        Number of records matching the filters.
+
+        Args:
+            protocol, min_length, max_length, **filters: build_query filters.
+
+        Returns:
+            int: Matching records.
+        """
+        query, params = build_query(protocol, min_length, max_length, count_only=True, **filters)
+        return self._run(query, params)[0][0]
+
+    def records(self, protocol=None, min_length=None, max_length=None, limit=DEFAULT_LIMIT, **filters):
+        """
+        Records matching the filters, decoded (see query_databse.decode_row).
+
+        Args:
+            protocol, min_length, max_length, **filters: build_query filters.
+            limit (int, optional): Maximum rows; None returns every match.
+
+        Returns:
+            list: (time, protocol, length, source, destination) tuples.
+        """
+        query, params = build_query(protocol, min_length, max_length, **filters)
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        return self._run(query, params, decode=True)
+
+    def invalidate(self):
+        """
+        Drop every cached result (the cache also notices commits by itself).
+        """
+        self.cache.invalidate()
+
+    def stats(self):
+        """
+        Pool and cache counters.
+        """
+        cache = self.cache
+        return {
+            "db_name": self.db_name,
+            "pool_size": self.pool.size,
+            "idle_connections": self.pool.idle.qsize(),
+            "cache_entries": len(cache.entries),
+            "cache_hits": cache.hits,
+            "cache_misses": cache.misses,
+            "cache_invalidations": cache.invalidations,
+        }
+
+    def close(self):
+        self.pool.close()
+        self.cache.close()
+
+
+def to_json(rows):
+    """
+    Encode decoded records as {"columns": [...], "rows": [[...], ...]} JSON bytes.
+    """
+    return json.dumps({"columns": COLUMNS, "rows": rows}).encode()
+
+
+def to_arrow(rows):
+    """
+    Encode decoded records as an Arrow IPC stream (requires pyarrow).
+    """
+    import pyarrow as pa
+
+    columns = list(zip(*rows)) if rows else [()] * len(COLUMNS)
+    table = pa.table({
+        "time": pa.array(columns[0], pa.float64()),
+        "protocol": pa.array(columns[1], pa.string()),
+        "length": pa.array(columns[2], pa.int64()),
+        "source": pa.array(columns[3], pa.string()),
+        "destination": pa.array(columns[4], pa.string()),
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def parse_filters(params):
+    """
+    Convert parsed URL query parameters (from parse_qs) into build_query filters.
+
+    Raises:
+        ValueError: For unknown parameters or values of the wrong type.
+    """
+    filters = {}
+    for name, values in params.items():
+        if name not in FILTERS:
+            raise ValueError(f"Unknown parameter: {name}")
+        target, kind = FILTERS[name]
+        filters[target] = kind(values[-1])
+    return filters
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    HTTP front end of a QueryService (set as the server's service attribute).
+
+    GET /count?protocol=UDP&min_length=50 returns {"count": n};
+    GET /records?...&limit=100&format=json|arrow returns the rows;
+    GET /stats returns the pool and cache counters;
+    POST /invalidate drops the cached results.
+    """
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({"error": message}).encode())
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        try:
+            fmt = params.pop("format", ["json"])[-1]
+            limit = params.pop("limit", [DEFAULT_LIMIT])[-1]
+            filters = parse_filters(params)
+            if url.path == "/count":
+                self._send(200, json.dumps({"count": service.count(**filters)}).encode())
+            elif url.path == "/records":
+                rows = service.records(limit=int(limit), **filters)
+                if fmt == "arrow":
+                    self._send(200, to_arrow(rows), "application/vnd.apache.arrow.stream")
+                elif fmt == "json":
+                    self._send(200, to_json(rows))
+                else:
+                    self._error(400, f"Unknown format: {fmt}")
+            elif url.path == "/stats":
+                self._send(200, json.dumps(service.stats()).encode())
+            else:
+                self._error(404, f"Unknown path: {url.path}")
+        except (ValueError, OSError) as e:
+            self._error(400, str(e))
+        except ImportError:
+            self._error(400, "Arrow output requires pyarrow")
+        except sqlite3.Error as e:
+            self._error(500, f"Database error: {e}")
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/invalidate":
+            self._error(404, f"Unknown path: {self.path}")
+            return
+        self.server.service.invalidate()
+        self._send(200, b'{"invalidated": true}')
+
+    def log_message(self, format, *args):
+        pass  # Dashboards poll often; keep the console quiet
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Create a threaded HTTP server for a QueryService (port 0 picks a free port).
+
+    Returns:
+        ThreadingHTTPServer: Call serve_forever() to run it.
+    """
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve(db_name="network_data.db", host=DEFAULT_HOST, port=DEFAULT_PORT, pool_size=DEFAULT_POOL_SIZE,
+          cache_entries=DEFAULT_CACHE_ENTRIES):
+    """
+    Run the query service until interrupted.
+
+    Args:
+        db_name (str): Path to the SQLite database.
+        host (str): Address to listen on.
+        port (int): TCP port.
+        pool_size (int): Read-only connections.
+        cache_entries (int): Query results kept in the cache.
+    """
+    service = QueryService(db_name, pool_size, cache_entries)
+    server = make_server(service, host, port)
+    print(f"Serving {db_name} on http://{host}:{server.server_address[1]} ({pool_size} connections)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,238 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+DEFAULT_DPI = 100            # Resolution of saved raster figures (matplotlib's default)
+DEFAULT_FORMAT = "png"       # Saved figure format ("png" or "svg")
+CHUNKS_PER_WORKER = 4        # Scenario chunks per worker in a batch render
+PNG_COMPRESSION = 1          # zlib level of batch-rendered PNGs (fast, slightly larger files)
+RASTER_FORMATS = (".png",)   # Extensions render_many() draws over a cached background
+TOPOLOGY_FIGSIZE = (18, 12)  # Inches, as in the original topology plots
+
+
+def headless():
+    """
+    Switch matplotlib to the non-interactive Agg backend.
+
+    Call before plotting on servers without a display; figures are then
+    only written to disk (see finish()).
+    """
+    import matplotlib
+
+    matplotlib.use("Agg", force=True)
+
+
+def finish(fig, output=None, dpi=DEFAULT_DPI):
+    """
+    Show a figure, or write it to disk and free it.
+
+    Args:
+        fig (matplotlib.figure.Figure): Finished figure.
+        output (str, optional): Path to write; the format follows its
+            extension (.png, .svg, ...). Without it the figure is shown.
+        dpi (int): Resolution of raster output.
+
+    Returns:
+        str: output, or None when the figure was shown.
+    """
+    import matplotlib.pyplot as plt
+
+    if output is None:
+        plt.show()
+        return None
+    fig.savefig(output, dpi=dpi)
+    plt.close(fig)
+    return output
+
+
+class TopologyRenderer:
+    """
+    Draws a topology, and failure scenarios of it, from one cached layout.
+
+    The layered (multipartite) layout is computed once, and node positions
+    and edge segments are kept as NumPy arrays. A scenario is drawn from
+    them with a single LineCollection and scatter call instead of one patch
+    per edge, with failed elements in red (or hidden), so the graph is
+    never copied or modified and every scenario shares the same node
+    positions. Renderers pickle cheaply for render_scenarios() workers.
+    """
+
+    def __init__(self, graph, subset_key="layer", labels=True, figsize=TOPOLOGY_FIGSIZE):
+        """
+        Args:
+            graph (nx.Graph): Topology to lay out (intact, before failures).
+            subset_key (str): Node attribute giving each node's layer.
+            labels (bool): Draw node names.
+            figsize (tuple): Figure size in inches.
+        """
+        import networkx as nx
+
+        positions = nx.multipartite_layout(graph, subset_key=subset_key)
+        self.nodes = list(graph)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        self.xy = np.array([positions[node] for node in self.nodes], dtype=np.float64).reshape(-1, 2)
+        self.edges = list(graph.edges())
+        self.edge_index = {edge: i for i, edge in enumerate(self.edges)}
+        ends = np.array([(self.index[u], self.index[v]) for u, v in self.edges], dtype=np.int64).reshape(-1, 2)
+        self.ends = ends
+        self.segments = self.xy[ends]  # (edges, 2 endpoints, 2 coordinates)
+        self.labels = labels
+        self.figsize = figsize
+
+    def _failed_edges(self, edges):
+        # Accept either direction, as links are drawn without arrows
+        failed = np.zeros(len(self.edges), dtype=bool)
+        for u, v in edges:
+            index = self.edge_index.get((u, v), self.edge_index.get((v, u)))
+            if index is not None:
+                failed[index] = True
+        return failed
+
+    def render(self, output=None, title="Financial Data Center Network Topology", failed_nodes=(), failed_edges=(),
+               show_failed=True, dpi=DEFAULT_DPI):
+        """
+        Draw the topology with some nodes and edges failed.
+
+        Args:
+            output (str, optional): Path to write (see finish()); shown if omitted.
+            title (str): Figure title.
+            failed_nodes (iterable): Failed nodes; their edges fail with them.
+            failed_edges (iterable): Failed (u, v) edges.
+            show_failed (bool): Draw failed elements in red instead of hiding them.
+            dpi (int): Resolution of raster output.
+
+        Returns:
+            str: output, or None when the figure was shown.
+        """
+        import matplotlib.pyplot as plt
+
+        down, cut = self._failed(failed_nodes, failed_edges)
+        fig, ax = plt.subplots(figsize=self.figsize)
+        self._draw(ax, down, cut, show_failed)
+        ax.set_title(title, fontsize=14)
+        return finish(fig, output, dpi)
+
+    def _failed(self, failed_nodes, failed_edges):
+        # Failed node flags, and failed edge flags including the edges of failed nodes
+        down = np.zeros(len(self.nodes), dtype=bool)
+        down[[self.index[node] for node in failed_nodes if node in self.index]] = True
+        cut = self._failed_edges(failed_edges)
+        if len(self.ends):
+            cut |= down[self.ends].any(axis=1)
+        return down, cut
+
+    def _draw(self, ax, down, cut, show_failed):
+        from matplotlib.collections import LineCollection
+
+        ax.add_collection(LineCollection(self.segments[~cut], colors="black", linewidths=0.25))
+        ax.scatter(self.xy[~down, 0], self.xy[~down, 1], s=30, c="lightblue", zorder=2)
+        if show_failed:
+            ax.add_collection(LineCollection(self.segments[cut], colors="red", linewidths=0.5, linestyles="dashed"))
+            ax.scatter(self.xy[down, 0], self.xy[down, 1], s=30, c="red", marker="x", zorder=2)
+        if self.labels:
+            for i in np.flatnonzero(~down | show_failed).tolist():
+                ax.text(self.xy[i, 0], self.xy[i, 1], str(self.nodes[i]), fontsize=4, fontweight="bold",
+                        ha="center", va="center", zorder=3)
+        ax.autoscale_view()
+        ax.set_axis_off()
+
+    def render_many(self, jobs, dpi=DEFAULT_DPI):
+        """
+        Render many failure scenarios to files.
+
+        For raster outputs the intact topology, labels included, is drawn
+        once; each scenario then restores that background and draws only
+        its title and failed elements on top before the buffer is written,
+        which skips re-rasterizing every label per image. Failed links and
+        nodes are drawn over their intact strokes and markers (nothing is
+        erased), and the labels of the nodes they touch are drawn again so
+        they stay on top, as in render(). Vector outputs are drawn in full
+        by render().
+
+        Args:
+            jobs (list): (output, title, failed_nodes, failed_edges) tuples.
+            dpi (int): Resolution of raster output.
+
+        Returns:
+            list: Written paths.
+        """
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import LineCollection
+        from PIL import Image
+
+        raster = [job for job in jobs if os.path.splitext(job[0])[1].lower() in RASTER_FORMATS]
+        for output, title, nodes, edges in jobs:
+            if os.path.splitext(output)[1].lower() not in RASTER_FORMATS:
+                self.render(output, title, nodes, edges, dpi=dpi)
+        if not raster:
+            return [job[0] for job in jobs]
+
+        fig, ax = plt.subplots(figsize=self.figsize, dpi=dpi)
+        self._draw(ax, np.zeros(len(self.nodes), dtype=bool), np.zeros(len(self.edges), dtype=bool), False)
+        ax.set_title(" ", fontsize=14)
+        fig.canvas.draw()
+        background = fig.canvas.copy_from_bbox(fig.bbox)
+        ax.title.set_animated(True)
+
+        for output, title, nodes, edges in raster:
+            down, cut = self._failed(nodes, edges)
+            fig.canvas.restore_region(background)
+            overlay = [
+                LineCollection(self.segments[cut], colors="red", linewidths=0.5, linestyles="dashed"),
+                ax.scatter(self.xy[down, 0], self.xy[down, 1], s=30, c="red", marker="x", zorder=2),
+            ]
+            ax.add_collection(overlay[0])
+            if self.labels:
+                touched = down.copy()
+                touched[self.ends[cut].ravel()] = True
+                overlay += [ax.text(self.xy[i, 0], self.xy[i, 1], str(self.nodes[i]), fontsize=4, fontweight="bold",
+                                    ha="center", va="center", zorder=3) for i in np.flatnonzero(touched).tolist()]
+            ax.title.set_text(title)
+            for artist in overlay + [ax.title]:
+                artist.set_animated(True)
+                ax.draw_artist(artist)
+            image = Image.fromarray(np.asarray(fig.canvas.buffer_rgba())).convert("RGB")
+            image.save(output, compress_level=PNG_COMPRESSION)
+            for artist in overlay:
+                artist.remove()
+        plt.close(fig)
+        return [job[0] for job in jobs]
+
+
+def render_chunk(renderer, jobs, dpi=DEFAULT_DPI):
+    """
+    Render a list of (output, title, failed_nodes, failed_edges) jobs in a worker process.
+    """
+    return renderer.render_many(jobs, dpi)
+
+
+def render_scenarios(renderer, scenarios, directory, fmt=DEFAULT_FORMAT, workers=None):
+    """
+    Render many failure scenarios to files over a process pool.
+
+    Args:
+        renderer (TopologyRenderer): Renderer with the cached layout.
+        scenarios (iterable): (nodes, edges) scenarios, e.g. from FailureAnalyzer.scenarios().
+        directory (str): Output directory (created if missing).
+        fmt (str): File format, "png" or "svg".
+        workers (int, optional): Worker processes. Defaults to os.cpu_count();
+            1 renders in this process.
+
+    Returns:
+        list: Written paths in scenario order (scenario_0000.png, ...).
+    """
+    os.makedirs(directory, exist_ok=True)
+    jobs = []
+    for number, (nodes, edges) in enumerate(scenarios):
+        nodes, edges = list(nodes), [tuple(edge) for edge in edges]
+        failed = ", ".join([str(node) for node in nodes] + [f"{u}-{v}" for u, v in edges]) or "none"
+        jobs.append((os.path.join(directory, f"scenario_{number:04d}.{fmt}"), f"Failed: {failed}", nodes, edges))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    if workers == 1:
+        return render_chunk(renderer, jobs)
+
+    size = -(-len(jobs) // (workers * CHUNKS_PER_WORKER))
+    chunks = [jobs[start:start + size] for start in range(0, len(jobs), size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=headless) as pool:
+        futures = [pool.submit(render_chunk, renderer, chunk) for chunk in chunks]
+        return [path for future in futures for path in future.result()]
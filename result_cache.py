@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import pickle
+import time
+from analysis_engine import iter_records, build_display_filter
+from pcap_io import complete_end, read_records
+from tcp_flows import TCPFlowTable
+
+DEFAULT_CACHE_DIR = ".analysis_cache"
+DEFAULT_MAX_BYTES = 256 << 20  # Cache size before least recently used entries are evicted
+IDENTITY_BYTES = 1 << 16  # Leading bytes of a capture that identify it across appends
+HASH_CHUNK = 1 << 20
+
+
+def _hash_prefix(pcap_file, length):
+    # Content hash of the first `length` bytes of a file
+    digest = hashlib.blake2b(digest_size=20)
+    with open(pcap_file, "rb") as f:
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(HASH_CHUNK, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent cache of analysis results keyed by capture content and analysis.
+
+    An entry is keyed by a hash of the capture's leading bytes, the backend
+    and the pickled, still-unused collectors (so their type and every
+    constructor parameter, e.g. protocols, thresholds or timeouts, are part
+    of the key). It stores the collectors after processing together with
+    the byte offset they reached and a content hash of the capture up to
+    that offset.
+
+    A later run on an unchanged capture returns the cached results. When the
+    capture has only grown (its processed prefix still hashes the same), the
+    native backend resumes from the saved offset with the saved collectors
+    and TCP flow table and folds in just the new packets. Anything else is
+    recomputed. Entries are evicted least recently used first once the
+    cache exceeds max_bytes.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            directory (str): Directory holding the entries and their index.
+            max_bytes (int): Total entry size kept before evicting.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "index.json")
+        try:
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def key(self, pcap_file, collectors, backend):
+        """
+        Cache key of an analysis of a capture.
+
+        Args:
+            pcap_file (str): Path to the capture.
+            collectors (dict): Unused collectors, as passed to run_analysis.
+            backend (str): Reader backend.
+
+        Returns:
+            str: Hex digest.
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(backend.encode())
+        digest.update(pickle.dumps(collectors))
+        digest.update(_hash_prefix(pcap_file, IDENTITY_BYTES).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pickle")
+
+    def load(self, key):
+        """
+        Read an entry, marking it as recently used.
+
+        Returns:
+            dict or None: The entry, or None when missing or unreadable.
+        """
+        try:
+            with open(self._path(key), "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.index.pop(key, None)
+            return None
+        if key in self.index:
+            self.index[key]["last_used"] = time.time()
+            self._save_index()
+        return entry
+
+    def store(self, key, entry):
+        """
+        Write an entry and evict least recently used entries over max_bytes.
+        """
+        path = self._path(key)
+        temp = f"{path}.tmp"
+        with open(temp, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, path)
+        self.index[key] = {"size": os.path.getsize(path), "last_used": time.time()}
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in max_bytes.
+        """
+        total = sum(item["size"] for item in self.index.values())
+        for key in sorted(self.index, key=lambda k: self.index[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= self.index.pop(key)["size"]
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        self._save_index()
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        self.max_bytes, limit = 0, self.max_bytes
+        self.evict()
+        self.max_bytes = limit
+
+    def _save_index(self):
+        temp = f"{self.index_path}.tmp"
+        with open(temp, "w") as f:
+            json.dump(self.index, f)
+        os.replace(temp, self.index_path)
+
+    def _valid_prefix(self, pcap_file, entry, size, mtime):
+        if size < entry["offset"]:
+            return False
+        if size == entry["size"] and mtime == entry["mtime"]:
+            return True
+        return _hash_prefix(pcap_file, entry["offset"]) == entry["prefix_hash"]
+
+    def run_analysis(self, pcap_file, collectors, backend="pyshark"):
+        """
+        Run collectors over a capture, reusing or extending a cached run.
+
+        Args:
+            pcap_file (str): Path to the input .pcap/.pcapng file.
+            collectors (dict): Mapping of result name to unused MetricCollector.
+            backend (str): Reader backend, "pyshark" or "native" (only native resumes growing captures).
+
+        Returns:
+            dict: Mapping of result name to each collector's result.
+        """
+        stat = os.stat(pcap_file)
+        key = self.key(pcap_file, collectors, backend)
+        entry = self.load(key)
+
+        if entry is not None and self._valid_prefix(pcap_file, entry, stat.st_size, stat.st_mtime_ns):
+            if entry["size"] == stat.st_size:
+                return entry["results"]
+            if backend == "native":
+                return self._extend(pcap_file, key, entry, stat)
+
+        return self._compute(pcap_file, key, collectors, backend, stat)
+
+    def _feed(self, records, collectors):
+        active = list(collectors.values())
+        for record in records:
+            for collector in active:
+                if collector.wants(record):
+                    collector.process(record)
+        return {name: collector.result() for name, collector in collectors.items()}
+
+    def _compute(self, pcap_file, key, collectors, backend, stat):
+        if backend == "native":
+            end = complete_end(pcap_file)
+            tcp_flows = TCPFlowTable()
+            results = self._feed(read_records(pcap_file, end=end, tcp_flows=tcp_flows), collectors)
+        else:
+            end, tcp_flows = stat.st_size, None
+            records = iter_records(pcap_file, build_display_filter(collectors.values()), backend)
+            results = self._feed(records, collectors)
+        self._save(pcap_file, key, collectors, tcp_flows, results, end, stat)
+        return results
+
+    def _extend(self, pcap_file, key, entry, stat):
+        collectors, tcp_flows = entry["collectors"], entry["tcp_flows"]
+        start = entry["offset"]
+        end = complete_end(pcap_file, start)
+        results = self._feed(read_records(pcap_file, start, end, tcp_flows=tcp_flows), collectors)
+        self._save(pcap_file, key, collectors, tcp_flows, results, end, stat)
+        return results
+
+    def _save(self, pcap_file, key, collectors, tcp_flows, results, offset, stat):
+        self.store(key, {
+            "collectors": collectors,
+            "tcp_flows": tcp_flows,
+            "results": results,
+            "offset": offset,
+            "prefix_hash": _hash_prefix(pcap_file, offset),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+        })
@@ -0,0 +1,296 @@
+import math
+import sqlite3
+import numpy as np
+from protocols import PROTOCOL_NAMES, int_to_ip
+
+# Rollup granularities in seconds, coarsest first
+GRANULARITIES = (3600, 60, 1)
+
+LENGTH_BIN = 64  # Bytes per packet-length histogram bin
+
+CREATE_ROLLUP_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS rollup_protocol (
+        granularity INTEGER NOT NULL,     -- Bucket width in seconds
+        bucket INTEGER NOT NULL,          -- floor(time / granularity)
+        protocol INTEGER NOT NULL,
+        packets INTEGER NOT NULL,
+        bytes INTEGER NOT NULL,
+        PRIMARY KEY (granularity, bucket, protocol)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_talkers (
+        granularity INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        source INTEGER NOT NULL,
+        packets INTEGER NOT NULL,
+        bytes INTEGER NOT NULL,
+        PRIMARY KEY (granularity, bucket, source)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_lengths (
+        granularity INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        length_bin INTEGER NOT NULL,      -- Lower bound of the LENGTH_BIN-wide bin
+        packets INTEGER NOT NULL,
+        PRIMARY KEY (granularity, bucket, length_bin)
+    ) WITHOUT ROWID
+    """,
+]
+
+UPSERT_PROTOCOL = """
+    INSERT INTO rollup_protocol (granularity, bucket, protocol, packets, bytes) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (granularity, bucket, protocol)
+    DO UPDATE SET packets = packets + excluded.packets, bytes = bytes + excluded.bytes
+"""
+
+UPSERT_TALKERS = """
+    INSERT INTO rollup_talkers (granularity, bucket, source, packets, bytes) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (granularity, bucket, source)
+    DO UPDATE SET packets = packets + excluded.packets, bytes = bytes + excluded.bytes
+"""
+
+UPSERT_LENGTHS = """
+    INSERT INTO rollup_lengths (granularity, bucket, length_bin, packets) VALUES (?, ?, ?, ?)
+    ON CONFLICT (granularity, bucket, length_bin)
+    DO UPDATE SET packets = packets + excluded.packets
+"""
+
+
+def create_rollup_tables(cursor):
+    """
+    Create the rollup tables if they do not exist.
+
+    Args:
+        cursor (sqlite3.Cursor or sqlite3.Connection): Target database.
+    """
+    for statement in CREATE_ROLLUP_TABLES:
+        cursor.execute(statement)
+
+
+def _group(keys, *weights):
+    # Sum weights per unique key row; returns (unique keys, packet counts, weighted sums...)
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    sums = [np.bincount(inverse, weights=w, minlength=len(unique)).astype(np.int64) for w in weights]
+    return unique, np.bincount(inverse, minlength=len(unique)), sums
+
+
+def aggregate_rows(rows):
+    """
+    Aggregate numeric traffic_records rows into rollup upserts.
+
+    Args:
+        rows (list): (time, protocol, length, source, destination) tuples.
+
+    Returns:
+        tuple: (protocol rows, talker rows, length rows) ready for executemany.
+    """
+    data = np.asarray(rows, dtype=np.float64).reshape(-1, 5)
+    length = data[:, 2]
+    protocol = data[:, 1].astype(np.int64)
+    source = data[:, 3].astype(np.int64)
+    length_bin = (data[:, 2].astype(np.int64) // LENGTH_BIN) * LENGTH_BIN
+
+    protocol_rows, talker_rows, length_rows = [], [], []
+    for granularity in GRANULARITIES:
+        bucket = np.floor(data[:, 0] / granularity).astype(np.int64)
+
+        keys, packets, (total,) = _group(np.column_stack([bucket, protocol]), length)
+        protocol_rows += zip([granularity] * len(keys), keys[:, 0].tolist(), keys[:, 1].tolist(),
+                             packets.tolist(), total.tolist())
+
+        keys, packets, (total,) = _group(np.column_stack([bucket, source]), length)
+        talker_rows += zip([granularity] * len(keys), keys[:, 0].tolist(), keys[:, 1].tolist(),
+                           packets.tolist(), total.tolist())
+
+        keys, packets, _ = _group(np.column_stack([bucket, length_bin]))
+        length_rows += zip([granularity] * len(keys), keys[:, 0].tolist(), keys[:, 1].tolist(),
+                           packets.tolist())
+
+    return protocol_rows, talker_rows, length_rows
+
+
+def update_rollups(conn, rows):
+    """
+    Fold a batch of newly inserted rows into the rollup tables.
+
+    Runs inside the caller's transaction so rollups and raw rows stay consistent.
+
+    Args:
+        conn (sqlite3.Connection): Open connection.
+        rows (list): Numeric traffic_records rows that were just inserted.
+    """
+    if not rows:
+        return
+    protocol_rows, talker_rows, length_rows = aggregate_rows(rows)
+    conn.executemany(UPSERT_PROTOCOL, protocol_rows)
+    conn.executemany(UPSERT_TALKERS, talker_rows)
+    conn.executemany(UPSERT_LENGTHS, length_rows)
+
+
+def rebuild_rollups(conn, batch_size=50000):
+    """
+    Recompute every rollup table from traffic_records.
+
+    Args:
+        conn (sqlite3.Connection): Open connection.
+        batch_size (int): Raw rows aggregated per step.
+
+    Returns:
+        int: Number of raw rows folded into the rollups.
+    """
+    create_rollup_tables(conn)
+    for table in ("rollup_protocol", "rollup_talkers", "rollup_lengths"):
+        conn.execute(f"DELETE FROM {table}")
+
+    folded = 0
+    cursor = conn.execute("SELECT time, protocol, length, source, destination FROM traffic_records")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        update_rollups(conn, rows)
+        folded += len(rows)
+    return folded
+
+
+def plan_ranges(start, end):
+    """
+    Cover [start, end) with the fewest rollup buckets, coarsest first.
+
+    Whole hours are read from the 1h rollup and only the ragged edges
+    fall back to the 1m and 1s rollups, so the number of buckets touched
+    is bounded regardless of the range length or raw row count.
+
+    Args:
+        start (float): Range start in epoch seconds (rounded down to a second).
+        end (float): Range end in epoch seconds (rounded up to a second).
+
+    Returns:
+        list: (granularity, first_bucket, last_bucket) tuples.
+    """
+    pieces = []
+
+    def split(lo, hi, levels):
+        if lo >= hi:
+            return
+        granularity = levels[0]
+        if len(levels) == 1:
+            pieces.append((granularity, lo // granularity, (hi - 1) // granularity))
+            return
+        first = -(-lo // granularity) * granularity
+        last = (hi // granularity) * granularity
+        if first < last:
+            pieces.append((granularity, first // granularity, last // granularity - 1))
+            split(lo, first, levels[1:])
+            split(last, hi, levels[1:])
+        else:
+            split(lo, hi, levels[1:])
+
+    split(int(math.floor(start)), int(math.ceil(end)), GRANULARITIES)
+    return pieces
+
+
+def _range_query(conn, table, columns, start, end, group_by):
+    clauses, params = [], []
+    for granularity, first, last in plan_ranges(start, end):
+        clauses.append("(granularity = ? AND bucket BETWEEN ? AND ?)")
+        params += [granularity, first, last]
+    if not clauses:
+        return []
+    query = f"SELECT {group_by}, {columns} FROM {table} WHERE {' OR '.join(clauses)} GROUP BY {group_by}"
+    return conn.execute(query, params).fetchall()
+
+
+def protocol_totals(start, end, db_name="network_data.db"):
+    """
+    Packets and bytes per protocol over a time range.
+
+    Args:
+        start (float): Range start in epoch seconds.
+        end (float): Range end in epoch seconds.
+        db_name (str): Path to the SQLite database.
+
+    Returns:
+        dict: Mapping of protocol name to {"packets": int, "bytes": int}.
+    """
+    conn = sqlite3.connect(db_name)
+    try:
+        rows = _range_query(conn, "rollup_protocol", "SUM(packets), SUM(bytes)", start, end, "protocol")
+    finally:
+        conn.close()
+    return {PROTOCOL_NAMES.get(protocol, "Other"): {"packets": packets, "bytes": total}
+            for protocol, packets, total in rows}
+
+
+def top_talkers(start, end, limit=10, db_name="network_data.db"):
+    """
+    Sources sending the most bytes over a time range.
+
+    Args:
+        start (float): Range start in epoch seconds.
+        end (float): Range end in epoch seconds.
+        limit (int): Number of talkers to return.
+        db_name (str): Path to the SQLite database.
+
+    Returns:
+        list: (source, packets, bytes) tuples ordered by bytes, largest first.
+    """
+    conn = sqlite3.connect(db_name)
+    try:
+        rows = _range_query(conn, "rollup_talkers", "SUM(packets), SUM(bytes)", start, end, "source")
+    finally:
+        conn.close()
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return [(int_to_ip(source), packets, total) for source, packets, total in rows[:limit]]
+
+
+def length_distribution(start, end, db_name="network_data.db"):
+    """
+    Packet length histogram over a time range.
+
+    Args:
+        start (float): Range start in epoch seconds.
+        end (float): Range end in epoch seconds.
+        db_name (str): Path to the SQLite database.
+
+    Returns:
+        dict: Mapping of bin lower bound (bytes) to packet count.
+    """
+    conn = sqlite3.connect(db_name)
+    try:
+        rows = _range_query(conn, "rollup_lengths", "SUM(packets)", start, end, "length_bin")
+    finally:
+        conn.close()
+    return dict(sorted(rows))
+
+
+def protocol_series(start, end, granularity=60, db_name="network_data.db"):
+    """
+    Packets and bytes per protocol per bucket, for time-series charts.
+
+    Args:
+        start (float): Range start in epoch seconds.
+        end (float): Range end in epoch seconds.
+        granularity (int): Bucket width in seconds (1, 60 or 3600).
+        db_name (str): Path to the SQLite database.
+
+    Returns:
+        list: (bucket start time, protocol name, packets, bytes) tuples in time order.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {GRANULARITIES}")
+    conn = sqlite3.connect(db_name)
+    try:
+        rows = conn.execute("""
+            SELECT bucket, protocol, packets, bytes FROM rollup_protocol
+            WHERE granularity = ? AND bucket BETWEEN ? AND ?
+            ORDER BY bucket, protocol
+        """, (granularity, int(start // granularity), int((math.ceil(end) - 1) // granularity))).fetchall()
+    finally:
+        conn.close()
+    return [(bucket * granularity, PROTOCOL_NAMES.get(protocol, "Other"), packets, total)
+            for bucket, protocol, packets, total in rows]
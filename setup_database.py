@@ -1,28 +1,132 @@
+import datetime
 import sqlite3
+from protocols import NO_ADDRESS, PROTO_ICMP, PROTO_OTHER, PROTOCOL_CODES, ip_to_int
+from anomalies import create_anomaly_table
+from rollups import create_rollup_tables, rebuild_rollups
 
-def setup_database():
+SCHEMA_VERSION = 3
+
+CREATE_TRAFFIC_RECORDS = """
+    CREATE TABLE IF NOT EXISTS traffic_records (  -- Table name
+        id INTEGER PRIMARY KEY,
+        time REAL NOT NULL,               -- Epoch seconds
+        protocol INTEGER NOT NULL,        -- IP protocol code (1 ICMP, 6 TCP, 17 UDP, 0 other)
+        length INTEGER NOT NULL,
+        source INTEGER NOT NULL,          -- IPv4 address as uint32, 0 when absent
+        destination INTEGER NOT NULL      -- IPv4 address as uint32, 0 when absent
+    )
+"""
+
+CREATE_TRAFFIC_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_traffic_protocol_length ON traffic_records (protocol, length)",
+    "CREATE INDEX IF NOT EXISTS idx_traffic_time ON traffic_records (time)",
+    "CREATE INDEX IF NOT EXISTS idx_traffic_source ON traffic_records (source)",
+    "CREATE INDEX IF NOT EXISTS idx_traffic_destination ON traffic_records (destination)",
+]
+
+
+def create_schema(cursor):
+    """
+    Create the traffic_records table, its indexes, the rollup tables and the anomalies table.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the target database.
+    """
+    cursor.execute(CREATE_TRAFFIC_RECORDS)
+    for statement in CREATE_TRAFFIC_INDEXES:
+        cursor.execute(statement)
+    create_rollup_tables(cursor)
+    create_anomaly_table(cursor)
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def convert_legacy_row(row):
+    """
+    Convert a legacy (TEXT schema or traffic detail) row into a traffic_records row.
+
+    Args:
+        row (tuple): (time, protocol, length, source, destination) with an ISO
+            time string, the transport layer name (None for ICMP, any other
+            name for other traffic) and dotted addresses or "N/A"/None.
+
+    Returns:
+        tuple: (time, protocol, length, source, destination) in the numeric schema.
+    """
+    time, protocol, length, source, destination = row
+    code = PROTOCOL_CODES.get(protocol, PROTO_ICMP if protocol is None else PROTO_OTHER)
+    return (
+        datetime.datetime.fromisoformat(time).timestamp(),
+        code,
+        int(length),
+        ip_to_int(source) if source not in (None, "N/A") else NO_ADDRESS,
+        ip_to_int(destination) if destination not in (None, "N/A") else NO_ADDRESS,
+    )
+
+
+def migrate_database(conn, batch_size=10000):
+    """
+    Upgrade a legacy TEXT-typed traffic_records table to the indexed numeric schema.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+        batch_size (int): Rows converted per executemany call.
+
+    Returns:
+        int: Number of rows migrated (0 if no legacy table was found).
+    """
+    cursor = conn.cursor()
+    columns = {row[1]: row[2] for row in cursor.execute("PRAGMA table_info(traffic_records)")}
+    if columns.get("time", "").upper() != "TEXT":
+        return 0
+
+    migrated = 0
+    cursor.execute("BEGIN")
+    cursor.execute("ALTER TABLE traffic_records RENAME TO traffic_records_v1")
+    create_schema(cursor)
+
+    legacy = conn.cursor()
+    legacy.execute("SELECT time, protocol, length, source, destination FROM traffic_records_v1")
+    while True:
+        rows = legacy.fetchmany(batch_size)
+        if not rows:
+            break
+        cursor.executemany("""
+            INSERT INTO traffic_records (time, protocol, length, source, destination)
+            VALUES (?, ?, ?, ?, ?)
+        """, [convert_legacy_row(row) for row in rows])
+        migrated += len(rows)
+
+    cursor.execute("DROP TABLE traffic_records_v1")
+    rebuild_rollups(conn)
+    return migrated
+
+
+def setup_database(db_name="network_data.db"):
     """
     Create the network_data database and the traffic_records table.
+
+    An existing table in the legacy TEXT layout is migrated in place.
+
+    Args:
+        db_name (str): Path to the SQLite database.
     """
     try:
         # Connect to SQLite database
-        conn = sqlite3.connect("network_data.db")  # Database name
+        conn = sqlite3.connect(db_name)  # Database name
         cursor = conn.cursor()
 
+        migrated = migrate_database(conn)
+
         # Create the traffic_records table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS traffic_records (  -- Table name
-                time TEXT,
-                protocol TEXT,
-                length INTEGER,
-                source TEXT,
-                destination TEXT
-            )
-        """)
+        create_schema(cursor)
 
         conn.commit()
+        cursor.execute("ANALYZE")
+        if migrated:
+            print(f"Migrated {migrated} legacy records to schema version {SCHEMA_VERSION}.")
         print("Database and table created successfully.")
     except sqlite3.Error as e:
+        conn.rollback()
         print(f"Database error: {e}")
     finally:
         conn.close()
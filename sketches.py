@@ -0,0 +1,219 @@
+import math
+import numpy as np
+from analysis_engine import MetricCollector
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class DDSketch:
+    """
+    Mergeable quantile sketch with a relative-error guarantee (DDSketch).
+
+    Values are counted in logarithmic bins of ratio gamma = (1 + a) / (1 - a),
+    where a is relative_accuracy. Any quantile estimate v' of a true value v
+    satisfies |v' - v| <= a * v, independent of the data distribution, as long
+    as the bin holding v has not been collapsed. Memory is bounded by
+    max_bins: when exceeded, the lowest bins are merged together, which only
+    degrades the accuracy of the lowest quantiles (tail quantiles such as p99
+    and p99.9 keep the guarantee). With the defaults (1%, 2048 bins) the
+    sketch spans more than 17 orders of magnitude before collapsing.
+
+    Values at or below min_value (including zero) are counted in a dedicated
+    zero bin; negative values are not supported.
+
+    Two sketches with the same relative_accuracy can be merged exactly, so
+    per-shard and per-window sketches combine into the sketch of the union.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048, min_value=1e-9):
+        """
+        Args:
+            relative_accuracy (float): Relative error bound a, 0 < a < 1.
+            max_bins (int): Maximum number of non-empty bins kept.
+            min_value (float): Values at or below this are counted as zero.
+        """
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _key(self, value):
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def _value(self, key):
+        # Midpoint (in relative terms) of bin key, which bounds the error by a
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value, weight=1):
+        """
+        Add a value to the sketch.
+
+        Args:
+            value (float): Non-negative sample.
+            weight (int): Number of occurrences of the value.
+        """
+        if value <= self.min_value:
+            self.zero_count += weight
+        else:
+            key = self._key(value)
+            self.bins[key] = self.bins.get(key, 0) + weight
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += weight
+        self.sum += value * weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def add_many(self, values):
+        """
+        Add an array of values using vectorized binning.
+
+        Args:
+            values (array-like): Non-negative samples.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        positive = values[values > self.min_value]
+        self.zero_count += len(values) - len(positive)
+        if len(positive):
+            keys, counts = np.unique(np.ceil(np.log(positive) / self.log_gamma).astype(np.int64),
+                                     return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                self.bins[key] = self.bins.get(key, 0) + count
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def _collapse(self):
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins + 1
+        lowest = keys[excess]
+        for key in keys[:excess]:
+            self.bins[lowest] += self.bins.pop(key)
+
+    def merge(self, other):
+        """
+        Fold another sketch into this one.
+
+        Args:
+            other (DDSketch): Sketch built with the same relative_accuracy.
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("cannot merge sketches with different relative accuracy")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def copy(self):
+        """
+        Return an independent copy of the sketch.
+        """
+        clone = DDSketch(self.relative_accuracy, self.max_bins, self.min_value)
+        clone.merge(self)
+        return clone
+
+    def quantile(self, q):
+        """
+        Estimate the q-quantile.
+
+        Args:
+            q (float): Quantile in [0, 1].
+
+        Returns:
+            float: The estimate, or 0 for an empty sketch.
+        """
+        if self.count == 0:
+            return 0
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0
+        seen = self.zero_count
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return min(max(self._value(key), self.min), self.max)
+        return self.max
+
+    def quantiles(self, qs=DEFAULT_QUANTILES):
+        """
+        Estimate several quantiles in one pass.
+
+        Args:
+            qs (tuple): Quantiles in [0, 1].
+
+        Returns:
+            dict: Mapping of quantile to estimate.
+        """
+        return {q: self.quantile(q) for q in qs}
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0
+
+    def summary(self, prefix="", qs=DEFAULT_QUANTILES):
+        """
+        Summarize the sketch as metric dictionary entries.
+
+        Args:
+            prefix (str): Key prefix, e.g. "rtt_".
+            qs (tuple): Quantiles to report.
+
+        Returns:
+            dict: {prefix + "p50": ..., prefix + "p99": ..., prefix + "p99.9": ...}.
+        """
+        return {f"{prefix}p{q * 100:g}": value for q, value in self.quantiles(qs).items()}
+
+    def histogram(self):
+        """
+        Bin representatives and counts, e.g. for plotting.
+
+        Returns:
+            tuple: (values, counts) lists in increasing value order.
+        """
+        values = [0.0] if self.zero_count else []
+        counts = [self.zero_count] if self.zero_count else []
+        for key in sorted(self.bins):
+            values.append(self._value(key))
+            counts.append(self.bins[key])
+        return values, counts
+
+
+class LengthSketchCollector(MetricCollector):
+    """
+    Collect a packet-length quantile sketch.
+    """
+
+    def __init__(self, protocols=None, relative_accuracy=0.01):
+        self.protocols = tuple(p.lower() for p in protocols) if protocols else None
+        self.sketch = DDSketch(relative_accuracy)
+
+    def process(self, record):
+        self.sketch.add(record.length)
+
+    def result(self):
+        return self.sketch.summary("length_")
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
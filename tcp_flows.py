@@ -0,0 +1,239 @@
+from collections import OrderedDict, deque
+
+# TCP flag bits
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+
+DEFAULT_IDLE_TIMEOUT = 300.0  # Seconds without packets before a flow is evicted
+DEFAULT_MAX_FLOWS = 1 << 20
+MAX_UNACKED = 1024  # Outstanding segments remembered per direction for RTT samples
+MAX_HOLES = 16  # Sequence gaps remembered per direction for out-of-order detection
+
+
+def _seq_lt(a, b):
+    return ((a - b) & 0xFFFFFFFF) > 0x7FFFFFFF
+
+
+class _Direction:
+    """
+    Sequence state of one direction of a connection.
+    """
+
+    __slots__ = ("next_seq", "acked", "unacked", "holes")
+
+    def __init__(self):
+        self.next_seq = None    # Highest sequence number sent + 1
+        self.acked = None       # Highest sequence number acknowledged by the peer
+        self.unacked = deque()  # (segment end, send time), ordered by end
+        self.holes = []         # [start, end) gaps below next_seq not yet filled
+
+
+class TCPFlow:
+    """
+    Compact per-connection state and counters kept by TCPFlowTable.
+    """
+
+    __slots__ = ("key", "first_seen", "last_seen", "directions", "packets", "bytes",
+                 "retransmissions", "out_of_order", "zero_windows", "rtt_sum", "rtt_count",
+                 "max_bytes_in_flight")
+
+    def __init__(self, key, timestamp):
+        self.key = key                          # (addr, port, addr, port) of the first packet seen
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.directions = (_Direction(), _Direction())
+        self.packets = 0
+        self.bytes = 0
+        self.retransmissions = 0
+        self.out_of_order = 0
+        self.zero_windows = 0
+        self.rtt_sum = 0.0
+        self.rtt_count = 0
+        self.max_bytes_in_flight = 0
+
+    def summary(self):
+        """
+        Per-flow metrics.
+
+        Returns:
+            dict: Endpoints, duration, counters and RTT / bytes-in-flight figures.
+        """
+        src, sport, dst, dport = self.key
+        return {
+            "src": src, "sport": sport, "dst": dst, "dport": dport,
+            "duration": self.last_seen - self.first_seen,
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "retransmissions": self.retransmissions,
+            "out_of_order": self.out_of_order,
+            "zero_windows": self.zero_windows,
+            "average_rtt": self.rtt_sum / self.rtt_count if self.rtt_count else 0,
+            "max_bytes_in_flight": self.max_bytes_in_flight,
+        }
+
+
+class TCPFlowTable:
+    """
+    In-process TCP connection tracker replacing tshark's expert analysis.
+
+    Flows are keyed by their 4-tuple (both directions share one entry) and
+    annotate every TCP record in a single pass:
+
+    - tcp_retransmission: a data segment below the highest sequence already
+      sent in its direction that does not fill a known gap.
+    - tcp_out_of_order: a segment filling a gap left when a later segment
+      was seen first.
+    - tcp_ack_rtt: time from a segment to the ACK that exactly acknowledges
+      it, as tshark reports; retransmitted segments are not sampled (Karn).
+    - tcp_zero_window: a segment advertising a zero receive window (SYN,
+      FIN and RST segments excluded, as in tshark).
+    - tcp_bytes_in_flight: unacknowledged bytes in the sender's direction
+      after a data segment, a proxy for the congestion window.
+
+    Flows idle for idle_timeout seconds of packet time are evicted, and the
+    oldest flows are evicted when max_flows is exceeded, so memory stays
+    bounded on captures with millions of connections. Evicted flows are
+    passed to on_evict when given.
+    """
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, max_flows=DEFAULT_MAX_FLOWS, on_evict=None):
+        """
+        Args:
+            idle_timeout (float): Seconds without packets before a flow is evicted.
+            max_flows (int): Maximum number of tracked flows.
+            on_evict (callable, optional): Called with each evicted TCPFlow.
+        """
+        self.idle_timeout = idle_timeout
+        self.max_flows = max_flows
+        self.on_evict = on_evict
+        self.flows = OrderedDict()  # Least recently seen first
+        self.evicted = 0
+
+    def _flow(self, record):
+        fwd = (record.src, record.sport, record.dst, record.dport)
+        flow = self.flows.get(fwd)
+        if flow is not None:
+            self.flows.move_to_end(fwd)
+            return flow, 0
+        rev = (record.dst, record.dport, record.src, record.sport)
+        flow = self.flows.get(rev)
+        if flow is not None:
+            self.flows.move_to_end(rev)
+            return flow, 1
+        flow = self.flows[fwd] = TCPFlow(fwd, record.timestamp)
+        return flow, 0
+
+    def expire(self, now):
+        """
+        Evict flows idle since before now - idle_timeout, and the oldest beyond max_flows.
+
+        Args:
+            now (float): Current packet time in epoch seconds.
+        """
+        flows = self.flows
+        cutoff = now - self.idle_timeout
+        while flows:
+            key, flow = next(iter(flows.items()))
+            if flow.last_seen >= cutoff and len(flows) <= self.max_flows:
+                break
+            del flows[key]
+            self.evicted += 1
+            if self.on_evict is not None:
+                self.on_evict(flow)
+
+    def annotate(self, record):
+        """
+        Update the record's flow and fill its TCP analysis fields.
+
+        Args:
+            record (PacketRecord): Decoded packet with TCP fields set.
+        """
+        timestamp = record.timestamp
+        flow, side = self._flow(record)
+        if timestamp > flow.last_seen:
+            flow.last_seen = timestamp
+        flow.packets += 1
+        flow.bytes += record.length
+        sender = flow.directions[side]
+        receiver = flow.directions[1 - side]
+
+        flags = record.tcp_flags
+        seq = record.tcp_seq
+        seglen = record.tcp_len + (1 if flags & (TCP_SYN | TCP_FIN) else 0)
+
+        if seglen > 0:
+            next_seq = sender.next_seq
+            end = (seq + seglen) & 0xFFFFFFFF
+            keep_alive = record.tcp_len <= 1 and next_seq is not None and seq == (next_seq - 1) & 0xFFFFFFFF
+            if next_seq is None:
+                sender.next_seq = end
+                if sender.acked is None:
+                    sender.acked = seq
+                sender.unacked.append((end, timestamp))
+            elif keep_alive:
+                pass
+            elif _seq_lt(seq, next_seq):
+                if self._fill_hole(sender, seq, end):
+                    record.tcp_out_of_order = True
+                    flow.out_of_order += 1
+                else:
+                    record.tcp_retransmission = True
+                    flow.retransmissions += 1
+            else:
+                if seq != next_seq and len(sender.holes) < MAX_HOLES:
+                    sender.holes.append([next_seq, seq])
+                sender.next_seq = end
+                if len(sender.unacked) >= MAX_UNACKED:
+                    sender.unacked.popleft()
+                sender.unacked.append((end, timestamp))
+
+            if record.tcp_len > 0 and not _seq_lt(sender.next_seq, sender.acked):
+                in_flight = (sender.next_seq - sender.acked) & 0xFFFFFFFF
+                record.tcp_bytes_in_flight = in_flight
+                if in_flight > flow.max_bytes_in_flight:
+                    flow.max_bytes_in_flight = in_flight
+
+        if record.tcp_window == 0 and not flags & (TCP_RST | TCP_SYN | TCP_FIN):
+            record.tcp_zero_window = True
+            flow.zero_windows += 1
+
+        if flags & TCP_ACK:
+            ack = record.tcp_ack
+            if receiver.acked is None or _seq_lt(receiver.acked, ack):
+                receiver.acked = ack
+            pending = receiver.unacked
+            while pending and not _seq_lt(ack, pending[0][0]):
+                end, sent = pending.popleft()
+                if end == ack:
+                    rtt = timestamp - sent
+                    record.tcp_ack_rtt = rtt
+                    flow.rtt_sum += rtt
+                    flow.rtt_count += 1
+
+        self.expire(timestamp)
+
+    @staticmethod
+    def _fill_hole(direction, seq, end):
+        # A segment inside a known gap is out of order rather than retransmitted
+        for index, (start, stop) in enumerate(direction.holes):
+            if not _seq_lt(seq, start) and _seq_lt(seq, stop):
+                pieces = []
+                if seq != start:
+                    pieces.append([start, seq])
+                if _seq_lt(end, stop):
+                    pieces.append([end, stop])
+                direction.holes[index:index + 1] = pieces
+                return True
+        return False
+
+    def summaries(self):
+        """
+        Metrics of every flow still being tracked.
+
+        Returns:
+            list: TCPFlow.summary() dicts, least recently seen first.
+        """
+        return [flow.summary() for flow in self.flows.values()]
@@ -1,49 +1,125 @@
-import pyshark
+from analysis_engine import MetricCollector, run_analysis
+from instrumentation import timed
+from live_metrics import DEFAULT_WINDOWS, WindowedCollector
+from sketches import DDSketch
 
-def analyze_tcp_metrics(pcap_file):
-    """
-    Analyze TCP retransmissions, round-trip time (RTT), and congestion windows.
 
-    Args:
-        pcap_file (str): Path to the input .pcapng file.
+class TCPMetricsCollector(MetricCollector):
+    """
+    Collect TCP retransmissions, out-of-order segments, zero windows,
+    bytes in flight (a congestion-window proxy) and round-trip time (RTT) samples.
 
-    Returns:
-        dict: Calculated TCP metrics.
+    RTT percentiles (rtt_p50 ... rtt_p99.9, seconds) come from a DDSketch
+    with 1% relative error, so memory does not grow with the sample count.
     """
-    metrics = {
-        "retransmissions": 0,
-        "average_rtt": 0,
-        "packet_count": 0
-    }
-    total_rtt = 0
 
-    try:
-        cap = pyshark.FileCapture(pcap_file, display_filter="tcp")
+    protocols = ("tcp",)
 
-        for packet in cap:
-            try:
-                if hasattr(packet.tcp, "analysis_retransmission"):
-                    metrics["retransmissions"] += 1
+    def __init__(self):
+        self.retransmissions = 0
+        self.packet_count = 0
+        self.total_rtt = 0
+        self.rtt_sketch = DDSketch()
+        self.out_of_order = 0
+        self.zero_windows = 0
+        self.in_flight_sum = 0
+        self.in_flight_count = 0
+        self.max_bytes_in_flight = 0
 
-                if hasattr(packet.tcp, "analysis_ack_rtt"):
-                    rtt = float(packet.tcp.analysis_ack_rtt)
-                    total_rtt += rtt
-                    metrics["packet_count"] += 1
-            except AttributeError:
-                continue
+    def process(self, record):
+        if record.tcp_retransmission:
+            self.retransmissions += 1
+        if record.tcp_out_of_order:
+            self.out_of_order += 1
+        if record.tcp_zero_window:
+            self.zero_windows += 1
 
-        cap.close()
+        in_flight = record.tcp_bytes_in_flight
+        if in_flight is not None:
+            self.in_flight_sum += in_flight
+            self.in_flight_count += 1
+            if in_flight > self.max_bytes_in_flight:
+                self.max_bytes_in_flight = in_flight
 
-        if metrics["packet_count"] > 0:
-            metrics["average_rtt"] = total_rtt / metrics["packet_count"]
+        if record.tcp_ack_rtt is not None:
+            self.total_rtt += record.tcp_ack_rtt
+            self.packet_count += 1
+            self.rtt_sketch.add(record.tcp_ack_rtt)
 
+    def result(self):
+        metrics = {
+            "retransmissions": self.retransmissions,
+            "average_rtt": self.total_rtt / self.packet_count if self.packet_count > 0 else 0,
+            "packet_count": self.packet_count,
+            "out_of_order": self.out_of_order,
+            "zero_windows": self.zero_windows,
+            "average_bytes_in_flight": self.in_flight_sum / self.in_flight_count if self.in_flight_count > 0 else 0,
+            "max_bytes_in_flight": self.max_bytes_in_flight,
+        }
+        metrics.update(self.rtt_sketch.summary("rtt_"))
         return metrics
-    except FileNotFoundError:
-        print(f"Error: File {pcap_file} not found.")
-        return {}
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return {}
+
+    def merge(self, other):
+        self.retransmissions += other.retransmissions
+        self.packet_count += other.packet_count
+        self.total_rtt += other.total_rtt
+        self.rtt_sketch.merge(other.rtt_sketch)
+        self.out_of_order += other.out_of_order
+        self.zero_windows += other.zero_windows
+        self.in_flight_sum += other.in_flight_sum
+        self.in_flight_count += other.in_flight_count
+        self.max_bytes_in_flight = max(self.max_bytes_in_flight, other.max_bytes_in_flight)
+
+
+class LiveTCPMetricsCollector(WindowedCollector):
+    """
+    TCP retransmissions and RTT over sliding windows, for live monitoring.
+    """
+
+    protocols = ("tcp",)
+    fields = ("segments", "retransmissions", "rtt_sum", "rtt_count", "out_of_order", "zero_windows")
+    sketch_prefix = "rtt_"
+
+    def __init__(self, windows=DEFAULT_WINDOWS):
+        super().__init__(windows)
+
+    def process(self, record):
+        rtt = record.tcp_ack_rtt
+        self.add(record.timestamp, 1, 1 if record.tcp_retransmission else 0,
+                 rtt or 0, 0 if rtt is None else 1,
+                 1 if record.tcp_out_of_order else 0, 1 if record.tcp_zero_window else 0)
+        if rtt is not None:
+            self.add_sample(record.timestamp, rtt)
+
+    def summarize(self, totals, span):
+        return {
+            "retransmissions": totals["retransmissions"],
+            "average_rtt": totals["rtt_sum"] / totals["rtt_count"] if totals["rtt_count"] > 0 else 0,
+            "packet_count": totals["rtt_count"],
+            "segments": totals["segments"],
+            "out_of_order": totals["out_of_order"],
+            "zero_windows": totals["zero_windows"],
+        }
+
+
+@timed("analyze_tcp_metrics")
+def analyze_tcp_metrics(pcap_file, backend="pyshark", workers=1, cache=None):
+    """
+    Analyze TCP retransmissions, round-trip time (RTT), and congestion windows.
+
+    With backend="native" every field is computed in-process by
+    tcp_flows.TCPFlowTable, so tshark's expert analysis is not needed.
+
+    Args:
+        pcap_file (str): Path to the input .pcapng file.
+        backend (str): Reader backend, "pyshark" or "native".
+        workers (int): Worker processes for sharded analysis (native backend).
+        cache (ResultCache, optional): Result cache (see result_cache).
+
+    Returns:
+        dict: Calculated TCP metrics.
+    """
+    return run_analysis(pcap_file, {"tcp": TCPMetricsCollector()}, backend, workers, cache).get("tcp", {})
 
 if __name__ == "__main__":
     pcap_file = "financial_traffics.pcapng"
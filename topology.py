@@ -0,0 +1,303 @@
+import argparse
+import time
+import tracemalloc
+import numpy as np
+
+# Layer codes, top to bottom; the names match the layer attribute of the NetworkX graphs
+LAYERS = ("Core", "Distribution", "Access", "Host")
+CORE, DISTRIBUTION, ACCESS, HOST = range(len(LAYERS))
+
+DEFAULT_DEPARTMENTS = ("Accounting", "IT", "HR")
+
+# Link capacities (Gbps) of each tier's downlinks
+CORE_CAPACITY = 10
+DISTRIBUTION_CAPACITY = 1
+ACCESS_CAPACITY = 0.1
+
+
+class Topology:
+    """
+    Compact integer-indexed fabric in compressed sparse row (CSR) form.
+
+    Nodes are numbered layer by layer (cores, distribution, access, hosts)
+    and described by small NumPy arrays instead of per-node dicts: layer
+    code, department, floor and position within the floor or department.
+    Directed downlinks are stored as CSR arrays: the neighbours of node i
+    are indices[indptr[i]:indptr[i + 1]] with matching capacity entries.
+
+    Node names are rebuilt from those arrays only when asked for, and
+    to_networkx() converts the whole fabric, or just a subset of nodes,
+    for visualization and the NetworkX-based analyses.
+    """
+
+    def __init__(self, layer, department, floor, position, indptr, indices, capacity, departments, redundancy=1):
+        self.layer = layer              # uint8 layer code per node
+        self.department = department    # int32 department index per node (-1 for cores)
+        self.floor = floor              # int32 floor per node (-1 above the access layer)
+        self.position = position        # int32 index within the core set, department or floor
+        self.indptr = indptr            # int64 CSR row offsets (num_nodes + 1)
+        self.indices = indices          # int32 downlink targets
+        self.capacity = capacity        # float64 capacity per downlink
+        self.departments = departments  # Department names
+        self.redundancy = redundancy    # Distribution switches per department
+        self._index = None
+
+    @property
+    def num_nodes(self):
+        return len(self.layer)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the node and edge arrays.
+        """
+        return sum(array.nbytes for array in (self.layer, self.department, self.floor, self.position,
+                                              self.indptr, self.indices, self.capacity))
+
+    def neighbors(self, node):
+        """
+        Downlink targets of a node.
+
+        Returns:
+            numpy.ndarray: Node indices (a view into the CSR arrays).
+        """
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def nodes_in_layer(self, layer):
+        """
+        Indices of the nodes in a layer.
+
+        Args:
+            layer (int or str): Layer code (CORE, ...) or name ("Core", ...).
+        """
+        code = LAYERS.index(layer) if isinstance(layer, str) else layer
+        return np.flatnonzero(self.layer == code)
+
+    def edges(self):
+        """
+        All downlinks as parallel arrays.
+
+        Returns:
+            tuple: (sources, targets, capacities) arrays.
+        """
+        sources = np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(self.indptr))
+        return sources, self.indices, self.capacity
+
+    def name(self, node):
+        """
+        Name of a node, in the FinancialDataCenterNetwork naming scheme.
+        """
+        return self.names([node])[0]
+
+    def names(self, nodes):
+        """
+        Names of many nodes.
+
+        Args:
+            nodes (array-like): Node indices.
+
+        Returns:
+            list: Names in the same order.
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        departments, redundant = self.departments, self.redundancy > 1
+        names = []
+        for layer, dept, floor, position in zip(self.layer[nodes].tolist(), self.department[nodes].tolist(),
+                                                self.floor[nodes].tolist(), self.position[nodes].tolist()):
+            if layer == CORE:
+                names.append(f"CoreSwitch-FDC{position + 1}")
+            elif layer == DISTRIBUTION:
+                # One distribution switch per department keeps the original name
+                names.append(f"DistSwitch-{departments[dept]}-{position + 1}" if redundant
+                             else f"DistSwitch-{departments[dept]}")
+            elif layer == ACCESS:
+                names.append(f"AccessSwitch-{departments[dept]}-Floor{floor + 1}")
+            else:
+                names.append(f"Workstation-{departments[dept]}-Floor{floor + 1}-{position + 1}")
+        return names
+
+    def index(self, name):
+        """
+        Index of a named node (builds a name lookup on first use).
+        """
+        if self._index is None:
+            self._index = {name: node for node, name in enumerate(self.names(np.arange(self.num_nodes)))}
+        return self._index[name]
+
+    def to_networkx(self, nodes=None):
+        """
+        Convert the fabric, or the subgraph on some nodes, to a NetworkX DiGraph.
+
+        Nodes are named as in FinancialDataCenterNetwork and carry layer and
+        department attributes; edges carry capacity.
+
+        Args:
+            nodes (iterable, optional): Node indices to keep (e.g. one department
+                for a readable drawing). Defaults to every node.
+
+        Returns:
+            nx.DiGraph: The converted graph.
+        """
+        import networkx as nx
+
+        keep = np.arange(self.num_nodes) if nodes is None else np.unique(np.asarray(list(nodes), dtype=np.int64))
+        names = self.names(keep)
+        graph = nx.DiGraph()
+        graph.add_nodes_from(
+            (name, {"layer": LAYERS[layer], "department": self.departments[dept]} if dept >= 0 else {"layer": LAYERS[layer]})
+            for name, layer, dept in zip(names, self.layer[keep].tolist(), self.department[keep].tolist())
+        )
+
+        sources, targets, capacities = self.edges()
+        mask = np.isin(sources, keep) & np.isin(targets, keep)
+        lookup = dict(zip(keep.tolist(), names))
+        graph.add_edges_from(
+            (lookup[source], lookup[target], {"capacity": capacity})
+            for source, target, capacity in zip(sources[mask].tolist(), targets[mask].tolist(),
+                                                capacities[mask].tolist())
+        )
+        return graph
+
+
+def department_names(count):
+    """
+    Names for count departments: the original three, then Dept4, Dept5, ...
+    """
+    return [DEFAULT_DEPARTMENTS[i] if i < len(DEFAULT_DEPARTMENTS) else f"Dept{i + 1}" for i in range(count)]
+
+
+def build_fabric(cores=2, departments=3, floors=5, hosts=3, redundancy=1, core_capacity=CORE_CAPACITY,
+                 distribution_capacity=DISTRIBUTION_CAPACITY, access_capacity=ACCESS_CAPACITY):
+    """
+    Build a core / distribution / access / host fabric as a CSR Topology.
+
+    Every distribution switch uplinks to every core, every access switch to
+    each of its department's distribution switches, and every host to its
+    floor's access switch. The defaults reproduce the original
+    3 departments x 5 floors x 3 workstations network.
+
+    Args:
+        cores (int): Core switches.
+        departments (int or list): Number of departments, or their names.
+        floors (int): Floors (access switches) per department.
+        hosts (int): Hosts per floor.
+        redundancy (int): Distribution switches per department.
+        core_capacity (float): Capacity of core-to-distribution links.
+        distribution_capacity (float): Capacity of distribution-to-access links.
+        access_capacity (float): Capacity of access-to-host links.
+
+    Returns:
+        Topology: The fabric.
+    """
+    names = list(departments) if not isinstance(departments, int) else department_names(departments)
+    depts = len(names)
+    n_dist = depts * redundancy
+    n_access = depts * floors
+    n_hosts = n_access * hosts
+    dist_start = cores
+    access_start = dist_start + n_dist
+    host_start = access_start + n_access
+    num_nodes = host_start + n_hosts
+
+    layer = np.repeat(np.array([CORE, DISTRIBUTION, ACCESS, HOST], dtype=np.uint8),
+                      [cores, n_dist, n_access, n_hosts])
+    department = np.concatenate([
+        np.full(cores, -1, dtype=np.int32),
+        np.repeat(np.arange(depts, dtype=np.int32), redundancy),
+        np.repeat(np.arange(depts, dtype=np.int32), floors),
+        np.repeat(np.arange(depts, dtype=np.int32), floors * hosts),
+    ])
+    floor = np.concatenate([
+        np.full(cores + n_dist, -1, dtype=np.int32),
+        np.tile(np.arange(floors, dtype=np.int32), depts),
+        np.repeat(np.tile(np.arange(floors, dtype=np.int32), depts), hosts),
+    ])
+    position = np.concatenate([
+        np.arange(cores, dtype=np.int32),
+        np.tile(np.arange(redundancy, dtype=np.int32), depts),
+        np.tile(np.arange(floors, dtype=np.int32), depts),
+        np.tile(np.arange(hosts, dtype=np.int32), n_access),
+    ])
+
+    # Downlinks grouped by source node, so sources come out sorted
+    dist = np.arange(dist_start, access_start, dtype=np.int64)
+    core_src = np.repeat(np.arange(cores, dtype=np.int64), n_dist)
+    core_dst = np.tile(dist, cores)
+    dist_src = np.repeat(dist, floors)
+    dist_dst = access_start + (department[dist_start:access_start].astype(np.int64)[:, None] * floors
+                               + np.arange(floors)).ravel()
+    access_src = np.repeat(np.arange(access_start, host_start, dtype=np.int64), hosts)
+    access_dst = np.arange(host_start, num_nodes, dtype=np.int64)
+
+    sources = np.concatenate([core_src, dist_src, access_src])
+    indices = np.concatenate([core_dst, dist_dst, access_dst]).astype(np.int32)
+    capacity = np.concatenate([
+        np.full(len(core_src), core_capacity, dtype=np.float64),
+        np.full(len(dist_src), distribution_capacity, dtype=np.float64),
+        np.full(len(access_src), access_capacity, dtype=np.float64),
+    ])
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+
+    return Topology(layer, department, floor, position, indptr, indices, capacity, names, redundancy)
+
+
+def measure_build(**parameters):
+    """
+    Build a fabric and report its build time and memory.
+
+    Args:
+        parameters: build_fabric arguments.
+
+    Returns:
+        tuple: (Topology, report dict with nodes, edges, hosts, seconds,
+        array_bytes and peak_bytes traced while building).
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    topology = build_fabric(**parameters)
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    if not tracing:
+        tracemalloc.stop()
+    return topology, {
+        "nodes": topology.num_nodes,
+        "edges": topology.num_edges,
+        "hosts": len(topology.nodes_in_layer(HOST)),
+        "seconds": round(seconds, 4),
+        "array_bytes": topology.nbytes,
+        "peak_bytes": peak,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a data center fabric and report build time and memory.")
+    parser.add_argument("--cores", type=int, default=4)
+    parser.add_argument("--departments", type=int, default=50)
+    parser.add_argument("--floors", type=int, default=40)
+    parser.add_argument("--hosts", type=int, default=50)
+    parser.add_argument("--redundancy", type=int, default=2)
+    parser.add_argument("--networkx", action="store_true", help="Also time and measure the NetworkX conversion")
+    args = parser.parse_args()
+
+    topology, report = measure_build(cores=args.cores, departments=args.departments, floors=args.floors,
+                              hosts=args.hosts, redundancy=args.redundancy)
+    print(f"{report['hosts']} hosts, {report['nodes']} nodes, {report['edges']} links built in "
+          f"{report['seconds']:.3f}s: {report['array_bytes'] / 1e6:.1f} MB of arrays "
+          f"({report['peak_bytes'] / 1e6:.1f} MB peak while building)")
+
+    if args.networkx:
+        tracemalloc.start()
+        started = time.perf_counter()
+        graph = topology.to_networkx()
+        seconds = time.perf_counter() - started
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"NetworkX conversion: {seconds:.3f}s, {current / 1e6:.1f} MB retained ({peak / 1e6:.1f} MB peak)")
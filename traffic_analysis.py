@@ -1,83 +1,285 @@
-import pyshark
+import argparse
+import itertools
 import sqlite3
-from icmp_metrics import analyze_icmp_metrics
-from tcp_metrics import analyze_tcp_metrics
+import time
+from analysis_engine import MetricCollector, run_analysis
+from anomalies import INSERT_ANOMALY, AnomalyDetector, create_anomaly_table, robust_scores
+from instrumentation import count, stage, timed
+from result_cache import DEFAULT_CACHE_DIR, ResultCache
+from rollups import create_rollup_tables, update_rollups
+from setup_database import convert_legacy_row
+from packet_table import PacketTable, PacketTableCollector, ip_to_int, protocol_code
 import numpy as np
 
-def store_in_database(details):
+INSERT_TRAFFIC_RECORD = """
+    INSERT INTO traffic_records (time, protocol, length, source, destination)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+def record_to_row(record):
+    """
+    Convert a PacketRecord into a traffic_records row.
+
+    Args:
+        record (PacketRecord): The decoded packet.
+
+    Returns:
+        tuple: (time, protocol, length, source, destination) in the numeric schema.
+    """
+    return (
+        record.timestamp,
+        protocol_code(record),
+        record.length,
+        ip_to_int(record.src),
+        ip_to_int(record.dst),
+    )
+
+class TrafficIngestor:
+    """
+    Bulk loader for traffic_records.
+
+    Rows are buffered and written with executemany (one prepared statement
+    reused for the whole batch) inside explicit transactions, with optional
+    WAL journaling and relaxed synchronous mode for fast ingestion. Each
+    batch is also folded into the rollup tables and scored by the anomaly
+    detector in the same transaction.
+    """
+
+    def __init__(self, db_name="network_data.db", batch_size=10000, wal=False, synchronous="NORMAL", rollups=True,
+                 anomalies=True):
+        """
+        Args:
+            db_name (str): Path to the SQLite database.
+            batch_size (int): Rows per executemany call and transaction.
+            wal (bool): Switch the database to WAL journal mode.
+            synchronous (str): SQLite synchronous level ("OFF", "NORMAL", "FULL").
+            rollups (bool): Maintain the 1s/1m/1h rollup tables while ingesting.
+            anomalies (bool or AnomalyDetector): Record anomalous packets in the
+                anomalies table, with a default or the given detector.
+        """
+        self.batch_size = batch_size
+        self.rollups = rollups
+        if anomalies is True:
+            anomalies = AnomalyDetector()
+        self.detector = anomalies or None
+        self.batch = []
+        self.rows = 0
+        self.started = time.perf_counter()
+
+        # Autocommit mode so transactions are controlled explicitly below
+        self.conn = sqlite3.connect(db_name, isolation_level=None)
+        if wal:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA synchronous={synchronous}")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        if rollups:
+            create_rollup_tables(self.conn)
+        if self.detector is not None:
+            create_anomaly_table(self.conn)
+
+    def add(self, row):
+        """
+        Queue one row, flushing when the batch is full.
+
+        Args:
+            row (tuple): (time, protocol, length, source, destination) in the numeric schema.
+        """
+        self.batch.append(row)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def add_rows(self, rows):
+        """
+        Queue many rows in batch_size chunks.
+
+        Args:
+            rows (iterable): Row tuples.
+        """
+        rows = iter(rows)
+        while True:
+            self.batch.extend(itertools.islice(rows, self.batch_size - len(self.batch)))
+            if len(self.batch) < self.batch_size:
+                break
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered rows in a single transaction.
+
+        Any error in the batch (SQLite, rollups or anomaly scoring) rolls the
+        transaction back, so the connection stays usable for the next flush.
+        """
+        if not self.batch:
+            return
+        with stage("sqlite_insert"):
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(INSERT_TRAFFIC_RECORD, self.batch)
+                if self.rollups:
+                    with stage("rollup_update"):
+                        update_rollups(self.conn, self.batch)
+                if self.detector is not None:
+                    with stage("anomaly_detection"):
+                        anomalies = self.detector.process(self.batch)
+                        self.conn.executemany(INSERT_ANOMALY, anomalies)
+                    count("anomalies", len(anomalies))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                raise
+        count("rows_inserted", len(self.batch))
+        self.rows += len(self.batch)
+        self.batch = []
+
+    def close(self):
+        """
+        Flush remaining rows, close the connection and report throughput.
+
+        Returns:
+            dict: Rows inserted, elapsed seconds, rows per second and anomalies recorded.
+        """
+        try:
+            self.flush()
+            # Refresh planner statistics for the indexes after a bulk load
+            self.conn.execute("PRAGMA optimize")
+        finally:
+            self.conn.close()
+        elapsed = time.perf_counter() - self.started
+        return {
+            "rows": self.rows,
+            "seconds": round(elapsed, 4),
+            "rows_per_sec": round(self.rows / elapsed, 1) if elapsed > 0 else 0,
+            "anomalies": self.detector.anomalies if self.detector is not None else 0,
+        }
+
+class IngestCollector(MetricCollector):
+    """
+    Stream packets into traffic_records while the capture is being decoded.
+    """
+
+    def __init__(self, ingestor, protocols=["UDP", "TCP", "ICMP"]):
+        self.protocols = tuple(p.lower() for p in protocols)
+        self.ingestor = ingestor
+
+    def process(self, record):
+        self.ingestor.add(record_to_row(record))
+
+    def result(self):
+        return self.ingestor.close()
+
+def store_in_database(details, db_name="network_data.db", batch_size=10000, wal=False, synchronous="NORMAL",
+                      anomalies=True):
     """
     Store traffic details in the SQLite database.
 
     Args:
-        details (list): List of traffic details as dictionaries.
+        details (PacketTable or list): Packet table, or list of traffic details as dictionaries.
+        db_name (str): Path to the SQLite database.
+        batch_size (int): Rows per executemany batch and transaction.
+        wal (bool): Switch the database to WAL journal mode.
+        synchronous (str): SQLite synchronous level ("OFF", "NORMAL", "FULL").
+        anomalies (bool or AnomalyDetector): Record anomalous packets (see TrafficIngestor).
+
+    Returns:
+        dict: Ingestion statistics (rows, seconds, rows_per_sec, anomalies), or {} on error.
+    """
+    if isinstance(details, PacketTable):
+        rows = details.db_rows()
+    else:
+        rows = (convert_legacy_row((detail['time'], detail['protocol'], detail['length'], detail['source'],
+                                    detail['destination'])) for detail in details)
+
+    try:
+        ingestor = TrafficIngestor(db_name, batch_size, wal, synchronous, anomalies=anomalies)
+        try:
+            ingestor.add_rows(rows)
+        finally:
+            stats = ingestor.close()
+        print(f"Traffic details saved to database ({stats['rows']} rows, {stats['rows_per_sec']} rows/sec, "
+              f"{stats['anomalies']} anomalies).")
+        return stats
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return {}
+
+def ingest_capture(pcap_file, protocols=["UDP", "TCP", "ICMP"], backend="pyshark", db_name="network_data.db",
+                   batch_size=10000, wal=True, synchronous="NORMAL", anomalies=True):
+    """
+    Stream a capture straight into the database without holding it in memory.
+
+    Args:
+        pcap_file (str): Path to the input .pcapng file.
+        protocols (list): List of protocols to ingest.
+        backend (str): Reader backend, "pyshark" or "native".
+        db_name (str): Path to the SQLite database.
+        batch_size (int): Rows per executemany batch and transaction.
+        wal (bool): Switch the database to WAL journal mode.
+        synchronous (str): SQLite synchronous level ("OFF", "NORMAL", "FULL").
+        anomalies (bool or AnomalyDetector): Record anomalous packets (see TrafficIngestor).
+
+    Returns:
+        dict: Ingestion statistics (rows, seconds, rows_per_sec, anomalies), or {} on error.
     """
     try:
-        conn = sqlite3.connect("network_data.db")
-        cursor = conn.cursor()
-
-        # Insert records
-        for detail in details:
-            cursor.execute("""
-                INSERT INTO traffic_records (time, protocol, length, source, destination)
-                VALUES (?, ?, ?, ?, ?)
-            """, (detail['time'], detail['protocol'], detail['length'], detail['source'], detail['destination']))
-
-        conn.commit()
-        print("Traffic details saved to database.")
+        ingestor = TrafficIngestor(db_name, batch_size, wal, synchronous, anomalies=anomalies)
     except sqlite3.Error as e:
         print(f"Database error: {e}")
-    finally:
-        conn.close()
+        return {}
+    stats = run_analysis(pcap_file, {"ingest": IngestCollector(ingestor, protocols)}, backend).get("ingest")
+    if stats is None:
+        try:
+            ingestor.close()
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+        return {}
+    print(f"Ingested {stats['rows']} rows from {pcap_file} ({stats['rows_per_sec']} rows/sec, "
+          f"{stats['anomalies']} anomalies).")
+    return stats
 
-def extract_traffic(pcap_file, output_file, src_ip, dst_ip, protocols=["UDP", "TCP", "ICMP"]):
+@timed("extract_traffic")
+def extract_traffic(pcap_file, output_file, src_ip, dst_ip, protocols=["UDP", "TCP", "ICMP"], backend="pyshark", workers=1,
+                    db_name="network_data.db", binary_file=None, cache=None):
     """
     Extract traffic for specified protocols from a given .pcapng file and save details to a text file.
 
+    Packets are held in a columnar PacketTable while the report and database are written.
+
     Args:
         pcap_file (str): Path to the input .pcapng file.
-        output_file (str): Path to the output text file.
+        output_file (str): Path to the output text file, or None to skip the text export.
         src_ip (str): Source IP to filter.
         dst_ip (str): Destination IP to filter.
         protocols (list): List of protocols to filter (e.g., ["UDP", "TCP", "ICMP"]).
+        backend (str): Reader backend, "pyshark" or "native".
+        workers (int): Worker processes for sharded analysis (native backend).
+        db_name (str): Path to the SQLite database.
+        binary_file (str, optional): Also save the table as a binary .npy file
+            (see PacketTable.save), which calculate_general_metrics loads directly.
+        cache (ResultCache, optional): Reuse the packet table of an earlier run
+            on the same capture, reading only packets appended since (see result_cache).
+
+    Returns:
+        PacketTable or None: The extracted packets, or None if extraction failed.
     """
     print(f"Analyzing {pcap_file} to extract traffic for protocols: {', '.join(protocols)}...")
-    traffic_details = []
 
     try:
-        # Open the .pcapng file with protocol filter
-        cap = pyshark.FileCapture(pcap_file, display_filter=" or ".join([p.lower() for p in protocols]))
+        results = run_analysis(pcap_file, {"table": PacketTableCollector(protocols)}, backend, workers, cache)
+        if "table" not in results:
+            return
+        table = results["table"]
 
-        for packet in cap:
-            try:
-                protocol = packet.transport_layer if hasattr(packet, "transport_layer") else "N/A"
-                length = int(packet.length) if hasattr(packet, "length") else "N/A"
-                source = packet.ip.src if hasattr(packet, "ip") else "N/A"
-                destination = packet.ip.dst if hasattr(packet, "ip") else "N/A"
-                time = str(packet.sniff_time)
-
-                traffic_details.append({
-                    "time": time,
-                    "protocol": protocol,
-                    "length": length,
-                    "source": source,
-                    "destination": destination
-                })
-            except AttributeError:
-                continue
-
-        cap.close()
-        with open(output_file, "w") as f:
-            f.write("Filtered Traffic Details:\n")
-            f.write("=" * 40 + "\n")
-            for detail in traffic_details:
-                f.write(
-                    f"Time: {detail['time']}, Protocol: {detail['protocol']}, "
-                    f"Length: {detail['length']}, Source: {detail['source']}, "
-                    f"Destination: {detail['destination']}\n"
-                )
-
-        store_in_database(traffic_details)
-        print(f"Filtered traffic details saved to {output_file} and database.")
+        if output_file:
+            with stage("write_text"):
+                count("bytes_written", table.write_text(output_file))
+        if binary_file:
+            with stage("write_binary"):
+                count("bytes_written", table.save(binary_file))
+        store_in_database(table, db_name)
+        saved = ", ".join(name for name in (output_file, binary_file) if name)
+        print(f"Filtered traffic details saved to {saved + ' and ' if saved else ''}database.")
+        return table
     except FileNotFoundError:
         print(f"Error: File {pcap_file} not found.")
     except Exception as e:
@@ -85,28 +287,37 @@ def extract_traffic(pcap_file, output_file, src_ip, dst_ip, protocols=["UDP", "T
 
 def detect_anomalies(metrics, threshold=3):
     """
-    Detect anomalies based on z-score.
+    Detect anomalies based on the median/MAD (modified z) score.
+
+    Ingestion already records anomalous packets in the anomalies table as it
+    goes (see anomalies.AnomalyDetector); this scores one in-memory batch.
 
     Args:
-        metrics (list): List of packet sizes or latencies.
-        threshold (int): Z-score threshold for anomaly detection.
+        metrics (PacketTable or list): Packet table (packet lengths are scored) or list of packet sizes or latencies.
+        threshold (int): Score threshold for anomaly detection.
     """
-    import numpy as np
+    values = metrics.length if isinstance(metrics, PacketTable) else metrics
+    values = np.asarray(values, dtype=np.float64)
 
-    mean = np.mean(metrics)
-    std_dev = np.std(metrics)
-    anomalies = [x for x in metrics if abs((x - mean) / std_dev) > threshold]
+    scores, _ = robust_scores(values)
+    anomalies = values[np.abs(scores) > threshold].tolist()
 
-    print(f"Detected {len(anomalies)} anomalies out of {len(metrics)} samples.")
+    print(f"Detected {len(anomalies)} anomalies out of {len(values)} samples.")
     return anomalies
 
 
 if __name__ == "__main__":
-    
+    parser = argparse.ArgumentParser(description="Extract the capture's traffic into a report, a packet table and the database.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Reuse capture analysis results kept here")
+    parser.add_argument("--no-cache", action="store_true", help="Decode the capture from scratch")
+    args = parser.parse_args()
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+
     pcap_file = "financial_traffics.pcapng"             # Example capture file
     output_file = "financial_traffic_details.txt"       # Output file name
+    binary_file = "financial_traffic_details.npy"       # Binary table for calculate_general_metrics
     src_ip = "192.168.50.190"                           # Single source IP
     dst_ip = "192.168.50.1"                             # Single destination IP
 
     # Extract UDP traffic details
-    extract_traffic(pcap_file, output_file, src_ip, dst_ip)
+    extract_traffic(pcap_file, output_file, src_ip, dst_ip, binary_file=binary_file, cache=cache)
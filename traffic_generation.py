@@ -1,7 +1,207 @@
+import ipaddress
+import os
 import random
-from scapy.all import sendp, Ether, IP, UDP, TCP, ICMP
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from scapy.all import conf, Ether, IP, UDP, TCP, ICMP, Raw
+from topology import HOST
 
-def generate_traffic(src_ip, dst_ip, iface, packet_count=10):
+DEFAULT_BATCH_SIZE = 256  # Frames handed to the sink per call
+DEFAULT_MIX = {"UDP": 0.6, "TCP": 0.3, "ICMP": 0.1}  # Protocol shares of generated flows
+TICK = 0.01  # Scheduling interval of the multi-flow generator, in seconds
+
+
+def build_frame(protocol, src_ip, dst_ip, sport=1024, dport=80, size=None):
+    """
+    Build and serialize one packet.
+
+    Args:
+        protocol (str): "UDP", "TCP" or "ICMP".
+        src_ip (str): Source IP address.
+        dst_ip (str): Destination IP address.
+        sport (int): UDP/TCP source port.
+        dport (int): UDP/TCP destination port.
+        size (int, optional): Pad the frame with payload up to this many bytes.
+
+    Returns:
+        bytes or None: Raw Ethernet frame, or None for an unknown protocol.
+    """
+    if protocol == "UDP":
+        packet = Ether() / IP(src=src_ip, dst=dst_ip) / UDP(dport=dport, sport=sport)
+    elif protocol == "TCP":
+        packet = Ether() / IP(src=src_ip, dst=dst_ip) / TCP(dport=dport, sport=sport)
+    elif protocol == "ICMP":
+        packet = Ether() / IP(src=src_ip, dst=dst_ip) / ICMP()
+    else:
+        print(f"Error in generating packet: unknown protocol {protocol}.")
+        return None
+    if size is not None and size > len(packet):
+        packet = packet / Raw(b"\x00" * (size - len(packet)))
+    return bytes(packet)
+
+
+def build_templates(src_ip, dst_ip, protocols=("UDP", "TCP", "ICMP"), sport=1024, dport=80):
+    """
+    Build and serialize one packet per protocol.
+
+    Scapy is only used here; the send loop reuses the serialized bytes.
+
+    Args:
+        src_ip (str): Source IP address.
+        dst_ip (str): Destination IP address.
+        protocols (iterable): Protocols to build ("UDP", "TCP" or "ICMP").
+        sport (int): UDP/TCP source port.
+        dport (int): UDP/TCP destination port.
+
+    Returns:
+        dict: Mapping of protocol name to raw Ethernet frame bytes.
+    """
+    templates = {}
+    for protocol in protocols:
+        frame = build_frame(protocol, src_ip, dst_ip, sport, dport)
+        if frame is not None:
+            templates[protocol] = frame
+    return templates
+
+
+class SocketSink:
+    """
+    Send frames over one layer-2 socket opened for the whole run.
+    """
+
+    def __init__(self, iface):
+        self.socket = conf.L2socket(iface=iface)
+
+    def send(self, frames):
+        for frame in frames:
+            self.socket.send(frame)
+        return len(frames)
+
+    def close(self):
+        self.socket.close()
+
+
+class PcapSink:
+    """
+    Write frames to a classic pcap file (Ethernet link type) for later replay.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        self.record = struct.Struct("<IIII")
+
+    def send(self, frames):
+        now = time.time()
+        sec, usec = int(now), int((now % 1) * 1e6)
+        pack = self.record.pack
+        self.file.write(b"".join(pack(sec, usec, len(frame), len(frame)) + frame for frame in frames))
+        return len(frames)
+
+    def close(self):
+        self.file.close()
+
+
+class NullSink:
+    """
+    Discard frames, counting them; measures the generator's own ceiling.
+    """
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+
+    def send(self, frames):
+        self.packets += len(frames)
+        self.bytes += sum(len(frame) for frame in frames)
+        return len(frames)
+
+    def close(self):
+        pass
+
+
+class TokenBucket:
+    """
+    Token-bucket pacer: tokens accrue at `rate` per second up to `burst`.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        Args:
+            rate (float): Tokens (packets) per second.
+            burst (float, optional): Bucket capacity. Defaults to one batch worth (rate / 100, at least 1).
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate / 100)
+        self.tokens = self.burst
+        self.last = time.perf_counter()
+
+    def consume(self, n):
+        """
+        Block until n tokens are available, then take them.
+
+        Args:
+            n (int): Tokens to take.
+        """
+        while True:
+            now = time.perf_counter()
+            self.tokens = min(max(self.burst, n), self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= n:
+                self.tokens -= n
+                return
+            time.sleep((n - self.tokens) / self.rate)
+
+
+def send_paced(templates, sink, rate=None, packet_count=None, duration=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Send randomly mixed template frames in batches, paced to a target rate.
+
+    Args:
+        templates (dict): Protocol to frame bytes mapping (see build_templates).
+        sink: Object with send(frames) returning the number sent (SocketSink, PcapSink, NullSink).
+        rate (float, optional): Target packets per second; None sends as fast as possible.
+        packet_count (int, optional): Stop after this many packets.
+        duration (float, optional): Stop after this many seconds.
+        batch_size (int): Maximum frames per sink call; smaller at low rates to keep pacing smooth.
+
+    Returns:
+        dict: requested_pps, achieved_pps, packets and seconds.
+    """
+    if packet_count is None and duration is None:
+        raise ValueError("packet_count or duration is required")
+    frames = list(templates.values())
+    if not frames:
+        return {"requested_pps": rate, "achieved_pps": 0, "packets": 0, "seconds": 0}
+
+    bucket = TokenBucket(rate) if rate else None
+    if rate:
+        batch_size = max(1, min(batch_size, int(rate / 100)))
+    remaining = packet_count if packet_count is not None else float("inf")
+    sent = 0
+    start = time.perf_counter()
+    deadline = start + duration if duration is not None else None
+
+    while remaining > 0:
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        batch = int(min(batch_size, remaining))
+        if bucket is not None:
+            bucket.consume(batch)
+        sent += sink.send(random.choices(frames, k=batch))
+        remaining -= batch
+
+    seconds = time.perf_counter() - start
+    return {
+        "requested_pps": rate,
+        "achieved_pps": sent / seconds if seconds > 0 else 0,
+        "packets": sent,
+        "seconds": seconds,
+    }
+
+
+def generate_traffic(src_ip, dst_ip, iface, packet_count=10, rate=None, sink=None):
     """
     Generate synthetic traffic by sending UDP packets from src_ip to dst_ip on the given interface.
 
@@ -10,28 +210,27 @@ def generate_traffic(src_ip, dst_ip, iface, packet_count=10):
         dst_ip (str): Destination IP address.
         iface (str): Network interface to use for sending packets.
         packet_count (int): Number of packets to send.
+        rate (float, optional): Target packets per second; None sends as fast as possible.
+        sink (optional): Frame sink; defaults to a SocketSink on iface.
+
+    Returns:
+        dict: Send statistics (see send_paced).
     """
     print(f"Generating {packet_count} packets (randomly, UDP, TCP, or ICMP) from {src_ip} to {dst_ip} on interface {iface}...")
-    total_packets = 0
-    
-    for _ in range(packet_count):
-        protocol_choice = random.choice(["UDP", "TCP", "ICMP"])
-        if protocol_choice == "UDP":
-            packet = Ether() / IP(src=src_ip, dst=dst_ip) / UDP(dport=80, sport=1024)
-        elif protocol_choice == "TCP":
-            packet = Ether() / IP(src=src_ip, dst=dst_ip) / TCP(dport=80, sport=1024)
-        elif protocol_choice == "ICMP":
-            packet = Ether() / IP(src=src_ip, dst=dst_ip) / ICMP()
-            packet = Ether() / IP(src=src_ip, dst=dst_ip) / ICMP()
-        else:
-            print("Error in generating packet.")
-            continue
-        sendp(packet, iface=iface, verbose=False)
-        total_packets += 1
-        
-    print(f"Traffic generation completed. Total packets sent: {total_packets}")
-
-def stress_test(src_ip, dst_ip, iface, protocols, packet_rates):
+    templates = build_templates(src_ip, dst_ip)
+    owned = sink is None
+    sink = SocketSink(iface) if owned else sink
+    try:
+        stats = send_paced(templates, sink, rate, packet_count=packet_count)
+    finally:
+        if owned:
+            sink.close()
+
+    print(f"Traffic generation completed. Total packets sent: {stats['packets']} ({stats['achieved_pps']:.0f} pps)")
+    return stats
+
+
+def stress_test(src_ip, dst_ip, iface, protocols, packet_rates, duration=1.0, sink=None):
     """
     Perform scalability testing by sending traffic at various loads.
 
@@ -41,18 +240,249 @@ def stress_test(src_ip, dst_ip, iface, protocols, packet_rates):
         iface (str): Network interface.
         protocols (list): List of protocols to use.
         packet_rates (list): List of packet rates (packets per second).
+        duration (float): Seconds to hold each rate.
+        sink (optional): Frame sink; defaults to a SocketSink on iface.
+
+    Returns:
+        list: Send statistics per rate, including requested and achieved pps.
+    """
+    templates = build_templates(src_ip, dst_ip, protocols)
+    owned = sink is None
+    sink = SocketSink(iface) if owned else sink
+    results = []
+    try:
+        for rate in packet_rates:
+            print(f"Generating traffic at {rate} packets/second.")
+            stats = send_paced(templates, sink, rate, duration=duration)
+            print(f"  Achieved {stats['achieved_pps']:.0f} pps ({stats['packets']} packets in {stats['seconds']:.2f}s)")
+            results.append(stats)
+    finally:
+        if owned:
+            sink.close()
+    return results
+
+def _hosts(network):
+    # Host names in node order, from the CSR topology when there is one (no NetworkX conversion)
+    topology = getattr(network, "topology", network)
+    if hasattr(topology, "nodes_in_layer"):
+        return topology.names(topology.nodes_in_layer(HOST))
+    graph = getattr(network, "network", network)
+    return [node for node, layer in graph.nodes(data="layer") if layer == "Host"]
+
+
+def host_addresses(network, base="10.0.0.1"):
+    """
+    Assign sequential IPv4 addresses to the hosts of a topology.
+
+    Args:
+        network (FinancialDataCenterNetwork, Topology or nx.Graph): Built
+            topology; hosts are the traffic endpoints.
+        base (str): Address of the first host.
+
+    Returns:
+        dict: Mapping of host name to IPv4 address, in node order.
+    """
+    first = ipaddress.IPv4Address(base)
+    return {host: str(first + index) for index, host in enumerate(_hosts(network))}
+
+
+def make_flows(pairs, flow_count, rate, mix=DEFAULT_MIX, sizes=(64, 1500), burst=None, seed=None):
+    """
+    Describe a mix of concurrent flows between address pairs.
+
+    Every flow gets its own ephemeral source port (and a random service
+    port for UDP/TCP), so flows hash onto different equal-cost paths.
+
+    Args:
+        pairs (list or callable): (src_ip, dst_ip) tuples to draw endpoints
+            from, or a function drawing one pair from a random.Random.
+        flow_count (int): Number of flows.
+        rate (float): Packets per second per flow while it is on.
+        mix (dict): Protocol to share of flows.
+        sizes (tuple): (min, max) frame size in bytes, drawn per flow.
+        burst (tuple, optional): (on, off) seconds for on/off flows; None keeps every flow on.
+        seed (int, optional): Random seed for reproducible mixes.
+
+    Returns:
+        list: Flow dicts with src, dst, protocol, sport, dport, size, rate, on, off and phase.
     """
-    for rate in packet_rates:
-        print(f"Generating traffic at {rate} packets/second.")
-        for _ in range(rate):
-            protocol = random.choice(protocols)
-            if protocol == "UDP":
-                packet = Ether() / IP(src=src_ip, dst=dst_ip) / UDP(dport=80, sport=1024)
-            elif protocol == "TCP":
-                packet = Ether() / IP(src=src_ip, dst=dst_ip) / TCP(dport=80, sport=1024)
-            elif protocol == "ICMP":
-                packet = Ether() / IP(src=src_ip, dst=dst_ip) / ICMP()
-            sendp(packet, iface=iface, verbose=False)
+    rng = random.Random(seed)
+    draw = pairs if callable(pairs) else lambda rng: rng.choice(pairs)
+    protocols, weights = zip(*mix.items())
+    flows = []
+    for _ in range(flow_count):
+        src, dst = draw(rng)
+        on, off = burst if burst else (None, 0)
+        flows.append({
+            "src": src,
+            "dst": dst,
+            "protocol": rng.choices(protocols, weights)[0],
+            "sport": rng.randint(1024, 65535),
+            "dport": rng.choice((80, 443, 8080, rng.randint(1024, 65535))),
+            "size": rng.randint(*sizes),
+            "rate": rate,
+            "on": on,
+            "off": off,
+            "phase": rng.uniform(0, on + off) if burst else 0,
+        })
+    return flows
+
+
+def network_flows(network, flow_count, rate, mix=DEFAULT_MIX, sizes=(64, 1500), burst=None, seed=None,
+                  base="10.0.0.1"):
+    """
+    Flows between random host pairs of a FinancialDataCenterNetwork.
+
+    Pairs are drawn as host indices (redrawing when both ends coincide) and
+    mapped to addresses arithmetically, as in host_addresses(), so the cost
+    grows with flow_count rather than with the square of the host count.
+
+    Args:
+        network (FinancialDataCenterNetwork, Topology or nx.Graph): Built topology.
+        flow_count, rate, mix, sizes, burst, seed: See make_flows.
+        base (str): Address of the first host.
+
+    Returns:
+        list: Flow dicts (see make_flows).
+    """
+    topology = getattr(network, "topology", network)
+    if hasattr(topology, "nodes_in_layer"):
+        hosts = len(topology.nodes_in_layer(HOST))
+    else:
+        hosts = len(_hosts(network))
+    if hosts < 2:
+        raise ValueError("network_flows needs at least two hosts")
+    first = ipaddress.IPv4Address(base)
+
+    def draw(rng):
+        src = rng.randrange(hosts)
+        dst = rng.randrange(hosts)
+        while dst == src:
+            dst = rng.randrange(hosts)
+        return str(first + src), str(first + dst)
+
+    return make_flows(draw, flow_count, rate, mix, sizes, burst, seed)
+
+
+def open_sink(kind, target=None, worker=0):
+    """
+    Open a sink inside a worker process.
+
+    Args:
+        kind (str): "socket" (target is the interface), "pcap" (target is a
+            path prefix; each worker writes <target>.<worker>.pcap) or "null".
+        target (str, optional): Interface name or path prefix.
+        worker (int): Worker index.
+
+    Returns:
+        SocketSink, PcapSink or NullSink.
+    """
+    if kind == "socket":
+        return SocketSink(target)
+    if kind == "pcap":
+        return PcapSink(f"{target}.{worker}.pcap")
+    if kind == "null":
+        return NullSink()
+    raise ValueError(f"Unknown sink {kind}")
+
+
+def _flow_active(flow, elapsed):
+    if flow["on"] is None:
+        return True
+    return (elapsed + flow["phase"]) % (flow["on"] + flow["off"]) < flow["on"]
+
+
+def run_flows(flows, duration, sink_kind="null", target=None, worker=0):
+    """
+    Send a set of flows from one process for a fixed duration.
+
+    Each flow accrues send credit at its rate while it is on (a token bucket
+    per flow); every TICK the due frames of all flows are sent as one batch.
+
+    Args:
+        flows (list): Flow dicts (see make_flows).
+        duration (float): Seconds to run.
+        sink_kind (str): Sink type (see open_sink).
+        target (str, optional): Sink target (see open_sink).
+        worker (int): Worker index.
+
+    Returns:
+        dict: worker, flows, packets, bytes, seconds and per-protocol packet counts.
+    """
+    frames = [build_frame(f["protocol"], f["src"], f["dst"], f["sport"], f["dport"], f["size"]) for f in flows]
+    credit = [0.0] * len(flows)
+    counters = {"worker": worker, "flows": len(flows), "packets": 0, "bytes": 0, "protocols": {}}
+
+    sink = open_sink(sink_kind, target, worker)
+    try:
+        start = last = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            elapsed = now - start
+            if elapsed >= duration:
+                break
+            interval = now - last
+            last = now
+            batch = []
+            for index, flow in enumerate(flows):
+                if frames[index] is None or not _flow_active(flow, elapsed):
+                    continue
+                credit[index] += flow["rate"] * interval
+                due = int(credit[index])
+                if due:
+                    credit[index] -= due
+                    batch += [frames[index]] * due
+                    counters["protocols"][flow["protocol"]] = counters["protocols"].get(flow["protocol"], 0) + due
+                    counters["bytes"] += due * len(frames[index])
+            if batch:
+                counters["packets"] += sink.send(batch)
+            delay = TICK - (time.perf_counter() - now)
+            if delay > 0:
+                time.sleep(delay)
+    finally:
+        sink.close()
+
+    counters["seconds"] = time.perf_counter() - start
+    return counters
+
+
+def load_test(flows, duration=10.0, workers=None, sink_kind="null", target=None):
+    """
+    Spread flows across a process pool and aggregate the workers' send counters.
+
+    Args:
+        flows (list): Flow dicts (see make_flows or network_flows).
+        duration (float): Seconds to run.
+        workers (int, optional): Worker processes. Defaults to os.cpu_count().
+        sink_kind (str): Sink type (see open_sink).
+        target (str, optional): Sink target (see open_sink).
+
+    Returns:
+        dict: requested_pps, achieved_pps, packets, bytes, protocols and per-worker counters.
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(flows)))
+    shares = [flows[worker::workers] for worker in range(workers)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_flows, share, duration, sink_kind, target, worker)
+                   for worker, share in enumerate(shares)]
+        per_worker = [future.result() for future in futures]
+
+    requested = sum(f["rate"] * (f["on"] / (f["on"] + f["off"]) if f["on"] else 1) for f in flows)
+    protocols = {}
+    for counters in per_worker:
+        for protocol, count in counters["protocols"].items():
+            protocols[protocol] = protocols.get(protocol, 0) + count
+    packets = sum(counters["packets"] for counters in per_worker)
+    seconds = max(counters["seconds"] for counters in per_worker)
+    return {
+        "requested_pps": requested,
+        "achieved_pps": packets / seconds if seconds > 0 else 0,
+        "packets": packets,
+        "bytes": sum(counters["bytes"] for counters in per_worker),
+        "protocols": protocols,
+        "workers": per_worker,
+    }
 
 if __name__ == "__main__":
     # Network parameters
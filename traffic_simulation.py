@@ -0,0 +1,403 @@
+import ipaddress
+import sqlite3
+import time
+import numpy as np
+from protocols import int_to_ip
+from topology import ACCESS, DISTRIBUTION, HOST
+
+CAPACITY_UNIT = 1e9  # Bits per second per unit of edge capacity (capacities are in Gbps)
+DEFAULT_TICK = 1.0   # Seconds of traffic allocated at a time
+TOLERANCE = 1e-9
+
+_HASH_MULTIPLIER = 0x9E3779B1  # Spreads (source, destination) pairs over ECMP paths
+
+
+def _at_most(a, b):
+    return a <= b + TOLERANCE * np.maximum(1.0, np.abs(b))
+
+
+def max_min_fair(flow, link, weight, capacity, demand):
+    """
+    Max-min fair rates of flows sharing capacitated links.
+
+    Equivalent to progressive filling (all unfrozen flows grow at the same
+    rate until a link saturates or a flow reaches its demand), but each
+    round freezes every bottleneck whose outcome is already decided
+    instead of only the globally first one:
+
+    - a link saturates at level (capacity - frozen load) / active weight;
+      a link whose level is the lowest among all links its active flows
+      cross, and none of whose flows wants less, is a bottleneck, and its
+      flows are frozen at that level;
+    - a flow whose demand is below the level of every link it crosses is
+      frozen at its demand.
+
+    Only links that saturate earlier could stop those flows sooner, so the
+    result is exact, while the number of rounds drops from the number of
+    bottleneck levels to the depth of their dependencies. Links whose total
+    offered load fits their capacity can never saturate and are dropped up
+    front, so flows crossing only such links get their demand outright.
+
+    Args:
+        flow (numpy.ndarray): Flow index of every (flow, link) incidence.
+        link (numpy.ndarray): Link index of every incidence.
+        weight (numpy.ndarray): Share of the flow carried on that link (ECMP splits are < 1).
+        capacity (numpy.ndarray): Capacity per link.
+        demand (numpy.ndarray): Offered rate per flow, in capacity units.
+
+    Returns:
+        numpy.ndarray: Allocated rate per flow.
+    """
+    demand = np.asarray(demand, dtype=np.float64)
+    rate = demand.copy()
+    offered = np.bincount(link, weights=weight * demand[flow], minlength=len(capacity))
+    keep = (offered > capacity * (1 + TOLERANCE))[link] & (demand[flow] > 0)
+    if not keep.any():
+        return rate
+    flow, link, weight = flow[keep], link[keep], weight[keep]
+    links, link = np.unique(link, return_inverse=True)
+    capacity = capacity[links]
+    n_links = len(links)
+
+    active = np.zeros(len(demand), dtype=bool)
+    active[flow] = True
+    rate[active] = 0.0
+    while True:
+        growing = active[flow]
+        if not growing.any():
+            break
+        fill = np.bincount(link, weights=weight * growing, minlength=n_links)
+        frozen = np.bincount(link, weights=weight * rate[flow] * ~growing, minlength=n_links)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            level = np.where(fill > TOLERANCE, (capacity - frozen) / fill, np.inf)
+
+        f, l = flow[growing], link[growing]
+        flow_level = np.full(len(demand), np.inf)
+        np.minimum.at(flow_level, f, level[l])          # Lowest level on each flow's path
+        neighbour_level = np.full(n_links, np.inf)
+        np.minimum.at(neighbour_level, l, flow_level[f])  # Lowest level reachable through each link's flows
+        lowest_demand = np.full(n_links, np.inf)
+        np.minimum.at(lowest_demand, l, demand[f])
+
+        capped = active & _at_most(demand, flow_level)
+        bottleneck = np.isfinite(level) & _at_most(level, neighbour_level) & _at_most(level, lowest_demand)
+        limited = np.zeros(len(demand), dtype=bool)
+        limited[f[bottleneck[l]]] = True
+        limited &= ~capped
+
+        rate[capped] = demand[capped]
+        rate[limited] = flow_level[limited]
+        active &= ~(capped | limited)
+    return rate
+
+
+class TrafficSimulator:
+    """
+    Capacity-aware traffic-matrix simulation over a CSR Topology.
+
+    Every downlink of the topology has an uplink twin of the same capacity
+    (links are full duplex): link e is the downlink, link e + num_edges its
+    uplink. At construction the equal-cost uplink sets of each tier are
+    precomputed as arrays (host to access switch, access switch to each
+    distribution switch of its department, distribution switch to each
+    core), so the links of any host-to-host path are gathered for a whole
+    batch of flows with array indexing:
+
+    - same access switch: host up, host down
+    - same department: up and down through each distribution switch
+    - other department: up through each distribution switch and core, down
+      through each distribution switch of the destination department
+
+    With ecmp="split" a flow is spread evenly over all equal-cost paths
+    (the fluid limit of per-flow hashing); with ecmp="hash" each
+    source/destination pair hashes onto one path, as a switch would.
+    """
+
+    def __init__(self, topology, ecmp="split", capacity_unit=CAPACITY_UNIT, base_address="10.0.0.1"):
+        """
+        Args:
+            topology (Topology or FinancialDataCenterNetwork): Fabric built by build_fabric.
+            ecmp (str): "split" or "hash".
+            capacity_unit (float): Bits per second per unit of edge capacity.
+            base_address (str): Address of the first host; hosts are numbered
+                in node order as in traffic_generation.host_addresses.
+        """
+        topology = getattr(topology, "topology", topology)
+        if ecmp not in ("split", "hash"):
+            raise ValueError(f"Unknown ECMP mode: {ecmp}")
+        self.topology = topology
+        self.ecmp = ecmp
+        self.capacity_unit = capacity_unit
+        self.base_address = int(ipaddress.IPv4Address(base_address))
+
+        sources, targets, capacity = topology.edges()
+        self.sources, self.targets = sources, targets
+        self.num_edges = len(targets)
+        self.capacity = np.concatenate([capacity, capacity])
+
+        self.hosts = topology.nodes_in_layer(HOST)
+        access = topology.nodes_in_layer(ACCESS)
+        dist = topology.nodes_in_layer(DISTRIBUTION)
+        self.row = np.full(topology.num_nodes, -1, dtype=np.int64)
+        for nodes in (self.hosts, access, dist):
+            self.row[nodes] = np.arange(len(nodes))
+
+        self.host_edge = self._in_edges(self.hosts)[:, 0]       # access -> host edge per host
+        self.host_access = self.row[sources[self.host_edge]]    # Access switch row per host
+        self.access_edges = self._in_edges(access)              # (access, R) dist -> access edges
+        self.dist_edges = self._in_edges(dist)                  # (dist, C) core -> dist edges
+        self.access_dist = self.row[sources[self.access_edges]]  # (access, R) distribution switch rows
+        self.access_department = topology.department[access]
+
+    def _in_edges(self, nodes):
+        order = np.argsort(self.targets, kind="stable")
+        starts = np.searchsorted(self.targets[order], nodes)
+        ends = np.searchsorted(self.targets[order], nodes, side="right")
+        degree = ends - starts
+        if len(nodes) and not (degree == degree[0]).all():
+            raise ValueError("TrafficSimulator needs a regular fabric (see topology.build_fabric)")
+        width = int(degree[0]) if len(nodes) else 0
+        return order[starts[:, None] + np.arange(width)]
+
+    def host_index(self, addresses, unmapped="hash"):
+        """
+        Map IPv4 addresses (uint32) to host rows.
+
+        Args:
+            addresses (numpy.ndarray): Addresses as integers.
+            unmapped (str): "hash" spreads addresses outside the host range
+                over the hosts; "drop" maps them to -1.
+
+        Returns:
+            numpy.ndarray: Host row per address.
+        """
+        offset = np.asarray(addresses, dtype=np.int64) - self.base_address
+        inside = (offset >= 0) & (offset < len(self.hosts))
+        if unmapped == "hash":
+            return np.where(inside, offset, np.asarray(addresses, dtype=np.int64) % len(self.hosts))
+        return np.where(inside, offset, -1)
+
+    def paths(self, src, dst):
+        """
+        Link incidence of host-to-host flows.
+
+        Args:
+            src (numpy.ndarray): Source host row per flow.
+            dst (numpy.ndarray): Destination host row per flow (different from src).
+
+        Returns:
+            tuple: (flow, link, weight) arrays for max_min_fair.
+        """
+        E = self.num_edges
+        n = len(src)
+        index = np.arange(n)
+        a1, a2 = self.host_access[src], self.host_access[dst]
+        parts = [
+            (index, E + self.host_edge[src], np.ones(n)),
+            (index, self.host_edge[dst], np.ones(n)),
+        ]
+
+        same_dept = self.access_department[a1] == self.access_department[a2]
+        local = (a1 != a2) & same_dept
+        remote = ~same_dept
+        up, down = self.access_edges[a1], self.access_edges[a2]  # (n, R)
+        R = up.shape[1]
+        C = self.dist_edges.shape[1]
+
+        if self.ecmp == "hash":
+            h = (src.astype(np.uint64) * np.uint64(_HASH_MULTIPLIER) + dst.astype(np.uint64)) >> np.uint64(7)
+            r1 = (h % np.uint64(R)).astype(np.int64)
+            c = ((h // np.uint64(R)) % np.uint64(C)).astype(np.int64)
+            r2 = ((h // np.uint64(R * C)) % np.uint64(R)).astype(np.int64)
+            # Within a department the same distribution switch carries both halves
+            r2 = np.where(local, r1, r2)
+            hop = local | remote
+            parts += [
+                (index[hop], E + up[hop, r1[hop]], np.ones(hop.sum())),
+                (index[hop], down[hop, r2[hop]], np.ones(hop.sum())),
+            ]
+            d1 = self.access_dist[a1[remote], r1[remote]]
+            d2 = self.access_dist[a2[remote], r2[remote]]
+            parts += [
+                (index[remote], E + self.dist_edges[d1, c[remote]], np.ones(remote.sum())),
+                (index[remote], self.dist_edges[d2, c[remote]], np.ones(remote.sum())),
+            ]
+        else:
+            hop = local | remote
+            parts += [
+                (np.repeat(index[hop], R), E + up[hop].ravel(), np.full(hop.sum() * R, 1 / R)),
+                (np.repeat(index[hop], R), down[hop].ravel(), np.full(hop.sum() * R, 1 / R)),
+            ]
+            d1 = self.access_dist[a1[remote]].ravel()  # (n_remote * R) distribution rows
+            d2 = self.access_dist[a2[remote]].ravel()
+            share = np.full(len(d1) * C, 1 / (R * C))
+            parts += [
+                (np.repeat(index[remote], R * C), E + self.dist_edges[d1].ravel(), share),
+                (np.repeat(index[remote], R * C), self.dist_edges[d2].ravel(), share),
+            ]
+
+        flow, link, weight = (np.concatenate(columns) for columns in zip(*parts))
+        return flow, link, weight
+
+    def allocate(self, src, dst, demand):
+        """
+        Max-min fair allocation of one tick of traffic.
+
+        Args:
+            src (numpy.ndarray): Source host row per flow.
+            dst (numpy.ndarray): Destination host row per flow.
+            demand (numpy.ndarray): Offered bits per second per flow.
+
+        Returns:
+            tuple: (rate per flow in bits/s, load per link in bits/s).
+        """
+        flow, link, weight = self.paths(src, dst)
+        rate = max_min_fair(flow, link, weight, self.capacity, demand / self.capacity_unit)
+        load = np.bincount(link, weights=weight * rate[flow], minlength=len(self.capacity))
+        return rate * self.capacity_unit, load * self.capacity_unit
+
+    def link_name(self, link):
+        """
+        (from, to) node names of a link, in the direction traffic flows.
+        """
+        edge = link % self.num_edges
+        u, v = self.topology.names([self.sources[edge], self.targets[edge]])
+        return (v, u) if link >= self.num_edges else (u, v)
+
+    def replay(self, ticks, tick=DEFAULT_TICK, unmapped="hash", top=10):
+        """
+        Allocate a sequence of traffic matrices and summarize link and flow behaviour.
+
+        Args:
+            ticks (iterable): (tick start, source addresses, destination
+                addresses, bytes) tuples, e.g. from observed_traffic().
+            tick (float): Seconds covered by each tick.
+            unmapped (str): Handling of addresses outside the host range (see host_index).
+            top (int): Bottleneck links and throttled flows to report.
+
+        Returns:
+            dict: ticks, flows, seconds, offered/delivered bytes and
+            delivered_fraction, bottleneck links (utilization and saturated
+            ticks) and the most throttled source/destination pairs.
+        """
+        started = time.perf_counter()
+        links = len(self.capacity)
+        load_sum = np.zeros(links)
+        load_peak = np.zeros(links)
+        saturated = np.zeros(links, dtype=np.int64)
+        pairs, offered, delivered = [], [], []
+        count = flows = 0
+
+        for _, src_ip, dst_ip, sent in ticks:
+            src = self.host_index(src_ip, unmapped)
+            dst = self.host_index(dst_ip, unmapped)
+            keep = (src >= 0) & (dst >= 0) & (src != dst)
+            src, dst, sent = src[keep], dst[keep], np.asarray(sent, dtype=np.float64)[keep]
+            count += 1
+            if not len(src):
+                continue
+            rate, load = self.allocate(src, dst, sent * 8 / tick)
+            flows += len(src)
+            load_sum += load
+            np.maximum(load_peak, load, out=load_peak)
+            saturated += load >= self.capacity * self.capacity_unit * (1 - 1e-6)
+            pairs.append(src * len(self.hosts) + dst)
+            offered.append(sent)
+            delivered.append(np.minimum(rate * tick / 8, sent))
+
+        capacity = self.capacity * self.capacity_unit
+        utilization = load_sum / max(count, 1) / capacity
+        worst = np.lexsort((utilization, saturated))[::-1][:top]
+        report = {
+            "ticks": count,
+            "flows": flows,
+            "seconds": round(time.perf_counter() - started, 4),
+            "links": [
+                {"link": self.link_name(link), "mean_utilization": float(utilization[link]),
+                 "peak_utilization": float(load_peak[link] / capacity[link]),
+                 "saturated_ticks": int(saturated[link])}
+                for link in worst.tolist() if load_peak[link] > 0
+            ],
+        }
+        if not pairs:
+            report.update(offered_bytes=0, delivered_bytes=0, delivered_fraction=1.0, throttled=[])
+            return report
+
+        keys, inverse = np.unique(np.concatenate(pairs), return_inverse=True)
+        offered = np.bincount(inverse, weights=np.concatenate(offered))
+        delivered = np.bincount(inverse, weights=np.concatenate(delivered))
+        shortfall = offered - delivered
+        hosts = len(self.hosts)
+        report.update(
+            offered_bytes=float(offered.sum()),
+            delivered_bytes=float(delivered.sum()),
+            delivered_fraction=float(delivered.sum() / offered.sum()) if offered.sum() else 1.0,
+            throttled=[
+                {"src": int_to_ip(self.base_address + int(keys[i] // hosts)),
+                 "dst": int_to_ip(self.base_address + int(keys[i] % hosts)),
+                 "offered_bytes": float(offered[i]), "delivered_bytes": float(delivered[i])}
+                for i in np.argsort(shortfall)[::-1][:top].tolist() if shortfall[i] > 0
+            ],
+        )
+        return report
+
+
+def observed_traffic(db_name="network_data.db", start=None, end=None, tick=DEFAULT_TICK):
+    """
+    Per-tick source/destination byte counts from traffic_records.
+
+    Args:
+        db_name (str): Path to the SQLite database.
+        start (float, optional): Range start in epoch seconds.
+        end (float, optional): Range end in epoch seconds.
+        tick (float): Tick length in seconds.
+
+    Yields:
+        tuple: (tick start, source addresses, destination addresses, bytes) arrays per tick.
+    """
+    conditions, params = [], [tick]
+    if start is not None:
+        conditions.append("time >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("time < ?")
+        params.append(end)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    conn = sqlite3.connect(db_name)
+    try:
+        rows = conn.execute(f"""
+            SELECT CAST(time / ? AS INTEGER) AS bucket, source, destination, SUM(length)
+            FROM traffic_records {where}
+            GROUP BY bucket, source, destination
+            ORDER BY bucket
+        """, params).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return
+    data = np.asarray(rows, dtype=np.float64)
+    buckets = data[:, 0].astype(np.int64)
+    bounds = np.flatnonzero(np.diff(buckets)) + 1
+    for chunk in np.split(data, bounds):
+        yield (chunk[0, 0] * tick, chunk[:, 1].astype(np.int64), chunk[:, 2].astype(np.int64), chunk[:, 3])
+
+
+def simulate_traffic(network, db_name="network_data.db", start=None, end=None, tick=DEFAULT_TICK, ecmp="split",
+                     unmapped="hash"):
+    """
+    Replay observed traffic from traffic_records onto a topology.
+
+    Args:
+        network (FinancialDataCenterNetwork or Topology): Built topology.
+        db_name (str): Path to the SQLite database.
+        start (float, optional): Range start in epoch seconds.
+        end (float, optional): Range end in epoch seconds.
+        tick (float): Seconds per allocation step.
+        ecmp (str): "split" or "hash" (see TrafficSimulator).
+        unmapped (str): Handling of addresses outside the host range (see TrafficSimulator.host_index).
+
+    Returns:
+        dict: TrafficSimulator.replay() report.
+    """
+    simulator = TrafficSimulator(network, ecmp)
+    return simulator.replay(observed_traffic(db_name, start, end, tick), tick, unmapped)